@@ -0,0 +1,258 @@
+"""
+1.0 Change Log Module
+Append-only, versioned monthly change-log segments.
+
+Key features:
+- A monthly change log is one or more CSV segments, each with a fixed header
+- A sidecar manifest records each segment's schema version, columns and rows
+- A schema change starts a new segment instead of rewriting the month
+- Appends are O(new rows); headers are probed at most once per path per process
+- Readers union segments lazily, reindexed to the requested columns
+
+Layout:
+    bankrate.com_changes_2026-10.csv            (segment 1, e.g. schema v1)
+    bankrate.com_changes_2026-10.v2.csv         (segment 2, schema v2)
+    bankrate.com_changes_2026-10.manifest.json  (sidecar manifest)
+
+Segments keep the "<domain>_changes_*.csv" naming, so code that globs
+monthly files still sees every segment.
+"""
+
+import json
+import logging
+import os
+import threading
+from glob import glob
+from typing import Dict, Iterator, List, Optional
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# 1.1 Known change-log schemas (version -> columns)
+CHANGE_LOG_SCHEMAS: Dict[int, List[str]] = {
+    1: [
+        'detected_at', 'domain', 'loc', 'change_type',
+        'lastmod', 'lastmod_prev', 'sitemap_source_url',
+        'section', 'subsection', 'path_depth',
+    ],
+    # v2: first_seen_at / last_seen_at for URL lifecycle tracking
+    2: [
+        'detected_at', 'domain', 'loc', 'change_type',
+        'first_seen_at', 'last_seen_at',
+        'lastmod', 'lastmod_prev', 'sitemap_source_url',
+        'section', 'subsection', 'path_depth',
+    ],
+    # v3: detected_at / lastmod as int64 epoch seconds (see w3c_datetime)
+    3: [
+        'detected_at', 'domain', 'loc', 'change_type',
+        'first_seen_at', 'last_seen_at',
+        'lastmod', 'lastmod_prev', 'sitemap_source_url',
+        'section', 'subsection', 'path_depth',
+        'detected_at_ts', 'lastmod_ts',
+    ],
+}
+CURRENT_SCHEMA_VERSION = max(CHANGE_LOG_SCHEMAS)
+MANIFEST_SUFFIX = ".manifest.json"
+
+# 1.2 Process-wide caches (per path), guarded by one lock
+_lock = threading.Lock()
+_header_cache: Dict[str, List[str]] = {}
+_manifest_cache: Dict[str, Dict] = {}
+
+
+def schema_version(columns: List[str]) -> int:
+    """
+    2.1 Map a header to its schema version (0 = unknown/custom).
+    """
+    for version, schema in CHANGE_LOG_SCHEMAS.items():
+        if list(columns) == schema:
+            return version
+    return 0
+
+
+def manifest_path(change_log_path: str) -> str:
+    """
+    2.2 Sidecar manifest path for a monthly change log (base segment path).
+    """
+    return os.path.splitext(change_log_path)[0] + MANIFEST_SUFFIX
+
+
+def read_header(path: str) -> List[str]:
+    """
+    2.3 Column header of a CSV segment, probed once per path per process.
+    """
+    with _lock:
+        cached = _header_cache.get(path)
+    if cached is not None:
+        return cached
+
+    columns = list(pd.read_csv(path, nrows=0).columns)
+    with _lock:
+        _header_cache[path] = columns
+    return columns
+
+
+def _segment_path(change_log_path: str, version: int, existing: List[str]) -> str:
+    """
+    2.4 File name for a new segment, e.g. <domain>_changes_2026-10.v2.csv.
+    """
+    stem = os.path.splitext(change_log_path)[0]
+    candidate = f"{stem}.v{version}.csv"
+    n = 2
+    while candidate in existing or os.path.exists(candidate):
+        candidate = f"{stem}.v{version}.{n}.csv"
+        n += 1
+    return candidate
+
+
+def _write_manifest(path: str, manifest: Dict) -> None:
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, path)
+
+
+def load_manifest(change_log_path: str) -> Dict:
+    """
+    2.5 Load (or bootstrap) the manifest for a monthly change log.
+
+    A month written before manifests existed is registered from its
+    on-disk base file: one header probe, no data read.
+    """
+    sidecar = manifest_path(change_log_path)
+    with _lock:
+        cached = _manifest_cache.get(sidecar)
+    if cached is not None:
+        return cached
+
+    manifest = None
+    if os.path.exists(sidecar):
+        try:
+            with open(sidecar, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+        except Exception as e:
+            logger.warning(f"Could not read change-log manifest {sidecar}: {e}")
+
+    if manifest is None:
+        manifest = {"base": os.path.basename(change_log_path), "segments": []}
+        if os.path.exists(change_log_path):
+            columns = read_header(change_log_path)
+            manifest["segments"].append({
+                "file": os.path.basename(change_log_path),
+                "schema_version": schema_version(columns),
+                "columns": columns,
+                "rows": None,  # Unknown for pre-manifest files
+            })
+
+    with _lock:
+        _manifest_cache[sidecar] = manifest
+    return manifest
+
+
+def append_changes(changes_df: pd.DataFrame, change_log_path: str, columns: List[str]) -> str:
+    """
+    3.1 Append change rows to a month, starting a new segment on schema change.
+
+    Args:
+        changes_df: Rows to append (reindexed to columns)
+        change_log_path: Monthly base path (<domain>_changes_YYYY-MM.csv)
+        columns: Target schema for the new rows
+
+    Returns:
+        Path of the segment the rows were written to
+    """
+    final_df = changes_df.reindex(columns=columns)
+    directory = os.path.dirname(change_log_path)
+    os.makedirs(directory, exist_ok=True)
+
+    manifest = load_manifest(change_log_path)
+    segments = manifest["segments"]
+    active = segments[-1] if segments else None
+    active_path = os.path.join(directory, active["file"]) if active else None
+
+    if active is not None and active["columns"] == list(columns) and os.path.exists(active_path):
+        # 3.1.1 Same schema - plain append to the active segment
+        segment_path = active_path
+        final_df.to_csv(segment_path, mode='a', header=False, index=False)
+        if active.get("rows") is not None:
+            active["rows"] += len(final_df)
+        logger.info(f"Appended {len(final_df):,} changes to {segment_path}")
+    else:
+        # 3.1.2 First write of the month, or new schema - new segment with header
+        version = schema_version(columns)
+        if active is None and not os.path.exists(change_log_path):
+            segment_path = change_log_path
+        else:
+            segment_path = _segment_path(change_log_path, version, [s["file"] for s in segments])
+            if active is not None and active["columns"] != list(columns):
+                logger.info(
+                    f"Change-log schema v{active['schema_version']} -> v{version}: "
+                    f"starting segment {os.path.basename(segment_path)}"
+                )
+        final_df.to_csv(segment_path, mode='w', header=True, index=False)
+        segments.append({
+            "file": os.path.basename(segment_path),
+            "schema_version": version,
+            "columns": list(columns),
+            "rows": len(final_df),
+        })
+        with _lock:
+            _header_cache[segment_path] = list(columns)
+        logger.info(f"Created change log with {len(final_df):,} changes at {segment_path}")
+
+    _write_manifest(manifest_path(change_log_path), manifest)
+    return segment_path
+
+
+def list_segments(change_log_path: str) -> List[str]:
+    """
+    3.2 Segment paths of one month, oldest first.
+    """
+    directory = os.path.dirname(change_log_path)
+    return [
+        os.path.join(directory, segment["file"])
+        for segment in load_manifest(change_log_path)["segments"]
+        if os.path.exists(os.path.join(directory, segment["file"]))
+    ]
+
+
+def change_log_months(domain_dir: str, domain: str) -> List[str]:
+    """
+    3.3 Monthly base paths for a domain, oldest first.
+    """
+    months = set()
+    for path in glob(os.path.join(domain_dir, f"{domain}_changes_*.csv")):
+        name = os.path.basename(path)[len(f"{domain}_changes_"):]
+        month = name.split(".", 1)[0]
+        months.add(os.path.join(domain_dir, f"{domain}_changes_{month}.csv"))
+    return sorted(months)
+
+
+def iter_change_log(
+    change_log_paths: List[str],
+    columns: Optional[List[str]] = None,
+    chunksize: Optional[int] = None,
+    **read_kwargs,
+) -> Iterator[pd.DataFrame]:
+    """
+    3.4 Lazily read months as one logical table.
+
+    Each segment is read on demand and reindexed to `columns` (default:
+    the current schema), so older segments surface new columns as empty.
+
+    Args:
+        change_log_paths: Monthly base paths (see change_log_months)
+        columns: Output columns
+        chunksize: Rows per frame (None = one frame per segment)
+        read_kwargs: Passed to pd.read_csv
+    """
+    columns = columns or CHANGE_LOG_SCHEMAS[CURRENT_SCHEMA_VERSION]
+    for change_log_path in change_log_paths:
+        for segment_path in list_segments(change_log_path):
+            usecols = [c for c in read_header(segment_path) if c in columns]
+            if chunksize:
+                for chunk in pd.read_csv(segment_path, usecols=usecols, chunksize=chunksize, **read_kwargs):
+                    yield chunk.reindex(columns=columns)
+            else:
+                yield pd.read_csv(segment_path, usecols=usecols, **read_kwargs).reindex(columns=columns)
@@ -3,24 +3,26 @@ import logging
 import os
 from typing import Dict, List, Optional, Any
 
+from src.sitemap_discovery import needs_discovery
+
 logger = logging.getLogger(__name__)
 
 CONFIG_FILE_PATH = "config.json"
 
-def load_config() -> Optional[Dict[str, Any]]:
-    """Loads the configuration from config.json."""
-    if not os.path.exists(CONFIG_FILE_PATH):
-        logger.error(f"Configuration file not found: {CONFIG_FILE_PATH}")
+def load_config(config_path: str = CONFIG_FILE_PATH) -> Optional[Dict[str, Any]]:
+    """Loads the configuration from config.json (or an explicit path)."""
+    if not os.path.exists(config_path):
+        logger.error(f"Configuration file not found: {config_path}")
         return None
     try:
-        with open(CONFIG_FILE_PATH, 'r') as f:
+        with open(config_path, 'r') as f:
             config_data = json.load(f)
-        logger.info(f"Successfully loaded configuration from {CONFIG_FILE_PATH}")
+        logger.info(f"Successfully loaded configuration from {config_path}")
         if not validate_config(config_data):
             return None
         return config_data
     except json.JSONDecodeError as e:
-        logger.error(f"Error decoding JSON from {CONFIG_FILE_PATH}: {e}")
+        logger.error(f"Error decoding JSON from {config_path}: {e}")
         return None
     except Exception as e:
         logger.error(f"An unexpected error occurred while loading config: {e}")
@@ -40,6 +42,7 @@ def validate_config(config: Dict[str, Any]) -> bool:
         logger.warning("'targets' list is empty. No sitemaps will be monitored.")
         # Allow empty targets list for now, might be a valid use case for setup.
 
+    # Domain-only targets are valid: their sitemaps are discovered at run time
     for i, target_entry in enumerate(config["targets"]):
         if not isinstance(target_entry, dict):
             logger.error(f"Target entry at index {i} is not a dictionary.")
@@ -53,11 +56,11 @@ def validate_config(config: Dict[str, Any]) -> bool:
             logger.error(f"Value for 'domain' in target entry at index {i} must be a non-empty string.")
             return False
         
-        # Check sitemap_url OR sitemap_urls is present
+        # Check sitemap_url OR sitemap_urls is present (or discovery is on)
         has_sitemap_url = "sitemap_url" in target_entry and isinstance(target_entry["sitemap_url"], str) and target_entry["sitemap_url"].strip()
         has_sitemap_urls = "sitemap_urls" in target_entry and isinstance(target_entry["sitemap_urls"], list) and len(target_entry["sitemap_urls"]) > 0
         
-        if not has_sitemap_url and not has_sitemap_urls:
+        if not has_sitemap_url and not has_sitemap_urls and not needs_discovery(target_entry):
             logger.error(f"Target entry at index {i} is missing 'sitemap_url' or 'sitemap_urls'.")
             return False
 
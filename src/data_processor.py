@@ -8,15 +8,38 @@ Key features:
 - All-time URL tracking with current_live vs old_live status
 - URL path/section categorization for content analysis
 - CSV-only output (removed Parquet/JSON for simplicity)
+- Optional out-of-core diff (hash-partitioned) for domains larger than RAM
+- Whole-file outputs are committed atomically (temp file + rename); with a
+  write-behind writer they are written on its thread (see writer)
 """
 
+import itertools
+import numpy as np
 import pandas as pd
 import os
 import logging
+import shutil
+import tempfile
 from glob import glob
-from typing import List, Dict, Optional, Any
+from typing import List, Dict, Optional, Any, Iterable, Iterator
 from datetime import datetime, timezone
 
+from src.change_log import CHANGE_LOG_SCHEMAS, CURRENT_SCHEMA_VERSION, append_changes
+from src.url_classifier import CLASSIFIED_COLUMNS, UrlClassifier
+from src.metrics import run_metrics, timed
+from src.writer import WriteBehind, append_csv, atomic_write_csv, commit_file
+from src.w3c_datetime import to_epoch_seconds
+from src.external_diff import (
+    DEFAULT_CHUNK_ROWS,
+    DEFAULT_MEMORY_BUDGET_MB,
+    IN_MEMORY_EXPANSION,
+    PartitionSpool,
+    choose_partition_count,
+    estimate_diff_bytes,
+    merge_sorted_runs,
+    write_sorted_run,
+)
+
 logger = logging.getLogger(__name__)
 
 # 1.1 Column name constants for consistency
@@ -30,6 +53,35 @@ COL_SECTION = "section"
 COL_SUBSECTION = "subsection"
 COL_PATH_DEPTH = "path_depth"
 
+# 1.2 Canonical file schemas
+SNAPSHOT_COLUMNS = [
+    'loc', 'domain', 'lastmod', 'detected_at', 'change_type',
+    'sitemap_source_url', 'section', 'subsection', 'path_depth'
+]
+
+# Includes first_seen_at and last_seen_at for URL lifecycle tracking
+CHANGE_LOG_COLUMNS = CHANGE_LOG_SCHEMAS[CURRENT_SCHEMA_VERSION]
+
+# Columns of a current-run URL batch going into the diff
+CURRENT_COLUMNS = [
+    'loc', 'lastmod', 'sitemap_source_url', 'section', 'subsection', 'path_depth', 'domain'
+]
+
+ALL_TIME_COLUMNS = [
+    "loc", "domain", "first_seen_at", "last_seen_at",
+    "is_current_live", "live_status", "last_lastmod",
+    "last_sitemap_source_url", "section", "subsection", "path_depth"
+]
+
+# One row per sitemap file fetch (<domain>_sitemap_history.csv)
+SITEMAP_HISTORY_COLUMNS = [
+    "fetched_at", "sitemap_url", "sitemap_type", "url_count",
+    "content_hash", "content_length", "changed", "changefreq"
+]
+
+# Headroom when spilling mid-stream: the rest of the domain is still unread
+SPILL_GROWTH_FACTOR = 4
+
 
 class DataProcessor:
     """
@@ -37,16 +89,48 @@ class DataProcessor:
     Processes sitemap URLs, detects changes, and maintains historical records.
     """
 
-    def __init__(self, data_dir: str = "output"):
+    def __init__(
+        self,
+        data_dir: str = "output",
+        diff_config: Optional[Dict[str, Any]] = None,
+        section_rules: Optional[Dict[str, List[Dict[str, Any]]]] = None,
+        writer: Optional[WriteBehind] = None,
+    ):
         """
         2.1 Initialize the data processor.
         
         Args:
             data_dir: Root directory for data storage (default: "output")
+            diff_config: Optional change-detection settings:
+                - mode: "auto" (default), "memory" or "external"
+                - memory_budget_mb: Max memory for one diff partition (default: 1024)
+                - partitions: Force a partition count (default: derived from budget)
+                - chunk_rows: Rows per streamed chunk (default: 100000)
+                - spool_dir: Temp directory for partition files (default: system temp)
+            section_rules: Optional per-domain path-prefix rules for URL
+                section/subsection classification (see url_classifier)
+            writer: Optional write-behind writer; output files are then
+                written on its thread while the caller moves on
         """
         self.data_dir = data_dir
         os.makedirs(self.data_dir, exist_ok=True)
-        logger.info(f"DataProcessor initialized with data directory: {data_dir}")
+
+        diff_config = diff_config or {}
+        self.diff_mode = diff_config.get("mode", "auto")
+        if self.diff_mode not in ("auto", "memory", "external"):
+            logger.warning(f"Unknown diff mode '{self.diff_mode}', using 'auto'")
+            self.diff_mode = "auto"
+        self.memory_budget_mb = float(diff_config.get("memory_budget_mb", DEFAULT_MEMORY_BUDGET_MB))
+        self.diff_partitions = diff_config.get("partitions")
+        self.chunk_rows = int(diff_config.get("chunk_rows", DEFAULT_CHUNK_ROWS))
+        self.spool_dir = diff_config.get("spool_dir")
+        self.url_classifier = UrlClassifier(section_rules)
+        self.writer = writer
+
+        logger.info(
+            f"DataProcessor initialized with data directory: {data_dir} "
+            f"(diff mode={self.diff_mode}, budget={self.memory_budget_mb:.0f} MB)"
+        )
 
     # =========================================================================
     # 3.0 FILE PATH HELPERS
@@ -62,7 +146,12 @@ class DataProcessor:
                     bankrate.com_urls.csv           (current snapshot)
                     bankrate.com_urls_all_time.csv  (all URLs ever seen)
                     bankrate.com_sitemaps.csv       (sitemap file metadata)
+                    bankrate.com_sitemap_history.csv (one row per sitemap fetch)
+                    bankrate.com_schedule.json      (daemon poll state, see scheduler)
+                    bankrate.com_runs.json          (run durations, see planner)
                     bankrate.com_changes_YYYY-MM.csv (monthly changes)
+                    bankrate.com_changes_YYYY-MM.v2.csv + .manifest.json
+                        (schema-versioned segments, see change_log)
         
         Args:
             domain: The domain name (e.g., "bankrate.com")
@@ -77,9 +166,55 @@ class DataProcessor:
             "snapshot_csv": os.path.join(domain_dir, f"{domain}_urls.csv"),
             "all_time_csv": os.path.join(domain_dir, f"{domain}_urls_all_time.csv"),
             "sitemaps_csv": os.path.join(domain_dir, f"{domain}_sitemaps.csv"),
+            "sitemap_history_csv": os.path.join(domain_dir, f"{domain}_sitemap_history.csv"),
+            "schedule_json": os.path.join(domain_dir, f"{domain}_schedule.json"),
             "domain_dir": domain_dir,
         }
 
+    def _write(self, domain: Optional[str], fn, *args) -> None:
+        """
+        3.1.2 Run a write now, or queue it on the write-behind writer.
+
+        Timed as `write` where the write runs (here, or on the writer
+        thread); time blocked on a full queue is `write_wait`.
+        """
+        if self.writer is None or domain is None:
+            with run_metrics.stage("write", domain):
+                fn(*args)
+        else:
+            with run_metrics.stage("write_wait", domain):
+                self.writer.submit(domain, fn, *args)
+
+    def _settle(self, domain: str) -> None:
+        """
+        3.1.3 Wait for the domain's queued writes before reading its files.
+        """
+        if self.writer is not None:
+            with run_metrics.stage("write_wait", domain):
+                self.writer.wait(domain)
+
+    def save_schedule(self, domain: str, schedule: Any) -> None:
+        """
+        3.1.4 Save the domain's poll state once its output files are written.
+
+        Queued behind the domain's writes. If one of them failed the state
+        is not saved, so the next crawl refetches what was never written.
+        """
+        self._write(domain, self._commit_schedule, domain, schedule)
+
+    def _commit_schedule(self, domain: str, schedule: Any) -> None:
+        if self.writer is not None and self.writer.errors.get(domain):
+            logger.warning(f"Schedule for {domain} not saved: its output files failed to write")
+            schedule.load()
+            return
+        schedule.save()
+
+    def schedule_path(self, domain: str) -> str:
+        """
+        3.1.1 Path of the domain's daemon poll state (see scheduler).
+        """
+        return self._get_file_paths(domain)["schedule_json"]
+
     def _get_monthly_change_log_path(self, domain: str, run_ts: datetime) -> str:
         """
         3.2 Get the path for the monthly change log file.
@@ -93,6 +228,7 @@ class DataProcessor:
         """
         3.3 Check if any historical change log exists for this domain.
         """
+        self._settle(domain)
         domain_dir = os.path.join(self.data_dir, domain)
         
         # Check legacy formats
@@ -181,65 +317,34 @@ class DataProcessor:
     # 4.0 DATA SAVING METHODS
     # =========================================================================
 
-    def _save_change_log(self, changes_df: pd.DataFrame, change_log_path: str) -> None:
+    def _save_change_log(
+        self, changes_df: pd.DataFrame, change_log_path: str, domain: Optional[str] = None
+    ) -> None:
         """
         4.1 Append detected changes to a monthly CSV log file.
         
-        Uses vectorized column operations instead of loops for better performance.
-        Handles schema migrations when new columns are added.
+        Always O(new rows): a schema change starts a new versioned segment
+        (see change_log) instead of rewriting the month, and the header
+        check is cached per path. detected_at / lastmod are also stored as
+        int64 epoch seconds so readers never parse the strings again.
         """
         if changes_df.empty:
             return
 
         try:
-            # Define expected columns (canonical schema)
-            # Includes first_seen_at and last_seen_at for URL lifecycle tracking
-            change_log_columns = [
-                'detected_at', 'domain', 'loc', 'change_type',
-                'first_seen_at', 'last_seen_at',
-                'lastmod', 'lastmod_prev', 'sitemap_source_url',
-                'section', 'subsection', 'path_depth'
-            ]
-
-            # Reindex to ensure all columns exist in correct order
-            final_df = changes_df.reindex(columns=change_log_columns)
-
-            os.makedirs(os.path.dirname(change_log_path), exist_ok=True)
-
-            if os.path.exists(change_log_path):
-                # Check if existing file has matching schema
-                try:
-                    existing_df = pd.read_csv(change_log_path, nrows=0)
-                    existing_cols = list(existing_df.columns)
-                    
-                    if existing_cols != change_log_columns:
-                        # Schema mismatch - migrate existing data to new schema
-                        logger.info(f"Migrating {change_log_path} to new schema (adding first_seen_at, last_seen_at)")
-                        existing_df = pd.read_csv(change_log_path, low_memory=False)
-                        existing_df = existing_df.reindex(columns=change_log_columns)
-                        combined_df = pd.concat([existing_df, final_df], ignore_index=True)
-                        combined_df.to_csv(change_log_path, mode='w', header=True, index=False)
-                        logger.info(f"Migrated and appended {len(final_df):,} changes to {change_log_path}")
-                    else:
-                        # Schema matches - simple append
-                        final_df.to_csv(change_log_path, mode='a', header=False, index=False)
-                        logger.info(f"Appended {len(final_df):,} changes to {change_log_path}")
-                except Exception as read_err:
-                    logger.warning(f"Could not read existing file for schema check: {read_err}")
-                    final_df.to_csv(change_log_path, mode='a', header=False, index=False)
-            else:
-                final_df.to_csv(change_log_path, mode='w', header=True, index=False)
-                logger.info(f"Created change log with {len(final_df):,} changes at {change_log_path}")
-                
+            changes_df = changes_df.assign(
+                detected_at_ts=to_epoch_seconds(changes_df['detected_at']),
+                lastmod_ts=to_epoch_seconds(changes_df['lastmod']) if 'lastmod' in changes_df.columns else pd.NA,
+            )
+            self._write(domain, append_changes, changes_df, change_log_path, CHANGE_LOG_COLUMNS)
         except Exception as e:
             logger.error(f"Error saving change log: {e}")
 
-    def _save_snapshot(self, df: pd.DataFrame, csv_path: str) -> None:
+    def _save_snapshot(self, df: pd.DataFrame, csv_path: str, domain: Optional[str] = None) -> None:
         """
-        4.2 Save snapshot as CSV only.
+        4.2 Save snapshot as CSV only (atomically: a crash never leaves half a snapshot).
         """
-        os.makedirs(os.path.dirname(csv_path), exist_ok=True)
-        df.to_csv(csv_path, index=False)
+        self._write(domain, atomic_write_csv, df, csv_path)
         logger.debug(f"Saved snapshot to {csv_path}")
 
     def save_sitemap_metadata(self, domain: str, sitemap_records: List[Dict[str, Any]]) -> None:
@@ -249,7 +354,12 @@ class DataProcessor:
         Tracks each sitemap file with:
         - sitemap_url, domain, sitemap_type
         - url_count, content_hash, content_length
-        - fetched_at
+        - fetched_at, changefreq (declared by most of a urlset's URLs)
+        - protocol_warnings (e.g. "urls>50000;bytes>52428800": over the
+          sitemap protocol's per-file limits)
+        
+        Files fetched this run are also appended to <domain>_sitemap_history.csv
+        (carried-forward files are not: they were not requested).
         """
         if not sitemap_records:
             return
@@ -262,20 +372,28 @@ class DataProcessor:
         # Reorder columns for readability
         column_order = [
             'sitemap_url', 'domain', 'sitemap_type', 'url_count',
-            'content_hash', 'content_length', 'fetched_at'
+            'content_hash', 'content_length', 'fetched_at', 'changefreq', 'protocol_warnings'
         ]
-        for col in column_order:
+        for col in column_order + ['fetched', 'changed']:
             if col not in df.columns:
                 df[col] = None
-        df = df[[c for c in column_order if c in df.columns]]
         
-        df.to_csv(sitemaps_path, index=False)
+        self._write(domain, atomic_write_csv, df[column_order], sitemaps_path)
         logger.info(f"Saved {len(df)} sitemap records to {sitemaps_path}")
+        
+        # 4.3.1 Append this run's fetches to the per-file change history
+        history_path = file_paths["sitemap_history_csv"]
+        fetched = df[df['fetched'] == True]
+        if not fetched.empty:
+            history = fetched[SITEMAP_HISTORY_COLUMNS]
+            self._write(domain, append_csv, history, history_path)
+            logger.info(f"Appended {len(history)} sitemap fetches to {history_path}")
 
     # =========================================================================
     # 5.0 ALL-TIME URL TRACKING
     # =========================================================================
 
+    @timed("all_time")
     def _update_all_time_live(self, domain: str, current_snapshot_df: pd.DataFrame) -> pd.DataFrame:
         """
         5.1 Maintain an 'all time' list of URLs for a domain.
@@ -284,6 +402,41 @@ class DataProcessor:
         all_time_path = file_paths["all_time_csv"]
         now = datetime.now(timezone.utc)
 
+        if os.path.exists(all_time_path):
+            try:
+                all_time = pd.read_csv(all_time_path)
+            except Exception as e:
+                logger.warning(f"Could not load all-time file: {e}")
+                all_time = pd.DataFrame(columns=ALL_TIME_COLUMNS)
+        else:
+            all_time = pd.DataFrame(columns=ALL_TIME_COLUMNS)
+
+        all_time = self._merge_all_time(domain, all_time, current_snapshot_df, now)
+
+        try:
+            self._write(domain, atomic_write_csv, all_time, all_time_path)
+            
+            # Summary stats
+            current_count = len(all_time[all_time["is_current_live"] == True])
+            old_count = len(all_time[all_time["is_current_live"] == False])
+            logger.info(f"All-time for {domain}: {len(all_time)} total ({current_count} live, {old_count} old)")
+        except Exception as e:
+            logger.error(f"Error saving all-time file: {e}")
+
+        return all_time
+
+    def _merge_all_time(
+        self,
+        domain: str,
+        all_time: pd.DataFrame,
+        current_snapshot_df: pd.DataFrame,
+        now: datetime,
+    ) -> pd.DataFrame:
+        """
+        5.2 Fold the current snapshot into an all-time frame (no I/O).
+        
+        Works on a whole all-time file or on one hash bucket of it.
+        """
         # Normalize current snapshot
         cur = current_snapshot_df.copy() if not current_snapshot_df.empty else pd.DataFrame()
         
@@ -299,26 +452,14 @@ class DataProcessor:
         cur = cur[available_cols].dropna(subset=["loc"])
         cur = cur.drop_duplicates(subset=["loc"], keep="first")
 
-        # Load existing all-time file
-        all_time_columns = [
-            "loc", "domain", "first_seen_at", "last_seen_at",
-            "is_current_live", "live_status", "last_lastmod", 
-            "last_sitemap_source_url", "section", "subsection", "path_depth"
-        ]
-        
-        if os.path.exists(all_time_path):
-            try:
-                all_time = pd.read_csv(all_time_path)
-            except Exception as e:
-                logger.warning(f"Could not load all-time file: {e}")
-                all_time = pd.DataFrame(columns=all_time_columns)
-        else:
-            all_time = pd.DataFrame(columns=all_time_columns)
-
         # Ensure columns exist
-        for col in all_time_columns:
+        all_time = all_time.copy()
+        for col in ALL_TIME_COLUMNS:
             if col not in all_time.columns:
                 all_time[col] = None
+        # Path segments like "2024" read back from CSV as numbers
+        for col in ("section", "subsection"):
+            all_time[col] = all_time[col].astype(object)
 
         # Index by loc
         if not all_time.empty:
@@ -369,7 +510,11 @@ class DataProcessor:
                     new_rows_data["path_depth"] = cur.loc[new_locs, "path_depth"]
                 
                 new_rows = pd.DataFrame(new_rows_data, index=new_locs)
-                all_time = pd.concat([all_time, new_rows], axis=0)
+                if all_time.empty:
+                    # No concat with an empty frame (deprecated dtype inference)
+                    all_time = new_rows.reindex(columns=all_time.columns.union(new_rows.columns, sort=False))
+                else:
+                    all_time = pd.concat([all_time, new_rows], axis=0)
 
         # Derive live_status
         if not all_time.empty:
@@ -377,19 +522,9 @@ class DataProcessor:
                 lambda v: "current_live" if bool(v) else "old_live"
             )
 
-        # Save - reset index first to avoid ambiguity (loc is both index and column)
+        # Reset index first to avoid ambiguity (loc is both index and column)
         all_time = all_time.reset_index(drop=True)
         all_time = all_time.sort_values(["domain", "loc"]).reset_index(drop=True)
-        
-        try:
-            all_time.to_csv(all_time_path, index=False)
-            
-            # Summary stats
-            current_count = len(all_time[all_time["is_current_live"] == True])
-            old_count = len(all_time[all_time["is_current_live"] == False])
-            logger.info(f"All-time for {domain}: {len(all_time)} total ({current_count} live, {old_count} old)")
-        except Exception as e:
-            logger.error(f"Error saving all-time file: {e}")
 
         return all_time
 
@@ -399,222 +534,592 @@ class DataProcessor:
 
     def process_sitemap_urls(self, domain: str, sitemap_urls: List[Dict[str, Any]]) -> pd.DataFrame:
         """
-        6.1 Process sitemap URLs for a domain, tracking changes.
+        6.1 Process sitemap URLs (list of parser dicts) for a domain, tracking changes.
+        
+        Convenience wrapper around process_url_batches for callers that
+        already hold every URL in a list.
         """
         logger.info(f"Processing {len(sitemap_urls)} URLs for domain: {domain}")
+        return self.process_url_batches(domain, [self._build_current_frame(domain, sitemap_urls)])
+
+    @timed("diff")
+    def process_url_batches(self, domain: str, batches: Iterable[pd.DataFrame]) -> pd.DataFrame:
+        """
+        6.2 Process a stream of URL batches for a domain, tracking changes.
+        
+        Batches are DataFrames with at least a 'loc' column (as yielded by
+        SitemapParser.iter_sitemap). They are consumed once: buffered for the
+        in-memory diff while they fit the memory budget, otherwise spilled
+        straight into the hash-partitioned external diff.
         
+        Returns:
+            The new snapshot DataFrame (in-memory mode), or an empty frame
+            with snapshot columns (external mode - results are on disk)
+        """
+        self._settle(domain)
         file_paths = self._get_file_paths(domain)
-        current_dt = datetime.now(timezone.utc)
+        n_partitions = self._plan_partitions(file_paths, 0)
+        batch_iter = iter(batches)
 
-        # Snapshot columns (including section analysis)
-        snapshot_columns = [
-            'loc', 'domain', 'lastmod', 'detected_at', 'change_type', 
-            'sitemap_source_url', 'section', 'subsection', 'path_depth'
-        ]
+        if n_partitions > 1:
+            return self._process_url_batches_external(domain, batch_iter, n_partitions)
 
-        change_log_path = self._get_monthly_change_log_path(domain, current_dt)
-        snapshot_path = file_paths['snapshot_csv']
+        # 6.2.1 Buffer batches; spill to external diff if they outgrow the budget
+        buffered: List[pd.DataFrame] = []
+        buffered_bytes = 0
+        budget_bytes = self.memory_budget_mb * 1024 * 1024
+        for batch in batch_iter:
+            batch = self._normalize_batch(domain, batch)
+            if batch.empty:
+                continue
+            buffered.append(batch)
 
-        # Load existing snapshot
-        existing_df = self._load_snapshot(snapshot_path)
-        if not existing_df.empty:
-            for col in ['loc', 'lastmod', 'sitemap_source_url', 'change_type', 'section']:
-                if col not in existing_df.columns:
-                    existing_df[col] = None
-            logger.info(f"Loaded existing snapshot: {len(existing_df)} URLs")
-        
-        # Load all-time data to get first_seen_at for existing URLs
-        all_time_path = file_paths['all_time_csv']
-        all_time_lookup = {}
+            if self.diff_mode != "auto":
+                continue
+            buffered_bytes += int(batch.memory_usage(deep=True).sum())
+            if buffered_bytes * IN_MEMORY_EXPANSION > budget_bytes:
+                estimated = estimate_diff_bytes(
+                    [file_paths["snapshot_csv"], file_paths["all_time_csv"]]
+                ) + buffered_bytes * IN_MEMORY_EXPANSION * SPILL_GROWTH_FACTOR
+                n_partitions = max(2, choose_partition_count(estimated, self.memory_budget_mb))
+                logger.info(
+                    f"{domain}: buffered URLs exceed memory budget, "
+                    f"spilling to external diff ({n_partitions} partitions)"
+                )
+                return self._process_url_batches_external(
+                    domain, itertools.chain(buffered, batch_iter), n_partitions
+                )
+
+        if buffered:
+            current_df = pd.concat(buffered, ignore_index=True) if len(buffered) > 1 else buffered[0]
+        else:
+            current_df = pd.DataFrame(columns=CURRENT_COLUMNS)
+        del buffered
+
+        logger.info(f"Processing {len(current_df)} URLs for domain: {domain}")
+        return self._process_urls_in_memory(domain, current_df)
+
+    def _plan_partitions(self, file_paths: Dict[str, str], url_count: int) -> int:
+        """
+        6.3 Decide between in-memory diff (1) and N-bucket external diff.
+        """
+        mode = self.diff_mode
+        if mode == "memory":
+            return 1
+
+        if self.diff_partitions:
+            n_partitions = int(self.diff_partitions)
+        else:
+            estimated = estimate_diff_bytes(
+                [file_paths["snapshot_csv"], file_paths["all_time_csv"]], url_count
+            )
+            n_partitions = choose_partition_count(estimated, self.memory_budget_mb)
+            logger.debug(
+                f"Estimated diff footprint {estimated / 1024 / 1024:.1f} MB "
+                f"vs budget {self.memory_budget_mb} MB -> {n_partitions} partition(s)"
+            )
+
+        if mode == "external":
+            return max(2, n_partitions)
+        return n_partitions
+
+    def _load_first_seen_lookup(self, all_time_path: str) -> pd.Series:
+        """
+        6.4 Load loc -> first_seen_at from the all-time file.
+        """
         if os.path.exists(all_time_path):
             try:
-                all_time_df = pd.read_csv(all_time_path)
+                all_time_df = pd.read_csv(all_time_path, usecols=lambda c: c in ('loc', 'first_seen_at'))
                 if 'loc' in all_time_df.columns and 'first_seen_at' in all_time_df.columns:
-                    all_time_lookup = dict(zip(all_time_df['loc'], all_time_df['first_seen_at']))
-                    logger.debug(f"Loaded {len(all_time_lookup)} URLs from all-time for first_seen lookup")
+                    logger.debug(f"Loaded {len(all_time_df)} URLs from all-time for first_seen lookup")
+                    return self._first_seen_series(all_time_df)
             except Exception as e:
                 logger.warning(f"Could not load all-time for lookup: {e}")
+        return pd.Series(dtype=object)
 
-        # One-time backfill check
-        if not self._has_existing_change_log(domain) and not existing_df.empty:
-            logger.info(f"Backfilling change log with {len(existing_df):,} existing URLs")
-            
-            # 🆕 VECTORIZED: Build backfill DataFrame without iterrows()
-            # Filter out null locs first
-            backfill_df = existing_df.dropna(subset=['loc']).copy()
+    def _first_seen_series(self, all_time_df: pd.DataFrame) -> pd.Series:
+        """
+        6.5 Build a loc-indexed first_seen_at Series (last duplicate wins).
+        """
+        if all_time_df.empty or 'first_seen_at' not in all_time_df.columns:
+            return pd.Series(dtype=object)
+        lookup = all_time_df.drop_duplicates(subset=['loc'], keep='last')
+        return pd.Series(lookup['first_seen_at'].to_numpy(), index=lookup['loc'].to_numpy())
+
+    def _build_backfill(self, domain: str, existing_df: pd.DataFrame, current_dt: datetime) -> pd.DataFrame:
+        """
+        6.6 Turn pre-existing snapshot rows into 'discovered' change rows.
+        """
+        # 🆕 VECTORIZED: Build backfill DataFrame without iterrows()
+        # Filter out null locs first
+        backfill_df = existing_df.dropna(subset=['loc']).copy()
+        
+        if not backfill_df.empty:
+            # Add/set columns in bulk (vectorized)
+            backfill_df['detected_at'] = current_dt
+            backfill_df['domain'] = domain
+            backfill_df['change_type'] = 'discovered'
+            backfill_df['lastmod_prev'] = None
             
-            if not backfill_df.empty:
-                # Add/set columns in bulk (vectorized)
-                backfill_df['detected_at'] = current_dt
-                backfill_df['domain'] = domain
-                backfill_df['change_type'] = 'discovered'
-                backfill_df['lastmod_prev'] = None
-                
-                # Ensure all expected columns exist
-                for col in ['sitemap_source_url', 'section', 'subsection', 'path_depth']:
-                    if col not in backfill_df.columns:
-                        backfill_df[col] = None
-                
-                self._save_change_log(backfill_df, change_log_path)
-
-        # Process current sitemap URLs
-        processed_urls = []
-        for item in sitemap_urls or []:
-            if item and isinstance(item, dict) and item.get('loc'):
-                processed_urls.append({
-                    'loc': item.get('loc'),
-                    'lastmod': item.get('lastmod'),
-                    'sitemap_source_url': item.get('sitemap_source_url'),
-                    'section': item.get('section'),
-                    'subsection': item.get('subsection'),
-                    'path_depth': item.get('path_depth'),
-                })
-
-        current_df = pd.DataFrame(processed_urls)
-        if current_df.empty:
-            current_df = pd.DataFrame(columns=['loc', 'lastmod', 'sitemap_source_url', 'section'])
-        current_df['domain'] = domain
-
-        # Deduplicate
+            # Ensure all expected columns exist
+            for col in ['sitemap_source_url', 'section', 'subsection', 'path_depth']:
+                if col not in backfill_df.columns:
+                    backfill_df[col] = None
+
+        return backfill_df
+
+    def _build_current_frame(self, domain: str, sitemap_urls: List[Dict[str, Any]]) -> pd.DataFrame:
+        """
+        6.7 Build a current-URL batch from parser dicts (not deduplicated).
+        """
+        rows = [
+            item for item in sitemap_urls or []
+            if item and isinstance(item, dict) and item.get('loc')
+        ]
+        return self._normalize_batch(domain, pd.DataFrame(rows))
+
+    def _normalize_batch(self, domain: str, batch: pd.DataFrame) -> pd.DataFrame:
+        """
+        6.8 Project a URL batch onto the current-URL columns.
+        
+        Drops rows without a loc, adds missing columns as None, stamps
+        the domain and fills section/subsection/path_depth for rows that
+        do not have one. Column data is reused, not copied row by row.
+        """
+        if batch is None or batch.empty or 'loc' not in batch.columns:
+            return pd.DataFrame(columns=CURRENT_COLUMNS)
+
+        batch = batch[batch['loc'].notna() & (batch['loc'] != '')]
+        batch = batch.reindex(columns=CURRENT_COLUMNS)
+        batch['domain'] = domain
+
+        unclassified = batch[COL_SECTION].isna()
+        if unclassified.all():
+            batch[CLASSIFIED_COLUMNS] = self.url_classifier.classify(domain, batch['loc'])
+        elif unclassified.any():
+            classified = self.url_classifier.classify(domain, batch.loc[unclassified, 'loc'])
+            batch.loc[unclassified, CLASSIFIED_COLUMNS] = classified.to_numpy()
+        return batch
+
+    def _dedupe_current(self, current_df: pd.DataFrame) -> pd.DataFrame:
+        """
+        6.9 Keep one row per loc, preferring the newest lastmod.
+        """
         if not current_df.empty and 'loc' in current_df.columns:
             before = len(current_df)
             if 'lastmod' in current_df.columns:
-                # Use utc=True to handle mixed timezone formats consistently
-                current_df['lastmod_dt'] = pd.to_datetime(current_df['lastmod'], errors='coerce', utc=True)
-                current_df = current_df.sort_values(['loc', 'lastmod_dt'], ascending=[True, False])
-                current_df = current_df.drop(columns=['lastmod_dt'])
+                # Mixed formats and offsets compare correctly as epoch seconds
+                lastmod_ts = to_epoch_seconds(current_df['lastmod'])
+                current_df = current_df.assign(lastmod_ts=lastmod_ts)
+                current_df = current_df.sort_values(['loc', 'lastmod_ts'], ascending=[True, False])
+                current_df = current_df.drop(columns=['lastmod_ts'])
             current_df = current_df.drop_duplicates(subset=['loc'], keep='first')
             if before > len(current_df):
                 logger.info(f"Deduplicated: {before} -> {len(current_df)}")
+        return current_df
 
-        # Change detection
-        changes = []
-        output_rows = []
+    def can_carry_forward(self, domain: str) -> bool:
+        """
+        6.10 True if the snapshot records each URL's source sitemap, so URLs of
+        sitemap files that were not re-fetched can be taken from it.
+        """
+        self._settle(domain)
+        snapshot_path = self._get_file_paths(domain)["snapshot_csv"]
+        if not os.path.exists(snapshot_path):
+            return False
+        try:
+            header = pd.read_csv(snapshot_path, nrows=0).columns
+        except Exception:
+            return False
+        return COL_SITEMAP_SOURCE in header
 
+    def iter_snapshot_batches(self, domain: str, sitemap_urls: set) -> Iterator[pd.DataFrame]:
+        """
+        6.11 Stream the snapshot rows of the given source sitemaps as URL batches.
+        
+        Used for sitemap files that were not re-fetched (not due, or unchanged
+        content): their URLs go into the diff exactly as last seen.
+        """
+        if not sitemap_urls:
+            return
+        self._settle(domain)
+        snapshot_path = self._get_file_paths(domain)["snapshot_csv"]
+        columns = [c for c in CURRENT_COLUMNS if c != COL_DOMAIN]
+        carried = 0
+        for chunk in pd.read_csv(
+            snapshot_path, usecols=lambda c: c in columns, chunksize=self.chunk_rows, dtype=str
+        ):
+            chunk = chunk[chunk[COL_SITEMAP_SOURCE].isin(sitemap_urls)]
+            if chunk.empty:
+                continue
+            if COL_PATH_DEPTH in chunk.columns:
+                chunk[COL_PATH_DEPTH] = pd.to_numeric(chunk[COL_PATH_DEPTH], errors="coerce").astype("Int64")
+            carried += len(chunk)
+            yield chunk
+        logger.info(f"{domain}: carried forward {carried:,} URLs from {len(sitemap_urls)} unchanged sitemaps")
+
+    def _diff_frames(
+        self,
+        domain: str,
+        current_df: pd.DataFrame,
+        existing_df: pd.DataFrame,
+        first_seen: pd.Series,
+        current_dt: datetime,
+    ):
+        """
+        6.12 Compare current URLs with the previous snapshot (no I/O).
+        
+        Fully vectorized: one outer merge, then boolean masks select the
+        discovered / modified / removed / present rows. Works on whole frames
+        or on one hash bucket of each.
+        
+        Args:
+            first_seen: loc-indexed Series of first_seen_at from the all-time file
+        
+        Returns:
+            Tuple of (changes_df, output_df)
+        """
         if existing_df.empty:
             # First run - all new
-            # 🆕 VECTORIZED: Build DataFrames without iterrows()
             logger.info(f"First run: {len(current_df):,} new URLs")
             
             # Filter out null locs
-            valid_df = current_df.dropna(subset=['loc']).copy()
+            valid_df = current_df.dropna(subset=['loc'])
             
-            if not valid_df.empty:
-                # Build changes DataFrame (vectorized)
-                changes_df = valid_df.copy()
-                changes_df['detected_at'] = current_dt
-                changes_df['domain'] = domain
-                changes_df['change_type'] = 'discovered'
-                changes_df['lastmod_prev'] = None
-                
-                # Build output DataFrame (vectorized)  
-                output_df_new = valid_df.copy()
-                output_df_new['detected_at'] = current_dt
-                output_df_new['domain'] = domain
-                output_df_new['change_type'] = 'discovered'
-                
-                # Convert to list of dicts for compatibility with existing code
-                changes = changes_df.to_dict('records')
-                output_rows = output_df_new.to_dict('records')
-        else:
-            # Merge and compare
-            rename_map = {
-                'lastmod': 'lastmod_prev',
-                'sitemap_source_url': 'sitemap_source_url_prev',
-                'change_type': 'change_type_prev',
-            }
-            
-            merge_cols = ['loc']
-            for col in ['lastmod', 'sitemap_source_url', 'change_type']:
-                if col in existing_df.columns:
-                    merge_cols.append(col)
-            
-            merged = current_df.merge(
-                existing_df[list(set(merge_cols))].rename(columns=rename_map),
-                on='loc',
-                how='outer',
-                indicator=True
+            changes_df = valid_df.assign(
+                detected_at=current_dt, domain=domain,
+                change_type='discovered', lastmod_prev=None,
             )
+            output_df = valid_df.assign(
+                detected_at=current_dt, domain=domain, change_type='discovered',
+            ).reindex(columns=SNAPSHOT_COLUMNS).reset_index(drop=True)
+            return changes_df, output_df
+
+        # Merge and compare
+        rename_map = {
+            'lastmod': 'lastmod_prev',
+            'sitemap_source_url': 'sitemap_source_url_prev',
+            'change_type': 'change_type_prev',
+        }
+        
+        merge_cols = ['loc']
+        for col in ['lastmod', 'sitemap_source_url', 'change_type']:
+            if col in existing_df.columns:
+                merge_cols.append(col)
+        
+        merged = current_df.merge(
+            existing_df[merge_cols].rename(columns=rename_map),
+            on='loc',
+            how='outer',
+            indicator=True
+        )
+        merged = merged[merged['loc'].notna()]
+        for col in ['lastmod', 'lastmod_prev', 'sitemap_source_url', 'sitemap_source_url_prev',
+                    'change_type_prev', 'section', 'subsection', 'path_depth']:
+            if col not in merged.columns:
+                merged[col] = None
 
-            for _, row in merged.iterrows():
-                loc = row.get('loc')
-                if pd.isna(loc):
-                    continue
+        is_new = (merged['_merge'] == 'left_only').to_numpy()
+        is_gone = (merged['_merge'] == 'right_only').to_numpy()
+        is_both = (merged['_merge'] == 'both').to_numpy()
 
-                cur_lastmod = row.get('lastmod')
-                cur_source = row.get('sitemap_source_url')
-                prev_lastmod = row.get('lastmod_prev')
-                prev_source = row.get('sitemap_source_url_prev')
-                prev_change_type = row.get('change_type_prev')
+        # Removed URLs have no current row to take a section from
+        if is_gone.any():
+            gone = merged.loc[is_gone, 'loc']
+            merged.loc[is_gone, CLASSIFIED_COLUMNS] = self.url_classifier.classify(domain, gone).to_numpy()
 
-                source_for_log = cur_source if pd.notna(cur_source) else prev_source
+        cur_lastmod = merged['lastmod']
+        prev_lastmod = merged['lastmod_prev']
+        is_updated = is_both & (
+            (cur_lastmod != prev_lastmod) & ~(cur_lastmod.isna() & prev_lastmod.isna())
+        ).to_numpy()
+        # Removed - only log once
+        is_newly_gone = is_gone & (merged['change_type_prev'] != 'removed').to_numpy()
 
-                # Get first_seen_at from all-time lookup (or current time for new URLs)
-                first_seen = all_time_lookup.get(loc, current_dt)
-                
-                base = {
-                    'detected_at': current_dt,
-                    'domain': domain,
-                    'loc': loc,
-                    'first_seen_at': first_seen,
-                    'last_seen_at': current_dt,
-                    'sitemap_source_url': source_for_log,
-                    'section': row.get('section'),
-                    'subsection': row.get('subsection'),
-                    'path_depth': row.get('path_depth'),
-                }
+        # First seen: all-time lookup for known URLs, now for new ones
+        first_seen_at = merged['loc'].map(first_seen).astype(object)
+        first_seen_at = first_seen_at.where(first_seen_at.notna(), current_dt)
+        first_seen_at = first_seen_at.where(~is_new, current_dt)
 
-                if row['_merge'] == 'left_only':
-                    # New URL - first_seen = last_seen = now
-                    base['first_seen_at'] = current_dt
-                    changes.append({**base, 'change_type': 'discovered', 'lastmod': cur_lastmod, 'lastmod_prev': None})
-                    output_rows.append({**base, 'change_type': 'discovered', 'lastmod': cur_lastmod})
-
-                elif row['_merge'] == 'right_only':
-                    # Removed - only log once, last_seen_at = now (when we noticed removal)
-                    if prev_change_type != 'removed':
-                        changes.append({**base, 'change_type': 'removed', 'lastmod': None, 'lastmod_prev': prev_lastmod})
-                    # Don't add to output (removed URLs not in snapshot)
-
-                elif row['_merge'] == 'both':
-                    # Check for update
-                    updated = cur_lastmod != prev_lastmod and not (pd.isna(cur_lastmod) and pd.isna(prev_lastmod))
-                    
-                    if updated:
-                        changes.append({**base, 'change_type': 'modified', 'lastmod': cur_lastmod, 'lastmod_prev': prev_lastmod})
-                        output_rows.append({**base, 'change_type': 'modified', 'lastmod': cur_lastmod})
-                    else:
-                        output_rows.append({**base, 'change_type': 'present', 'lastmod': cur_lastmod})
-
-        # Build output DataFrame
-        output_df = pd.DataFrame(columns=snapshot_columns)
-        if output_rows:
-            temp_df = pd.DataFrame(output_rows)
-            for col in snapshot_columns:
-                if col in temp_df.columns:
-                    output_df[col] = temp_df[col]
+        change_type = np.select(
+            [is_new, is_newly_gone, is_updated],
+            ['discovered', 'removed', 'modified'],
+            default='present',
+        )
 
-        # Stats
-        discovered_count = len([c for c in changes if c.get('change_type') == 'discovered'])
-        modified_count = len([c for c in changes if c.get('change_type') == 'modified'])
-        removed_count = len([c for c in changes if c.get('change_type') == 'removed'])
-        logger.info(f"Changes: {discovered_count} discovered, {modified_count} modified, {removed_count} removed")
+        base = pd.DataFrame({
+            'detected_at': current_dt,
+            'domain': domain,
+            'loc': merged['loc'],
+            'first_seen_at': first_seen_at,
+            'last_seen_at': current_dt,
+            'sitemap_source_url': merged['sitemap_source_url'].where(
+                merged['sitemap_source_url'].notna(), merged['sitemap_source_url_prev']
+            ),
+            'section': merged['section'],
+            'subsection': merged['subsection'],
+            'path_depth': pd.to_numeric(merged['path_depth'], errors='coerce').astype('Int64'),
+            'change_type': change_type,
+            # Removed URLs have no current lastmod; new URLs have no previous one
+            'lastmod': cur_lastmod.where(~is_gone, None),
+            'lastmod_prev': prev_lastmod.where(~is_new, None),
+        })
+
+        changes_df = base[is_new | is_newly_gone | is_updated].reset_index(drop=True)
+        # Removed URLs are not in the snapshot
+        output_df = base[~is_gone].reindex(columns=SNAPSHOT_COLUMNS).reset_index(drop=True)
+        return changes_df, output_df
+
+    def _log_change_stats(self, counts: Dict[str, int], section_counts: Optional[pd.Series]) -> None:
+        """
+        6.13 Log change-type counts and the top sections.
+        """
+        logger.info(
+            f"Changes: {counts.get('discovered', 0)} discovered, "
+            f"{counts.get('modified', 0)} modified, {counts.get('removed', 0)} removed"
+        )
+        if section_counts is not None and not section_counts.empty:
+            logger.info(f"Top sections: {section_counts.sort_values(ascending=False).head(5).to_dict()}")
+
+    def _process_urls_in_memory(self, domain: str, current_df: pd.DataFrame) -> pd.DataFrame:
+        """
+        6.14 In-memory diff: whole snapshot, all-time and current URLs in RAM.
+        """
+        file_paths = self._get_file_paths(domain)
+        current_dt = datetime.now(timezone.utc)
+
+        change_log_path = self._get_monthly_change_log_path(domain, current_dt)
+        snapshot_path = file_paths['snapshot_csv']
+
+        # Load existing snapshot
+        existing_df = self._load_snapshot(snapshot_path)
+        if not existing_df.empty:
+            for col in ['loc', 'lastmod', 'sitemap_source_url', 'change_type', 'section']:
+                if col not in existing_df.columns:
+                    existing_df[col] = None
+            logger.info(f"Loaded existing snapshot: {len(existing_df)} URLs")
+        
+        # Load all-time data to get first_seen_at for existing URLs
+        first_seen = self._load_first_seen_lookup(file_paths['all_time_csv'])
+
+        # One-time backfill check
+        if not self._has_existing_change_log(domain) and not existing_df.empty:
+            logger.info(f"Backfilling change log with {len(existing_df):,} existing URLs")
+            backfill_df = self._build_backfill(domain, existing_df, current_dt)
+            if not backfill_df.empty:
+                self._save_change_log(backfill_df, change_log_path, domain)
+
+        # Change detection
+        current_df = self._dedupe_current(current_df)
+        changes_df, output_df = self._diff_frames(
+            domain, current_df, existing_df, first_seen, current_dt
+        )
+        del current_df, existing_df
 
-        # Section summary
+        # Stats
+        counts = changes_df['change_type'].value_counts().to_dict() if not changes_df.empty else {}
+        section_counts = None
         if not output_df.empty and 'section' in output_df.columns:
-            section_counts = output_df['section'].value_counts().head(5)
-            logger.info(f"Top sections: {section_counts.to_dict()}")
+            section_counts = output_df['section'].value_counts()
+        self._log_change_stats(counts, section_counts)
 
         # Save change log
-        if changes:
-            self._save_change_log(pd.DataFrame(changes), change_log_path)
+        if not changes_df.empty:
+            self._save_change_log(changes_df, change_log_path, domain)
 
         # Save snapshot
         if not output_df.empty:
-            self._save_snapshot(output_df, snapshot_path)
+            self._save_snapshot(output_df, snapshot_path, domain)
             logger.info(f"Saved snapshot: {len(output_df)} URLs")
 
         # Update all-time list
         self._update_all_time_live(domain, output_df)
 
         return output_df
+
+    # =========================================================================
+    # 7.0 OUT-OF-CORE (EXTERNAL) DIFF
+    # =========================================================================
+
+    def _spool_csv(self, path: str, spool: PartitionSpool, dropna_loc: bool = True) -> int:
+        """
+        7.1 Stream a CSV (or legacy Parquet) file into a partition spool.
+        
+        Returns:
+            Number of rows spooled
+        """
+        rows = 0
+        if os.path.exists(path):
+            try:
+                for chunk in pd.read_csv(path, chunksize=self.chunk_rows):
+                    if dropna_loc and 'loc' in chunk.columns:
+                        chunk = chunk.dropna(subset=['loc'])
+                    spool.write(chunk)
+                    rows += len(chunk)
+            except Exception as e:
+                logger.warning(f"Could not stream {path}: {e}")
+            return rows
+
+        parquet_path = path.replace('.csv', '.parquet')
+        if path.endswith('_urls.csv') and os.path.exists(parquet_path):
+            try:
+                legacy_df = pd.read_parquet(parquet_path)
+                logger.info(f"Migrated from legacy Parquet: {parquet_path}")
+                if dropna_loc and 'loc' in legacy_df.columns:
+                    legacy_df = legacy_df.dropna(subset=['loc'])
+                spool.write(legacy_df)
+                rows = len(legacy_df)
+            except Exception as e:
+                logger.warning(f"Could not load Parquet snapshot: {e}")
+        return rows
+
+    def _process_url_batches_external(
+        self,
+        domain: str,
+        batches: Iterator[pd.DataFrame],
+        n_partitions: int,
+    ) -> pd.DataFrame:
+        """
+        7.2 Out-of-core diff: hash-partition everything, diff bucket by bucket.
+        
+        Flow:
+        1. Spool incoming URL batches, previous snapshot and all-time file
+           into N buckets by URL fingerprint (same URL -> same bucket everywhere)
+        2. Per bucket: dedupe, diff, fold into all-time, write sorted runs
+        3. K-way merge the runs into the snapshot, change log and all-time file
+        
+        Peak memory is one batch or one bucket's worth of rows, not the domain.
+        """
+        file_paths = self._get_file_paths(domain)
+        current_dt = datetime.now(timezone.utc)
+        change_log_path = self._get_monthly_change_log_path(domain, current_dt)
+        snapshot_path = file_paths['snapshot_csv']
+        all_time_path = file_paths['all_time_csv']
+
+        logger.info(
+            f"External diff for {domain}: {n_partitions} partitions, "
+            f"budget {self.memory_budget_mb} MB"
+        )
+
+        counts: Dict[str, int] = {}
+        section_counts = pd.Series(dtype="int64")
+        snapshot_rows = 0
+
+        # Removed by the commit job below: the runs outlive this call when
+        # the merges are queued on the write-behind writer
+        tmp = tempfile.mkdtemp(prefix=f"{domain}_diff_", dir=self.spool_dir)
+        try:
+            # 7.2.1 Partition inputs
+            current_spool = PartitionSpool(tmp, "current", n_partitions)
+            for batch in batches:
+                current_spool.write(self._normalize_batch(domain, batch))
+            logger.info(f"Processing {current_spool.rows_written} URLs for domain: {domain}")
+
+            existing_spool = PartitionSpool(tmp, "snapshot", n_partitions)
+            existing_rows = self._spool_csv(snapshot_path, existing_spool)
+            if existing_rows:
+                logger.info(f"Spooled existing snapshot: {existing_rows:,} URLs")
+
+            all_time_spool = PartitionSpool(tmp, "all_time", n_partitions)
+            self._spool_csv(all_time_path, all_time_spool, dropna_loc=False)
+
+            # 7.2.2 One-time backfill (streamed per bucket)
+            needs_backfill = existing_rows > 0 and not self._has_existing_change_log(domain)
+            if needs_backfill:
+                logger.info(f"Backfilling change log with {existing_rows:,} existing URLs")
+
+            # 7.2.3 Diff bucket by bucket
+            run_dir = os.path.join(tmp, "runs")
+            os.makedirs(run_dir, exist_ok=True)
+            change_runs, snapshot_runs, all_time_runs = [], [], []
+
+            for bucket in range(n_partitions):
+                existing_df = existing_spool.read(bucket)
+                if not existing_df.empty:
+                    existing_df = existing_df.drop_duplicates(subset=['loc'], keep='first')
+                    for col in ['loc', 'lastmod', 'sitemap_source_url', 'change_type', 'section']:
+                        if col not in existing_df.columns:
+                            existing_df[col] = None
+
+                if needs_backfill and not existing_df.empty:
+                    backfill_df = self._build_backfill(domain, existing_df, current_dt)
+                    self._save_change_log(backfill_df, change_log_path, domain)
+
+                all_time_df = all_time_spool.read(bucket)
+                first_seen = pd.Series(dtype=object)
+                if 'loc' in all_time_df.columns:
+                    first_seen = self._first_seen_series(all_time_df)
+
+                current_df = current_spool.read(bucket)
+                if current_df.empty:
+                    current_df = pd.DataFrame(columns=CURRENT_COLUMNS)
+                current_df = self._dedupe_current(current_df)
+
+                changes_df, output_df = self._diff_frames(
+                    domain, current_df, existing_df, first_seen, current_dt
+                )
+                merged_all_time = self._merge_all_time(domain, all_time_df, output_df, current_dt)
+
+                for change_type, n in changes_df.get('change_type', pd.Series(dtype=object)).value_counts().items():
+                    counts[change_type] = counts.get(change_type, 0) + int(n)
+                if not output_df.empty and 'section' in output_df.columns:
+                    section_counts = section_counts.add(output_df['section'].value_counts(), fill_value=0)
+                snapshot_rows += len(output_df)
+
+                change_run = os.path.join(run_dir, f"changes_{bucket:05d}.csv")
+                snapshot_run = os.path.join(run_dir, f"snapshot_{bucket:05d}.csv")
+                all_time_run = os.path.join(run_dir, f"all_time_{bucket:05d}.csv")
+                write_sorted_run(changes_df, change_run, CHANGE_LOG_COLUMNS, ['loc'])
+                write_sorted_run(output_df, snapshot_run, SNAPSHOT_COLUMNS, ['loc'])
+                write_sorted_run(merged_all_time, all_time_run, ALL_TIME_COLUMNS, ['domain', 'loc'])
+                change_runs.append(change_run)
+                snapshot_runs.append(snapshot_run)
+                all_time_runs.append(all_time_run)
+
+                for spool in (current_spool, existing_spool, all_time_spool):
+                    spool.drop(bucket)
+
+            self._log_change_stats(counts, section_counts.astype("int64"))
+
+            # 7.2.4 Merge runs into final outputs
+            if sum(counts.values()):
+                merged_changes = os.path.join(tmp, "changes_merged.csv")
+                merge_sorted_runs(change_runs, merged_changes, CHANGE_LOG_COLUMNS, ['loc'])
+                for chunk in pd.read_csv(
+                    merged_changes, chunksize=self.chunk_rows, dtype=str, keep_default_na=False
+                ):
+                    self._save_change_log(chunk, change_log_path, domain)
+
+        except BaseException:
+            shutil.rmtree(tmp, ignore_errors=True)
+            raise
+
+        # 7.2.5 Snapshot and all-time are merged and committed behind the crawl,
+        # after the change log chunks queued above
+        def commit_outputs() -> None:
+            try:
+                if snapshot_rows:
+                    self._commit_merged(snapshot_runs, snapshot_path, SNAPSHOT_COLUMNS, ['loc'])
+                    logger.info(f"Saved snapshot: {snapshot_rows} URLs")
+                all_time_rows = self._commit_merged(
+                    all_time_runs, all_time_path, ALL_TIME_COLUMNS, ['domain', 'loc']
+                )
+                logger.info(f"All-time for {domain}: {all_time_rows} total ({snapshot_rows} live)")
+            finally:
+                shutil.rmtree(tmp, ignore_errors=True)
+
+        self._write(domain, commit_outputs)
+
+        return pd.DataFrame(columns=SNAPSHOT_COLUMNS)
+
+    def _commit_merged(self, runs: List[str], path: str, columns: List[str], sort_cols: List[str]) -> int:
+        """
+        7.3 Merge sorted runs into <path>.tmp and commit it over path.
+
+        The merge is written next to the target, not in the spool directory,
+        so the rename stays atomic (the spool may be on another filesystem).
+        """
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        rows = merge_sorted_runs(runs, path + ".tmp", columns, sort_cols)
+        commit_file(path + ".tmp", path)
+        return rows
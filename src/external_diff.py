@@ -0,0 +1,188 @@
+"""
+1.0 External Diff Module
+Out-of-core helpers for diffing snapshots that do not fit in memory.
+
+Key features:
+- Hash-partitions URL rows into N on-disk buckets by URL fingerprint
+- The same URL always lands in the same bucket, so each bucket diffs independently
+- Partition count derived from a configurable memory budget
+- K-way merge of sorted per-bucket CSV runs into a single sorted output file
+"""
+
+import csv
+import heapq
+import logging
+import math
+import os
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# 1.1 Defaults
+DEFAULT_MEMORY_BUDGET_MB = 1024
+DEFAULT_CHUNK_ROWS = 100_000
+MAX_PARTITIONS = 4096
+
+# Rough in-memory size of one URL row (object columns + merge overhead)
+# relative to its CSV size on disk
+IN_MEMORY_EXPANSION = 6
+EST_BYTES_PER_URL = 200
+
+
+def url_fingerprints(locs: pd.Series) -> pd.Series:
+    """
+    2.1 Compute a stable 64-bit fingerprint for each URL.
+
+    Uses pandas' vectorized hashing so whole batches are fingerprinted
+    without a per-row Python loop. URLs are nearly all unique, so the
+    categorize pre-pass is skipped (same hash values, less work).
+    """
+    values = pd.util.hash_array(locs.astype(str).to_numpy(), categorize=False)
+    return pd.Series(values, index=locs.index, dtype="uint64")
+
+
+def estimate_diff_bytes(paths: Iterable[str], new_url_count: int = 0) -> int:
+    """
+    2.2 Estimate the in-memory footprint of an in-memory diff.
+
+    Args:
+        paths: On-disk CSV files the diff would load (snapshot, all-time)
+        new_url_count: Number of incoming URLs (if known)
+
+    Returns:
+        Estimated bytes needed to diff everything at once
+    """
+    disk_bytes = sum(os.path.getsize(p) for p in paths if p and os.path.exists(p))
+    return (disk_bytes + new_url_count * EST_BYTES_PER_URL) * IN_MEMORY_EXPANSION
+
+
+def choose_partition_count(estimated_bytes: int, memory_budget_mb: float) -> int:
+    """
+    2.3 Pick how many buckets keep each bucket's diff within budget.
+    """
+    budget_bytes = max(1, int(memory_budget_mb * 1024 * 1024))
+    n = math.ceil(estimated_bytes / budget_bytes)
+    return int(min(MAX_PARTITIONS, max(1, n)))
+
+
+class PartitionSpool:
+    """
+    3.0 PartitionSpool Class
+    Spools DataFrame chunks into N hash buckets on disk.
+
+    Each write splits the chunk by URL fingerprint and stores one pickle
+    piece per non-empty bucket. Pickle keeps dtypes exactly as they were
+    in memory, so a bucket read back is identical to the matching slice
+    of the in-memory frame.
+    """
+
+    def __init__(self, root_dir: str, name: str, n_partitions: int, key_col: str = "loc"):
+        self.root_dir = os.path.join(root_dir, name)
+        self.n_partitions = n_partitions
+        self.key_col = key_col
+        self.columns: Optional[List[str]] = None
+        self.rows_written = 0
+        self._pieces: List[List[str]] = [[] for _ in range(n_partitions)]
+        os.makedirs(self.root_dir, exist_ok=True)
+
+    def write(self, df: pd.DataFrame) -> None:
+        """
+        3.1 Split a chunk by bucket and persist each piece.
+        """
+        if df is None or df.empty:
+            if self.columns is None and df is not None:
+                self.columns = list(df.columns)
+            return
+
+        if self.columns is None:
+            self.columns = list(df.columns)
+
+        if self.n_partitions == 1:
+            buckets = pd.Series(0, index=df.index)
+        else:
+            buckets = url_fingerprints(df[self.key_col]) % self.n_partitions
+
+        for bucket, piece in df.groupby(buckets.to_numpy(), sort=False):
+            bucket = int(bucket)
+            piece_path = os.path.join(
+                self.root_dir, f"b{bucket:05d}_{len(self._pieces[bucket]):06d}.pkl"
+            )
+            piece.to_pickle(piece_path)
+            self._pieces[bucket].append(piece_path)
+
+        self.rows_written += len(df)
+
+    def read(self, bucket: int) -> pd.DataFrame:
+        """
+        3.2 Load every piece of a bucket, preserving write order.
+        """
+        pieces = self._pieces[bucket]
+        if not pieces:
+            return pd.DataFrame(columns=self.columns or [])
+        frames = [pd.read_pickle(p) for p in pieces]
+        return frames[0] if len(frames) == 1 else pd.concat(frames)
+
+    def drop(self, bucket: int) -> None:
+        """
+        3.3 Delete a bucket's pieces once it has been diffed.
+        """
+        for piece_path in self._pieces[bucket]:
+            try:
+                os.remove(piece_path)
+            except OSError:
+                pass
+        self._pieces[bucket] = []
+
+
+def write_sorted_run(df: pd.DataFrame, run_path: str, columns: List[str], sort_cols: List[str]) -> None:
+    """
+    4.1 Write a bucket's rows as a headerless CSV run sorted by sort_cols.
+
+    Uses a stable sort so rows with equal keys keep their diff order.
+    """
+    if df.empty:
+        return
+    run_df = df.reindex(columns=columns).sort_values(sort_cols, kind="mergesort")
+    run_df.to_csv(run_path, index=False, header=False)
+
+
+def _iter_keyed_lines(run_path: str, key_indexes: Tuple[int, ...]) -> Iterator[Tuple[Tuple[str, ...], str]]:
+    """
+    4.2 Yield (sort_key, raw_line) for each line of a CSV run.
+    """
+    with open(run_path, "r", newline="", encoding="utf-8") as f:
+        for line in f:
+            fields = next(csv.reader([line]))
+            yield tuple(fields[i] if i < len(fields) else "" for i in key_indexes), line
+
+
+def merge_sorted_runs(
+    run_paths: List[str],
+    out_path: str,
+    columns: List[str],
+    sort_cols: List[str],
+) -> int:
+    """
+    4.3 K-way merge sorted CSV runs into a single CSV with a header.
+
+    Only one line per run is held in memory at a time. Lines are copied
+    verbatim, so the merged file is byte-identical to what writing the
+    combined frame in one go would produce.
+
+    Returns:
+        Number of data rows written
+    """
+    key_indexes = tuple(columns.index(c) for c in sort_cols)
+    existing_runs = [p for p in run_paths if os.path.exists(p)]
+    rows = 0
+
+    with open(out_path, "w", newline="", encoding="utf-8") as out:
+        pd.DataFrame(columns=columns).to_csv(out, index=False)
+        streams = [_iter_keyed_lines(p, key_indexes) for p in existing_runs]
+        for _, line in heapq.merge(*streams, key=lambda item: item[0]):
+            out.write(line)
+            rows += 1
+
+    return rows
@@ -4,27 +4,60 @@ Coordinates the sitemap monitoring pipeline with scheduling and change detection
 
 Key features:
 - Recursive sitemap index traversal
+- Streaming fetch -> parse -> diff pipeline (URL batches, bounded memory)
 - Tags each URL with its source sitemap
 - Configurable scheduling (daily, weekly, monthly, custom intervals)
 - Random scheduling for non-priority domains
 - User-agent rotation
+- Thread or process-pool execution per domain (crash-isolated workers)
+- Optional per-domain CPU / memory profiles (--profile, --profile-memory)
+- Daemon mode (--daemon): continuous crawling with adaptive per-sitemap intervals
 """
 
+import argparse
+import itertools
 import logging
+import multiprocessing
 import os
+import queue
 import random
+import signal
+import threading
 import time
 import hashlib
+import heapq
+from contextlib import contextmanager, nullcontext
 from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime, timezone
-from typing import Dict, Any, List, Optional, Tuple
+from typing import Dict, Any, Iterator, List, Optional, Tuple
+from urllib.parse import urlparse
+
+import pandas as pd
 
 # Project-specific imports
 from src.config import load_config, CONFIG_FILE_PATH
-from src.sitemap_fetcher import SitemapFetcher
-from src.sitemap_parser import SitemapParser
+from src.sitemap_fetcher import DEFAULT_LIMITS, SitemapFetcher, protocol_warnings
+from src.sitemap_parser import SitemapParser, DEFAULT_BATCH_SIZE
 from src.data_processor import DataProcessor
-from src.robots_checker import RobotsChecker
+from src.retry import RetryableFetchError, RetryQueue
+from src.work_pool import SitemapPrefetch, SitemapWorkPool
+from src.writer import WriteBehind
+from src.robots_checker import PREFETCH_TIMEOUT, PREFETCH_WORKERS, RobotsChecker
+from src.metrics import domain_context, run_metrics, write_prometheus_textfile, write_report
+from src.planner import format_plan, plan_domains, planner_settings, record_runs
+from src.profiling import domain_profile, profiling_settings
+from src.scheduler import SitemapSchedule, scheduler_settings
+from src.sitemap_discovery import needs_discovery, resolve_target_sitemaps
+from src.sharding import (
+    default_run_id,
+    merge_shards,
+    parse_shard_spec,
+    run_dir,
+    select_shard_targets,
+    shard_label,
+    shard_robots_cache_path,
+    write_shard_summary,
+)
 
 # 1.1 Setup logging
 logging.basicConfig(
@@ -68,15 +101,79 @@ COMPETITOR_BOT_USER_AGENTS = [
 # Browser fallback when no bots are allowed
 BROWSER_USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/131.0.0.0 Safari/537.36"
 
-# Module-level robots checker (caches robots.txt)
-_robots_checker = None
+# Module-level robots checkers (cache robots.txt), one per cache file
+_robots_checkers: Dict[Optional[str], RobotsChecker] = {}
+
+def get_robots_checker(cache_path: Optional[str] = None) -> RobotsChecker:
+    """Get or create the robots checker singleton for a cache file."""
+    if cache_path not in _robots_checkers:
+        _robots_checkers[cache_path] = RobotsChecker(cache_path=cache_path)
+    return _robots_checkers[cache_path]
+
+
+def robots_host(config: Dict[str, Any], domain: str) -> Optional[str]:
+    """
+    2.0.1 Host whose robots.txt decides a domain's bot user agent.
+    
+    The sitemap's own host (robots.txt is per host, and sitemaps often
+    live on www. or a subdomain); www.<domain> for targets without one.
+    None when robots.txt is not consulted (user agent override, own
+    properties).
+    """
+    target = next((t for t in config.get("targets", []) if t.get("domain") == domain), {})
+    if target.get("user_agent") or any(bd in domain for bd in BANKRATE_DOMAINS):
+        return None
+    sitemap_url = target.get("sitemap_url") or next(iter(target.get("sitemap_urls") or []), None)
+    host = urlparse(sitemap_url).netloc if sitemap_url else None
+    if host:
+        return host
+    return domain if domain.startswith("www.") else f"www.{domain}"
+
+
+def prefetch_robots(config: Dict[str, Any], targets: List[Dict[str, Any]]) -> int:
+    """
+    2.0.2 Fetch robots.txt for all targets concurrently before the domain pool starts.
+    
+    Domain workers (threads, or processes loading the saved cache) then
+    pick their user agent without blocking on robots.txt I/O.
+    """
+    hosts = [robots_host(config, t.get("domain")) for t in targets if t.get("domain")]
+    hosts = [h for h in hosts if h]
+    if not hosts:
+        return 0
+    return get_robots_checker(config.get("robots_cache_path")).prefetch(
+        hosts,
+        timeout=config.get("robots_prefetch_timeout", PREFETCH_TIMEOUT),
+        max_workers=config.get("robots_prefetch_workers", PREFETCH_WORKERS),
+    )
+
 
-def get_robots_checker() -> RobotsChecker:
-    """Get or create the robots checker singleton."""
-    global _robots_checker
-    if _robots_checker is None:
-        _robots_checker = RobotsChecker()
-    return _robots_checker
+def resolve_discovered_targets(config: Dict[str, Any], targets: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    2.0.3 Fill in sitemap roots for targets that need discovery (concurrently).
+    
+    Targets with configured sitemaps pass through unchanged; saved
+    discoveries are reused within their TTL (see sitemap_discovery).
+    Targets where nothing was found are dropped with a warning.
+    """
+    pending = [t for t in targets if needs_discovery(t)]
+    if not pending:
+        return targets
+    robots_checker = get_robots_checker(config.get("robots_cache_path"))
+    workers = config.get("discovery", {}).get("domain_workers", 4)
+    with ThreadPoolExecutor(max_workers=min(workers, len(pending)), thread_name_prefix="discovery") as pool:
+        resolved = dict(zip(
+            [id(t) for t in pending],
+            pool.map(lambda t: resolve_target_sitemaps(t, config, robots_checker), pending),
+        ))
+    result = []
+    for target in targets:
+        target = resolved.get(id(target), target)
+        if not (target.get("sitemap_url") or target.get("sitemap_urls")):
+            logger.warning(f"No sitemap found for {target.get('domain')}, skipping")
+            continue
+        result.append(target)
+    return result
 
 
 def get_user_agent(config: Dict[str, Any], domain: str) -> str:
@@ -108,10 +205,10 @@ def get_user_agent(config: Dict[str, Any], domain: str) -> str:
         return BANKRATE_USER_AGENT
     
     # For competitor domains: filter by robots.txt, pick randomly from allowed
-    robots_checker = get_robots_checker()
+    robots_checker = get_robots_checker(config.get("robots_cache_path"))
     
-    # Get domain with www prefix if needed
-    check_domain = domain if domain.startswith("www.") else f"www.{domain}"
+    # robots.txt of the host the sitemaps are fetched from (usually prefetched)
+    check_domain = robots_host(config, domain)
     
     # Filter to only allowed bots, then pick randomly
     allowed_bots = robots_checker.filter_allowed_bots(check_domain, COMPETITOR_BOT_USER_AGENTS)
@@ -126,6 +223,19 @@ def get_user_agent(config: Dict[str, Any], domain: str) -> str:
     return BROWSER_USER_AGENT
 
 
+def build_fetcher(target: Dict[str, Any], config: Dict[str, Any]) -> SitemapFetcher:
+    """
+    2.1 Create a SitemapFetcher with the domain's user agent and target-specific settings.
+    """
+    fetcher_config = {
+        **config,
+        "user_agent": get_user_agent(config, target.get("domain")),
+        "timeout": target.get("fetch_timeout", target.get("timeout", config.get("timeout", 30))),
+        "download_delay": target.get("download_delay", config.get("download_delay", 1.5)),
+    }
+    return SitemapFetcher(config=fetcher_config)
+
+
 def calculate_startup_jitter(domain: str, random_config: Dict[str, Any]) -> int:
     """
     2.5 Calculate minimal startup jitter to avoid exact-second predictability.
@@ -155,6 +265,36 @@ def calculate_startup_jitter(domain: str, random_config: Dict[str, Any]) -> int:
     return jitter_seconds
 
 
+def startup_delay(target: Dict[str, Any], stealth_config: Dict[str, Any]) -> int:
+    """
+    2.6 Seconds after run start before a domain may begin.
+    
+    No jitter for Bankrate (own property) or when stealth is disabled.
+    """
+    domain = target.get("domain", "")
+    if not stealth_config.get("enabled", False) or any(bd in domain for bd in BANKRATE_DOMAINS):
+        return 0
+    return calculate_startup_jitter(domain, stealth_config)
+
+
+def start_offsets(targets: List[Dict[str, Any]], stealth_config: Dict[str, Any]) -> List[float]:
+    """
+    2.7 Start offsets (seconds) for domains in dispatch order.
+    
+    The jitter drawn for the run is spread over the jittered domains in
+    their given (longest-first) order, smallest first, and offsets never
+    decrease: jitter varies when the run's domains start but never
+    reorders them.
+    """
+    delays = [startup_delay(target, stealth_config) for target in targets]
+    jitters = iter(sorted(delay for delay in delays if delay))
+    offsets: List[float] = []
+    for delay in delays:
+        offset = next(jitters) if delay else 0
+        offsets.append(max([offset] + offsets[-1:]))
+    return offsets
+
+
 def should_run_domain(target: Dict[str, Any], config: Dict[str, Any]) -> bool:
     """
     3.0 Determine if a domain should be processed on this run.
@@ -200,19 +340,182 @@ def should_run_domain(target: Dict[str, Any], config: Dict[str, Any]) -> bool:
     return True
 
 
-def process_single_sitemap_url(
+def _carry_forward(
+    sitemap_url: str,
+    record: Dict[str, Any],
+    schedule: SitemapSchedule,
+    carried: set,
+    sitemap_file_records: Optional[List[Dict[str, Any]]],
+) -> bool:
+    """
+    3.5 Reuse a sitemap file's last content instead of parsing it (daemon mode, fetch budget).
+    
+    A urlset's page URLs are carried forward from the snapshot; an index is
+    walked through its stored child list. Returns False when neither is
+    possible (e.g. an index whose children were never recorded).
+    """
+    sitemap_type = record.get("sitemap_type")
+    if sitemap_type == "urlset":
+        carried.add(sitemap_url)
+    elif sitemap_type != "sitemapindex" or schedule.children(sitemap_url) is None:
+        return False
+    schedule.mark_carried(sitemap_url)
+    schedule.record_parsed(sitemap_url, record)
+    if sitemap_file_records is not None:
+        sitemap_file_records.append(record)
+    run_metrics.incr("sitemaps_carried")
+    return True
+
+
+def _protocol_check(sitemap_url: str, entries: int, size: int) -> str:
+    """
+    3.7 Report (not enforce) the protocol's 50k entries / 50 MB per-file limits.
+    """
+    warnings = protocol_warnings(entries, size)
+    if warnings:
+        logger.warning(f"Sitemap {sitemap_url} exceeds protocol limits: {warnings}")
+        run_metrics.incr("protocol_limit_exceeded")
+        run_metrics.record_sitemap(sitemap_url, protocol_warnings=warnings)
+    return warnings
+
+
+class WorkerSlots:
+    """
+    3.8 Caps how many domains work at once, independent of the pool's threads.
+    
+    A domain that is only waiting (on retries) hands its slot to another
+    domain: the wait parks a thread, not one of max_concurrent_domains.
+    """
+
+    def __init__(self, n: int):
+        self._semaphore = threading.Semaphore(n)
+
+    def __enter__(self) -> "WorkerSlots":
+        self._semaphore.acquire()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self._semaphore.release()
+
+    @contextmanager
+    def released(self) -> Iterator[None]:
+        self._semaphore.release()
+        try:
+            yield
+        finally:
+            self._semaphore.acquire()
+
+
+class StartQueue:
+    """
+    3.9 Domains ordered by scheduled start time (run start + startup jitter).
+    
+    Jitter is a start time, not a sleep inside a worker: the dispatcher
+    hands domains to the pool as they become ready, so workers only run
+    domains that can start and a run takes about max(jitter) + work.
+    Ties keep the given order (start_offsets keeps longest-first order).
+    """
+
+    def __init__(self, delays: List[Tuple[float, Dict[str, Any]]], started: Optional[float] = None):
+        started = time.monotonic() if started is None else started
+        self._heap = [(started + delay, i, target) for i, (delay, target) in enumerate(delays)]
+        heapq.heapify(self._heap)
+
+    @classmethod
+    def for_targets(cls, targets: List[Dict[str, Any]], stealth_config: Dict[str, Any]) -> "StartQueue":
+        delays = list(zip(start_offsets(targets, stealth_config), targets))
+        for delay, target in delays:
+            if delay:
+                logger.info(f"Startup jitter: {delay}s for {target.get('domain')}")
+        return cls(delays)
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def pop_ready(self, now: Optional[float] = None) -> List[Dict[str, Any]]:
+        now = time.monotonic() if now is None else now
+        ready = []
+        while self._heap and self._heap[0][0] <= now:
+            ready.append(heapq.heappop(self._heap)[2])
+        return ready
+
+    def seconds_until_next(self, now: Optional[float] = None) -> float:
+        if not self._heap:
+            return 0.0
+        return max(0.0, self._heap[0][0] - (time.monotonic() if now is None else now))
+
+    def __iter__(self) -> Iterator[Dict[str, Any]]:
+        """Yield targets as their start times arrive (sleeping only in the dispatcher)."""
+        while self._heap:
+            time.sleep(self.seconds_until_next())
+            yield from self.pop_ready()
+
+
+class CrawlLimitExceeded(Exception):
+    """A domain crawl passed its max_domain_mb / max_domain_urls limit."""
+
+
+class DomainLimits:
+    """
+    3.6 Per-domain byte and URL caps for one crawl (the `limits` config block).
+    
+    Sitemap bytes are counted uncompressed as files are fetched; URLs as
+    batches reach the diff. Passing a cap raises CrawlLimitExceeded, which
+    aborts the domain before anything is written.
+    """
+
+    def __init__(self, domain: str, max_bytes: Optional[int], max_urls: Optional[int]):
+        self.domain = domain
+        self.max_bytes = max_bytes
+        self.max_urls = max_urls
+        self.bytes = 0
+        self.urls = 0
+
+    @classmethod
+    def for_target(cls, target: Dict[str, Any], config: Dict[str, Any]) -> "DomainLimits":
+        limits = {**DEFAULT_LIMITS, **config.get("limits", {}), **target.get("limits", {})}
+        max_mb, max_urls = limits.get("max_domain_mb"), limits.get("max_domain_urls")
+        return cls(
+            target.get("domain"),
+            int(float(max_mb) * 1024 * 1024) if max_mb else None,
+            int(max_urls) if max_urls else None,
+        )
+
+    def add_bytes(self, n: int, sitemap_url: str) -> None:
+        self.bytes += n
+        if self.max_bytes and self.bytes > self.max_bytes:
+            raise CrawlLimitExceeded(
+                f"max_domain_mb exceeded at {sitemap_url} "
+                f"({self.bytes // (1024 * 1024)} MB > {self.max_bytes // (1024 * 1024)} MB)"
+            )
+
+    def add_urls(self, n: int) -> None:
+        self.urls += n
+        if self.max_urls and self.urls > self.max_urls:
+            raise CrawlLimitExceeded(f"max_domain_urls exceeded ({self.urls:,} > {self.max_urls:,} URLs)")
+
+
+def iter_sitemap_url_batches(
     sitemap_url: str,
     fetcher: SitemapFetcher,
     parser: SitemapParser,
     processed_sitemap_urls: set,
     domain: str,
     sitemap_file_records: Optional[List[Dict[str, Any]]] = None,
-) -> list:
+    batch_size: int = DEFAULT_BATCH_SIZE,
+    schedule: Optional[SitemapSchedule] = None,
+    carried: Optional[set] = None,
+    limits: Optional[DomainLimits] = None,
+    retries: Optional[RetryQueue] = None,
+    prefetch: Optional[SitemapPrefetch] = None,
+) -> Iterator[pd.DataFrame]:
     """
-    4.0 Fetch and parse a single sitemap URL (index or urlset).
+    4.0 Fetch and stream a single sitemap URL (index or urlset) as URL batches.
     
-    Recursively processes sitemap indexes and collects all page URLs.
-    Tags each URL with its source sitemap.
+    Recursively walks sitemap indexes and yields page URLs as DataFrame
+    batches, so one child sitemap's URLs are parsed, tagged and handed to
+    the diff while the next child is still being fetched. Nothing holds the
+    whole domain as a list of dicts.
     
     Args:
         sitemap_url: URL of the sitemap to process
@@ -221,97 +524,232 @@ def process_single_sitemap_url(
         processed_sitemap_urls: Set of already-processed sitemap URLs (to avoid duplicates)
         domain: The domain being processed
         sitemap_file_records: Optional list to collect sitemap file metadata
+        batch_size: Rows per yielded batch
+        schedule: Optional per-sitemap poll state (daemon mode). Files that are
+            not due, or fetched with unchanged content, are not parsed
+        carried: Set collecting urlset URLs whose page URLs must be carried
+            forward from the snapshot (required for the schedule to skip files)
+        limits: Optional per-domain caps; fetched bytes count against them
+        retries: Optional queue for transient failures: the file is queued
+            with a backoff and walked again once due, between other files
+        prefetch: Optional window on the shared sitemap pool: an index's
+            children are fetched there ahead of the walk
         
-    Returns:
-        List of page URL dictionaries with sitemap_source_url field
+    Yields:
+        DataFrames of page URLs with a sitemap_source_url column
     """
     if sitemap_url in processed_sitemap_urls:
         logger.info(f"Sitemap {sitemap_url} already processed. Skipping.")
-        return []
+        return
 
-    logger.info(f"Processing sitemap: {sitemap_url}")
     processed_sitemap_urls.add(sitemap_url)
-    
-    xml_content = fetcher.fetch_sitemap_xml(sitemap_url)
+    walk = dict(
+        fetcher=fetcher,
+        parser=parser,
+        processed_sitemap_urls=processed_sitemap_urls,
+        domain=domain,
+        sitemap_file_records=sitemap_file_records,
+        batch_size=batch_size,
+        schedule=schedule,
+        carried=carried,
+        limits=limits,
+        retries=retries,
+        prefetch=prefetch,
+    )
+
+    def _walk_children(sub_urls: List[str]) -> Iterator[pd.DataFrame]:
+        # Budgeted crawls fetch the children most likely changed first
+        if schedule is not None:
+            schedule.plan_children(sitemap_url, sub_urls)
+            deferred = sum(1 for sub_url in sub_urls if sub_url in schedule.deferred)
+            if deferred:
+                run_metrics.incr("sitemaps_deferred", deferred)
+        if prefetch is not None:
+            prefetch.want(
+                sub_url for sub_url in sub_urls
+                if sub_url not in processed_sitemap_urls and (carried is None or schedule.should_fetch(sub_url))
+            )
+        for sub_url in sub_urls:
+            yield from iter_sitemap_url_batches(sitemap_url=sub_url, **walk)
+            # Retries that came due meanwhile go next
+            if retries:
+                for due_url in retries.pop_due():
+                    yield from iter_sitemap_url_batches(sitemap_url=due_url, **walk)
+
+    # 4.0.1 A file that is not due (daemon) or deferred by the fetch budget is not fetched
+    if carried is not None and not schedule.should_fetch(sitemap_url):
+        carried_record = schedule.carried_record(sitemap_url)
+        if carried_record and _carry_forward(sitemap_url, carried_record, schedule, carried, sitemap_file_records):
+            reason = "deferred by fetch budget" if sitemap_url in schedule.deferred else "not due"
+            logger.info(f"Sitemap {sitemap_url} {reason}. Carrying forward.")
+            yield from _walk_children(schedule.children(sitemap_url) or [])
+            return
+
+    logger.info(f"Processing sitemap: {sitemap_url}")
+    # Streamed into a spooled temp file; the parser reads it from there
+    try:
+        if prefetch is not None:
+            body = prefetch.take(sitemap_url)
+        else:
+            body = fetcher.fetch_sitemap_body(sitemap_url, defer_retries=retries is not None)
+    except RetryableFetchError as e:
+        # 4.0.2 Queue the file and move on to the next one (no backoff sleep here)
+        delay = retries.schedule(e)
+        if delay is not None:
+            processed_sitemap_urls.discard(sitemap_url)
+            run_metrics.incr("retries")
+            run_metrics.record_sitemap(sitemap_url, retries=1)
+            logger.warning(f"{e.reason} for {sitemap_url}, retry {retries.attempts[sitemap_url]} in {delay:.1f}s")
+            return
+        logger.error(f"Failed to fetch {sitemap_url}: {e.reason}, retries spent")
+        body = None
 
-    if not xml_content:
+    if body is None:
+        # A failed fetch of a known file keeps its URLs rather than removing them
+        carried_record = schedule.carried_record(sitemap_url) if carried is not None else None
+        if carried_record and _carry_forward(sitemap_url, carried_record, schedule, carried, sitemap_file_records):
+            logger.warning(f"Failed to fetch XML content for {sitemap_url}. Carrying forward last content.")
+            yield from _walk_children(schedule.children(sitemap_url) or [])
+            return
         logger.warning(f"Failed to fetch XML content for {sitemap_url}. Skipping.")
-        return []
+        return
 
-    # 4.1 Record sitemap file metadata (for XML tracking)
-    if sitemap_file_records is not None:
+    if limits is not None:
         try:
-            content_hash = hashlib.sha256(xml_content.encode("utf-8")).hexdigest()
-            sitemap_record = {
-                "sitemap_url": sitemap_url,
-                "domain": domain,
-                "sitemap_type": None,  # Will be filled after parsing
-                "url_count": 0,        # Will be filled after parsing
-                "content_hash": content_hash,
-                "content_length": len(xml_content),
-                "fetched_at": datetime.now(timezone.utc).isoformat(),
-            }
-        except Exception as e:
-            logger.warning(f"Could not hash sitemap {sitemap_url}: {e}")
-            sitemap_record = None
-    else:
-        sitemap_record = None
+            limits.add_bytes(body.size, sitemap_url)
+        except CrawlLimitExceeded:
+            body.close()
+            raise
 
-    parsed_data = parser.parse_sitemap(xml_content, sitemap_url=sitemap_url)
+    # 4.1 Record sitemap file metadata (for XML tracking)
+    content_hash = body.sha256
+    sitemap_record = None
+    if sitemap_file_records is not None or schedule is not None:
+        sitemap_record = {
+            "sitemap_url": sitemap_url,
+            "domain": domain,
+            "sitemap_type": None,  # Will be filled after parsing
+            "url_count": 0,        # Will be filled after parsing
+            "content_hash": content_hash,
+            "content_length": body.size,
+            "fetched_at": datetime.now(timezone.utc).isoformat(),
+            "fetched": True,
+        }
 
-    # 4.2 Complete the sitemap record now that we know the type and count
-    if sitemap_record is not None:
-        sitemap_record["sitemap_type"] = parsed_data.get("type")
-        sitemap_record["url_count"] = parsed_data.get("url_count", 0)
-        sitemap_file_records.append(sitemap_record)
+    # 4.1.1 Record the fetch in the change history; unchanged content is not parsed again
+    if schedule is not None:
+        changed = schedule.record_fetch(sitemap_url, content_hash)
+        sitemap_record["changed"] = changed
+        carried_record = schedule.carried_record(sitemap_url) if carried is not None else None
+        if not changed and carried_record:
+            carried_record.update(
+                fetched_at=sitemap_record["fetched_at"], content_length=body.size, fetched=True, changed=False
+            )
+            if _carry_forward(sitemap_url, carried_record, schedule, carried, sitemap_file_records):
+                logger.info(f"Sitemap {sitemap_url} unchanged. Carrying forward.")
+                body.close()
+                yield from _walk_children(schedule.children(sitemap_url) or [])
+                return
 
-    all_page_urls_from_this_branch = []
+    # A urlset is parsed lazily from the file while batches are pulled;
+    # the body is closed once it has been read (an index: before its children)
+    parsed_data = parser.iter_sitemap(body.file, sitemap_url=sitemap_url, batch_size=batch_size)
+    if parsed_data["type"] != "urlset":
+        body.close()
 
     if parsed_data["type"] == "sitemapindex":
         sub_sitemaps = parsed_data.get("urls", []) or []
         logger.info(f"Sitemap index {sitemap_url} contains {len(sub_sitemaps)} sub-sitemaps.")
-        
-        for sub_sitemap in sub_sitemaps:
-            # Handle both old format (string) and new format (dict with loc/lastmod)
-            if isinstance(sub_sitemap, dict):
-                sub_url = sub_sitemap.get('loc')
-                sub_lastmod = sub_sitemap.get('lastmod')
-                
-                # Record sub-sitemap metadata
-                if sitemap_file_records is not None and sub_lastmod:
-                    # Update the parent record or create a pre-record for this sub-sitemap
-                    logger.debug(f"Sub-sitemap {sub_url} has lastmod: {sub_lastmod}")
-            else:
-                sub_url = sub_sitemap
-            
-            if sub_url:
-                all_page_urls_from_this_branch.extend(
-                    process_single_sitemap_url(
-                        sitemap_url=sub_url,
-                        fetcher=fetcher,
-                        parser=parser,
-                        processed_sitemap_urls=processed_sitemap_urls,
-                        domain=domain,
-                        sitemap_file_records=sitemap_file_records,
-                    )
-                )
+
+        # 4.2 Complete the sitemap record now that we know the type and count
+        warnings = _protocol_check(sitemap_url, len(sub_sitemaps), body.size)
+        if sitemap_record is not None:
+            sitemap_record["sitemap_type"] = "sitemapindex"
+            sitemap_record["url_count"] = len(sub_sitemaps)
+            sitemap_record["protocol_warnings"] = warnings
+            if sitemap_file_records is not None:
+                sitemap_file_records.append(sitemap_record)
+        run_metrics.record_sitemap(sitemap_url, type="sitemapindex", children=len(sub_sitemaps))
+
+        # Handle both old format (string) and new format (dict with loc/lastmod)
+        children = [
+            sub if isinstance(sub, dict) else {"loc": sub, "lastmod": None} for sub in sub_sitemaps
+        ]
+        children = [c for c in children if c.get('loc')]
+        for child in children:
+            if child.get('lastmod'):
+                logger.debug(f"Sub-sitemap {child['loc']} has lastmod: {child['lastmod']}")
+        if schedule is not None and sitemap_record is not None:
+            schedule.record_parsed(sitemap_url, sitemap_record, children=children)
+
+        yield from _walk_children([c['loc'] for c in children])
             
     elif parsed_data["type"] == "urlset":
-        page_urls_in_set = parsed_data.get("urls", []) or []
-        logger.info(f"URL set {sitemap_url} contains {len(page_urls_in_set)} page URLs.")
+        url_count = 0
+        changefreqs: Dict[str, int] = {}
         
         # 4.3 TAG EACH URL WITH ITS SOURCE SITEMAP
-        for entry in page_urls_in_set:
-            if isinstance(entry, dict):
-                entry["sitemap_source_url"] = sitemap_url
-        
-        all_page_urls_from_this_branch.extend(page_urls_in_set)
+        for batch in parsed_data["batches"]:
+            batch["sitemap_source_url"] = sitemap_url
+            url_count += len(batch)
+            if "changefreq" in batch.columns:
+                for freq, n in batch["changefreq"].value_counts().items():
+                    changefreqs[freq] = changefreqs.get(freq, 0) + n
+            yield batch
+        body.close()
+
+        logger.info(f"URL set {sitemap_url} contains {url_count} page URLs.")
+        run_metrics.record_sitemap(sitemap_url, type="urlset", urls=url_count)
+        warnings = _protocol_check(sitemap_url, url_count, body.size)
+        if sitemap_record is not None:
+            sitemap_record["sitemap_type"] = "urlset"
+            sitemap_record["url_count"] = url_count
+            sitemap_record["protocol_warnings"] = warnings
+            # Declared change frequency of most of its URLs (change-rate prior)
+            sitemap_record["changefreq"] = max(changefreqs, key=changefreqs.get) if changefreqs else None
+            if sitemap_file_records is not None:
+                sitemap_file_records.append(sitemap_record)
+            if schedule is not None:
+                schedule.record_parsed(sitemap_url, sitemap_record)
         
     elif parsed_data["type"] == "error":
         logger.error(f"Error parsing sitemap {sitemap_url}: {parsed_data.get('error_message')}")
+        if sitemap_record is not None and sitemap_file_records is not None:
+            sitemap_record["sitemap_type"] = "error"
+            sitemap_file_records.append(sitemap_record)
     else:
         logger.warning(f"Unknown sitemap type '{parsed_data['type']}' for {sitemap_url}.")
 
+
+def process_single_sitemap_url(
+    sitemap_url: str,
+    fetcher: SitemapFetcher,
+    parser: SitemapParser,
+    processed_sitemap_urls: set,
+    domain: str,
+    sitemap_file_records: Optional[List[Dict[str, Any]]] = None,
+) -> list:
+    """
+    4.4 Fetch and parse a single sitemap URL into a list of URL dicts.
+    
+    Materializing wrapper around iter_sitemap_url_batches, kept for
+    callers that want the whole list (small sitemaps, ad-hoc scripts).
+    
+    Returns:
+        List of page URL dictionaries with sitemap_source_url field
+    """
+    all_page_urls_from_this_branch = []
+    for batch in iter_sitemap_url_batches(
+        sitemap_url=sitemap_url,
+        fetcher=fetcher,
+        parser=parser,
+        processed_sitemap_urls=processed_sitemap_urls,
+        domain=domain,
+        sitemap_file_records=sitemap_file_records,
+    ):
+        all_page_urls_from_this_branch.extend(
+            batch.astype(object).where(batch.notna(), None).to_dict('records')
+        )
     return all_page_urls_from_this_branch
 
 
@@ -320,6 +758,10 @@ def process_domain(
     config: Dict[str, Any],
     data_processor: DataProcessor,
     stealth_config: Dict[str, Any],
+    fetcher: Optional[SitemapFetcher] = None,
+    schedule: Optional[SitemapSchedule] = None,
+    slots: Optional[WorkerSlots] = None,
+    pool: Optional[SitemapWorkPool] = None,
 ) -> Tuple[str, Dict[str, Any]]:
     """
     4.5 Process a single domain (designed for concurrent execution).
@@ -328,7 +770,14 @@ def process_domain(
         target: Target configuration dictionary
         config: Global configuration dictionary
         data_processor: DataProcessor instance (thread-safe for different domains)
-        stealth_config: Stealth/timing settings
+        stealth_config: Stealth/timing settings (startup jitter is the caller's, see StartQueue)
+        fetcher: Optional warm SitemapFetcher to reuse (daemon mode)
+        schedule: Optional per-sitemap poll state (daemon mode). Without one,
+            the domain's schedule is loaded in batch mode (history only)
+        slots: Optional WorkerSlots shared by the pool; held while the
+            domain works, handed back while it only waits on retries
+        pool: Optional sitemap pool shared by all domains; child sitemaps
+            are fetched there, parse / diff / write stay on this thread
         
     Returns:
         Tuple of (domain, result_dict) for aggregation
@@ -342,85 +791,487 @@ def process_domain(
     if sitemap_url and not sitemap_urls:
         sitemap_urls = [sitemap_url]
     
-    try:
-        # 4.5.1 Skip jitter for Bankrate (own property) and when disabled
-        is_bankrate = any(bd in domain for bd in BANKRATE_DOMAINS)
-        jitter_enabled = stealth_config.get("enabled", False) and not is_bankrate
+    prefetch = None
+    with domain_context(domain), domain_profile(domain, config.get("profiling")), (slots or nullcontext()):
+        # Timed from the slot acquire: queueing for a slot is not the domain's cost (see planner)
+        started = time.monotonic()
+        try:
+            # 4.5.1 Startup jitter is applied by the dispatcher (StartQueue), not here
+            logger.info(f"Processing domain: {domain}, sitemaps: {len(sitemap_urls)}")
+
+            # 4.5.2 Create fetcher with appropriate user agent and target-specific settings
+            sitemap_fetcher = fetcher or build_fetcher(target, config)
+            sitemap_parser = SitemapParser()
+
+            # 4.5.3 Collect sitemap file metadata
+            processed_sitemap_urls_for_domain = set()
+            sitemap_file_records: List[Dict[str, Any]] = []
+            # 4.5.3.1 Per-sitemap change history (batch runs fetch everything
+            # unless a fetch_budget is set; the daemon passes its own schedule)
+            if schedule is None:
+                schedule = SitemapSchedule(
+                    domain, data_processor.schedule_path(domain), scheduler_settings(config, target),
+                    use_intervals=False,
+                )
+            schedule.begin_crawl()
+            carried = set() if data_processor.can_carry_forward(domain) else None
+            limits = DomainLimits.for_target(target, config)
+            retries = RetryQueue.for_config(config, max_attempts=sitemap_fetcher.max_retries)
+            if pool is not None:
+                prefetch = SitemapPrefetch(pool, sitemap_fetcher, domain, defer_retries=True)
+
+            # 4.5.4 Stream page URL batches from all sitemaps (recursively)
+            def _domain_batches() -> Iterator[pd.DataFrame]:
+                walk = dict(
+                    fetcher=sitemap_fetcher,
+                    parser=sitemap_parser,
+                    processed_sitemap_urls=processed_sitemap_urls_for_domain,
+                    domain=domain,
+                    sitemap_file_records=sitemap_file_records,
+                    batch_size=data_processor.chunk_rows,
+                    schedule=schedule,
+                    carried=carried,
+                    limits=limits,
+                    retries=retries,
+                    prefetch=prefetch,
+                )
+                for sm_url in sitemap_urls:
+                    logger.info(f"Fetching sitemap: {sm_url}")
+                    yield from iter_sitemap_url_batches(sitemap_url=sm_url, **walk)
+                    for due_url in retries.pop_due():
+                        yield from iter_sitemap_url_batches(sitemap_url=due_url, **walk)
+                # 4.5.4.1 Files still waiting on a retry; the thread sleeps but gives its slot back
+                while retries:
+                    wait = retries.seconds_until_due()
+                    if wait > 0:
+                        logger.info(f"{domain}: {len(retries)} sitemaps waiting on retries ({wait:.1f}s)")
+                        with slots.released() if slots is not None else nullcontext():
+                            time.sleep(wait)
+                    for due_url in retries.pop_due():
+                        yield from iter_sitemap_url_batches(sitemap_url=due_url, **walk)
+                # Page URLs of sitemap files that were not parsed this time
+                if carried:
+                    yield from data_processor.iter_snapshot_batches(domain, carried)
+
+            url_count = 0
+
+            def _counted(batches: Iterator[pd.DataFrame]) -> Iterator[pd.DataFrame]:
+                nonlocal url_count
+                for batch in batches:
+                    url_count += len(batch)
+                    limits.add_urls(len(batch))
+                    yield batch
+
+            # 4.5.5 Peek the first non-empty batch - an empty crawl must not diff
+            # (it would mark every known URL as removed)
+            batches = _counted(_domain_batches())
+            first_batch = next((b for b in batches if not b.empty), None)
+            if first_batch is None:
+                logger.warning(f"No page URLs found for {domain}. Skipping.")
+                if sitemap_file_records:
+                    data_processor.save_sitemap_metadata(domain, sitemap_file_records)
+                if schedule is not None:
+                    data_processor.save_schedule(domain, schedule)
+                return (domain, {"status": "warning", "message": "No URLs found"})
+
+            # 4.5.6 Log sample for diagnostics
+            sample = first_batch['loc'].head(1)
+            sample_class = data_processor.url_classifier.classify(domain, sample).iloc[0]
+            logger.debug(f"Sample URL: {sample.iloc[0]}, section: {sample_class['section']}")
+
+            # 4.5.7 Process URLs and track changes (fetch, parse and diff interleave)
+            data_processor.process_url_batches(domain, itertools.chain([first_batch], batches))
+
+            logger.info(f"Gathered {url_count} page URLs for {domain}")
+            logger.info(f"Processed {len(sitemap_file_records)} sitemap files for {domain}")
+
+            # 4.5.8 Save sitemap file metadata
+            if sitemap_file_records:
+                data_processor.save_sitemap_metadata(domain, sitemap_file_records)
+            if schedule is not None:
+                data_processor.save_schedule(domain, schedule)
+
+            logger.info(f"Completed processing for domain: {domain}")
+            return (domain, {
+                "status": "success", "urls": url_count, "elapsed_seconds": round(time.monotonic() - started, 1),
+            })
         
-        if jitter_enabled:
-            jitter_seconds = calculate_startup_jitter(domain, stealth_config)
-            if jitter_seconds > 0:
-                logger.info(f"Startup jitter: {jitter_seconds}s for {domain}")
-                time.sleep(jitter_seconds)
-
-        logger.info(f"Processing domain: {domain}, sitemaps: {len(sitemap_urls)}")
-
-        # 4.5.2 Create fetcher with appropriate user agent and target-specific settings
-        user_agent = get_user_agent(config, domain)
-        fetcher_config = {
-            **config,
-            "user_agent": user_agent,
-            "timeout": target.get("fetch_timeout", target.get("timeout", config.get("timeout", 30))),
-            "download_delay": target.get("download_delay", config.get("download_delay", 1.5)),
-        }
-        sitemap_fetcher = SitemapFetcher(config=fetcher_config)
-        sitemap_parser = SitemapParser()
-
-        # 4.5.3 Collect sitemap file metadata
-        processed_sitemap_urls_for_domain = set()
-        sitemap_file_records: List[Dict[str, Any]] = []
-
-        # 4.5.4 Recursively fetch all page URLs from all sitemaps
-        all_page_url_dicts = []
-        for sm_url in sitemap_urls:
-            logger.info(f"Fetching sitemap: {sm_url}")
-            urls_from_sitemap = process_single_sitemap_url(
-                sitemap_url=sm_url,
-                fetcher=sitemap_fetcher,
-                parser=sitemap_parser,
-                processed_sitemap_urls=processed_sitemap_urls_for_domain,
-                domain=domain,
-                sitemap_file_records=sitemap_file_records,
+        except CrawlLimitExceeded as e:
+            # 4.5.9 A byte / URL cap aborts the domain before the diff writes anything
+            logger.error(f"Aborted {domain}: {e}")
+            run_metrics.incr("limit_aborts")
+            if schedule is not None:
+                schedule.load()
+            return (domain, {"status": "error", "message": f"Limit exceeded: {e}"})
+
+        except Exception as e:
+            # 4.5.10 Log error but don't crash - return error result
+            logger.error(f"FAILED processing domain {domain}: {type(e).__name__}: {e}")
+            logger.exception("Full traceback:")
+            if schedule is not None:
+                schedule.load()  # nothing was saved: forget this crawl's fetches
+            return (domain, {"status": "error", "message": str(e)})
+
+        finally:
+            # Bodies fetched ahead for a crawl that ended early
+            if prefetch is not None:
+                prefetch.close()
+
+
+def _domain_worker(
+    target: Dict[str, Any],
+    config: Dict[str, Any],
+    data_dir: str,
+    stealth_config: Dict[str, Any],
+    summary_queue,
+) -> None:
+    """
+    4.6 Process-pool entry point: run one domain in its own process.
+    
+    Builds per-process DataProcessor, fetcher and parser instances and
+    reports back only a small summary dict over summary_queue, never
+    DataFrames.
+    """
+    domain = target.get("domain")
+    started = time.monotonic()
+    try:
+        section_rules = {domain: target["sections"]} if target.get("sections") else None
+        data_processor = DataProcessor(
+            data_dir=data_dir, diff_config=config.get("diff", {}), section_rules=section_rules
+        )
+        with SitemapWorkPool.for_config(config) or nullcontext() as pool:
+            domain, result = process_domain(target, config, data_processor, stealth_config, pool=pool)
+    except BaseException as e:
+        result = {"status": "error", "message": f"{type(e).__name__}: {e}"}
+    result["elapsed_seconds"] = round(time.monotonic() - started, 1)
+    result["pid"] = os.getpid()
+    result["metrics"] = run_metrics.snapshot(domain)
+    summary_queue.put((domain, result))
+
+
+def run_domains_in_processes(
+    targets: List[Dict[str, Any]],
+    config: Dict[str, Any],
+    data_dir: str,
+    stealth_config: Dict[str, Any],
+    max_workers: int,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    4.7 Run domains in separate processes, at most max_workers at a time.
+    
+    One short-lived process per domain: lxml parsing and pandas diffing
+    use their own interpreter (no GIL contention), and a domain that
+    crashes its process (segfault, OOM kill) is reported as a failure
+    without taking down the other domains.
+    
+    Returns:
+        Dict of domain -> summary dict
+    """
+    ctx = multiprocessing.get_context(config.get("process_start_method"))
+    summary_queue = ctx.Queue()
+    domain_timeout = config.get("domain_timeout_seconds")
+    starts = StartQueue.for_targets(targets, stealth_config)
+    pending: List[Dict[str, Any]] = []
+    running: Dict[str, Tuple[Any, float]] = {}
+    results: Dict[str, Dict[str, Any]] = {}
+
+    def _drain(timeout: float) -> None:
+        try:
+            while True:
+                domain, result = summary_queue.get(timeout=timeout)
+                run_metrics.merge(domain, result.pop("metrics", {}))
+                results[domain] = result
+                logger.info(f"Finished {domain}: {result.get('status')} (pid {result.get('pid')})")
+                timeout = 0.05
+        except queue.Empty:
+            pass
+
+    while starts or pending or running:
+        # 4.7.1 Keep max_workers processes busy with domains whose start time has come
+        pending.extend(starts.pop_ready())
+        while pending and len(running) < max_workers:
+            target = pending.pop(0)
+            proc = ctx.Process(
+                target=_domain_worker,
+                args=(target, config, data_dir, stealth_config, summary_queue),
+                name=f"domain-{target.get('domain')}",
             )
-            all_page_url_dicts.extend(urls_from_sitemap)
+            proc.start()
+            running[target.get("domain")] = (proc, time.monotonic())
 
-        if not all_page_url_dicts:
-            logger.warning(f"No page URLs found for {domain}. Skipping.")
-            return (domain, {"status": "warning", "message": "No URLs found"})
+        # 4.7.2 Collect summaries
+        _drain(timeout=0.5)
 
-        logger.info(f"Gathered {len(all_page_url_dicts)} page URLs for {domain}")
-        logger.info(f"Processed {len(sitemap_file_records)} sitemap files for {domain}")
+        # 4.7.3 Reap finished, crashed and timed-out workers
+        for domain, (proc, started) in list(running.items()):
+            if domain in results:
+                proc.join()
+                del running[domain]
+            elif not proc.is_alive():
+                _drain(timeout=0.5)
+                if domain not in results:
+                    logger.error(f"Worker for {domain} died (exit code {proc.exitcode})")
+                    results[domain] = {
+                        "status": "error",
+                        "message": f"worker process crashed (exit code {proc.exitcode})",
+                    }
+                proc.join()
+                del running[domain]
+            elif domain_timeout and time.monotonic() - started > domain_timeout:
+                logger.error(f"Worker for {domain} exceeded {domain_timeout}s, terminating")
+                proc.terminate()
+                proc.join()
+                results[domain] = {"status": "error", "message": f"timed out after {domain_timeout}s"}
+                del running[domain]
 
-        # 4.5.5 Save sitemap file metadata
-        if sitemap_file_records:
-            data_processor.save_sitemap_metadata(domain, sitemap_file_records)
+    summary_queue.close()
+    return results
 
-        # 4.5.6 Log sample for diagnostics
-        if all_page_url_dicts:
-            sample = all_page_url_dicts[0]
-            logger.debug(f"Sample URL: {sample.get('loc')}, section: {sample.get('section')}")
 
-        # 4.5.7 Process URLs and track changes
-        urls_df = data_processor.process_sitemap_urls(domain, all_page_url_dicts)
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    """
+    4.8 Command-line options (all optional; config.json stays the default source).
+    """
+    parser = argparse.ArgumentParser(description="XML sitemap monitor")
+    parser.add_argument(
+        "--executor", choices=["thread", "process"],
+        help="Run domains in threads (default) or in separate processes",
+    )
+    parser.add_argument("--workers", type=int, help="Max concurrent domains (overrides max_concurrent_domains)")
+    parser.add_argument("--config", help=f"Config file path (default: {CONFIG_FILE_PATH})")
+    parser.add_argument(
+        "--shard", metavar="i/N",
+        help="Process only the targets owned by shard i of N (0-based, consistent hashing on domain)",
+    )
+    parser.add_argument("--run-id", help="Run id shared by all shards (default: UTC date)")
+    parser.add_argument(
+        "--merge-shards", metavar="RUN_ID",
+        help="Coordinator: merge shard summaries of RUN_ID instead of crawling",
+    )
+    parser.add_argument(
+        "--shard-dirs", nargs="+", metavar="DIR",
+        help="Output directories of the shards to merge (default: data_directory)",
+    )
+    parser.add_argument(
+        "--report", metavar="PATH",
+        help="Run report JSON path (default: <data_directory>/_runs/<run_id>/report.json)",
+    )
+    parser.add_argument("--prometheus-textfile", metavar="PATH", help="Also write metrics as a Prometheus .prom file")
+    parser.add_argument(
+        "--profile", action="store_true",
+        help="cProfile each domain (<data_directory>/_runs/<run_id>/profiles/<domain>.pstats)",
+    )
+    parser.add_argument(
+        "--profile-memory", action="store_true",
+        help="tracemalloc each domain (<data_directory>/_runs/<run_id>/profiles/<domain>.memory.txt)",
+    )
+    parser.add_argument(
+        "--plan", action="store_true",
+        help="Dry run: print predicted requests and wall time per domain (from run history) and exit",
+    )
+    parser.add_argument(
+        "--daemon", action="store_true",
+        help="Run continuously, re-crawling each sitemap file on its own adaptive interval",
+    )
+    return parser.parse_args(argv)
 
-        logger.info(f"Completed processing for domain: {domain}")
-        return (domain, {"status": "success", "urls": len(all_page_url_dicts)})
-        
-    except Exception as e:
-        # 4.5.8 Log error but don't crash - return error result
-        logger.error(f"FAILED processing domain {domain}: {type(e).__name__}: {e}")
-        logger.exception("Full traceback:")
-        return (domain, {"status": "error", "message": str(e)})
+
+def _daemon_targets(config: Dict[str, Any]) -> List[Dict[str, Any]]:
+    """Enabled targets with a domain and at least one sitemap URL (configured or discovered)."""
+    targets = [
+        t for t in config.get("targets", [])
+        if t.get("domain") and (t.get("sitemap_url") or t.get("sitemap_urls") or needs_discovery(t))
+        and t.get("enabled") is not False
+    ]
+    return resolve_discovered_targets(config, targets)
+
+
+def _target_roots(target: Dict[str, Any]) -> List[str]:
+    return target.get("sitemap_urls") or [target["sitemap_url"]]
+
+
+def _daemon_data_processor(config: Dict[str, Any]) -> DataProcessor:
+    section_rules = {
+        t["domain"]: t["sections"] for t in config.get("targets", []) if t.get("domain") and t.get("sections")
+    }
+    return DataProcessor(
+        data_dir=config.get("data_directory", "output"),
+        diff_config=config.get("diff", {}),
+        section_rules=section_rules,
+    )
+
+
+def _daemon_fetcher(
+    fetchers: Dict[str, SitemapFetcher], target: Dict[str, Any], config: Dict[str, Any]
+) -> SitemapFetcher:
+    """
+    The domain's warm fetcher, rebuilt when robots.txt no longer allows its
+    user agent (the robots cache refetches the file once its entry expires).
+    """
+    domain = target["domain"]
+    fetcher = fetchers.get(domain)
+    host = robots_host(config, domain)
+    if fetcher is not None and host is not None and get_robots_checker(
+        config.get("robots_cache_path")
+    ).is_bot_blocked(host, fetcher.user_agent):
+        logger.warning(f"Daemon: robots.txt of {host} now blocks {fetcher.user_agent[:50]}..., new user agent")
+        fetcher = None
+    if fetcher is None:
+        fetcher = fetchers[domain] = build_fetcher(target, config)
+    return fetcher
+
+
+def _daemon_crawl(
+    target: Dict[str, Any],
+    config: Dict[str, Any],
+    data_processor: DataProcessor,
+    fetchers: Dict[str, SitemapFetcher],
+    schedule: SitemapSchedule,
+    pool: Optional[SitemapWorkPool],
+) -> Tuple[str, Dict[str, Any]]:
+    """One daemon crawl on a worker thread (robots.txt is re-checked there, not in the dispatcher)."""
+    fetcher = _daemon_fetcher(fetchers, target, config)
+    return process_domain(
+        target, config, data_processor, {"enabled": False}, fetcher=fetcher, schedule=schedule, pool=pool,
+    )
 
 
-def main():
+def run_daemon(
+    args: argparse.Namespace,
+    stop_event: Optional[threading.Event] = None,
+) -> Dict[str, Dict[str, Any]]:
+    """
+    4.9 Long-running scheduler: re-crawl each domain when one of its sitemap
+    files is due (see scheduler), until stop_event is set.
+    
+    Kept warm between crawls: one fetcher (HTTP connection pool, chosen
+    user agent) per domain, rebuilt if robots.txt starts blocking its user
+    agent, the robots.txt checkers, the DataProcessor
+    (URL classifier cache) and each domain's schedule. The config file is
+    reloaded when it changes on disk. Startup jitter is skipped: crawl
+    times already follow each domain's own intervals.
+    
+    Returns:
+        Dict of domain -> result of its last crawl
+    """
+    stop_event = stop_event or threading.Event()
+    config_path = args.config or CONFIG_FILE_PATH
+    config = load_config(config_path)
+    if not config:
+        logger.error("Failed to load configuration. Exiting.")
+        return {}
+    config_mtime = os.path.getmtime(config_path)
+    data_processor = _daemon_data_processor(config)
+    fetchers: Dict[str, SitemapFetcher] = {}
+    schedules: Dict[str, SitemapSchedule] = {}
+    running: Dict[str, Any] = {}
+    last_results: Dict[str, Dict[str, Any]] = {}
+    max_workers = args.workers or config.get("max_concurrent_domains", 4)
+    prefetch_robots(config, [t for t in config.get("targets", []) if t.get("enabled") is not False])
+    logger.info(f"Daemon: {len(_daemon_targets(config))} targets, {max_workers} workers")
+
+    executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="daemon")
+    pool = SitemapWorkPool.for_config(config)
+    try:
+        while not stop_event.is_set():
+            # 4.9.1 Reload config when the file changes (workers stay as started)
+            try:
+                mtime = os.path.getmtime(config_path)
+            except OSError:
+                mtime = config_mtime
+            if mtime != config_mtime:
+                config_mtime = mtime
+                new_config = load_config(config_path)
+                if new_config:
+                    config = new_config
+                    data_processor = _daemon_data_processor(config)
+                    fetchers.clear()
+                    for target in config["targets"]:
+                        if target.get("domain") in schedules:
+                            schedules[target["domain"]].settings = scheduler_settings(config, target)
+                    logger.info(f"Daemon: reloaded {config_path} ({len(_daemon_targets(config))} targets)")
+                else:
+                    logger.error(f"Daemon: invalid {config_path}, keeping the previous configuration")
+
+            # 4.9.2 Collect finished crawls
+            for domain, future in list(running.items()):
+                if not future.done():
+                    continue
+                del running[domain]
+                try:
+                    _, result = future.result()
+                except Exception as e:
+                    result = {"status": "error", "message": str(e)}
+                last_results[domain] = result
+                # A crawl that found nothing (or failed) is retried after a growing backoff
+                if result.get("status") == "success":
+                    schedules[domain].record_success()
+                else:
+                    retry_at = schedules[domain].record_failure()
+                    logger.warning(f"Daemon: {domain} backed off for {retry_at - time.time():.0f}s")
+                logger.info(f"Daemon: {domain} {result.get('status')}, schedule {schedules[domain].summary()}")
+                _write_daemon_report(args, config, last_results)
+
+            # 4.9.3 Start due domains (one crawl per domain at a time)
+            now = time.time()
+            next_wake = now + float(scheduler_settings(config)["tick_seconds"])
+            for target in _daemon_targets(config):
+                domain = target["domain"]
+                if domain in running:
+                    continue
+                schedule = schedules.get(domain)
+                if schedule is None:
+                    schedule = schedules[domain] = SitemapSchedule(
+                        domain, data_processor.schedule_path(domain), scheduler_settings(config, target)
+                    )
+                due_at = schedule.domain_next_due(_target_roots(target))
+                if due_at > now:
+                    next_wake = min(next_wake, due_at)
+                    continue
+                run_metrics.reset_domain(domain)
+                running[domain] = executor.submit(
+                    _daemon_crawl, target, config, data_processor, fetchers, schedule, pool,
+                )
+
+            # 4.9.4 Sleep until the next file is due (poll running crawls every second)
+            wait = next_wake - time.time()
+            if running:
+                wait = min(wait, 1.0)
+            stop_event.wait(max(wait, 0.05))
+    finally:
+        logger.info(f"Daemon: stopping, waiting for {len(running)} running crawls")
+        executor.shutdown(wait=True)
+        if pool is not None:
+            pool.shutdown()
+        for domain, future in running.items():
+            try:
+                last_results[domain] = future.result()[1]
+            except Exception as e:
+                last_results[domain] = {"status": "error", "message": str(e)}
+        if running:
+            _write_daemon_report(args, config, last_results)
+    return last_results
+
+
+def _write_daemon_report(args: argparse.Namespace, config: Dict[str, Any], results: Dict[str, Dict[str, Any]]) -> None:
+    """Rewrite the daemon's run report (last crawl of each domain)."""
+    metrics_config = config.get("metrics", {})
+    report = run_metrics.report(results, extra={"run_id": "daemon", "executor": "daemon"})
+    write_report(report, args.report or metrics_config.get("report_path") or os.path.join(
+        run_dir(config.get("data_directory", "output"), "daemon"), "report.json"))
+    prometheus_path = args.prometheus_textfile or metrics_config.get("prometheus_textfile")
+    if prometheus_path:
+        write_prometheus_textfile(report, prometheus_path)
+
+
+def main(args: Optional[argparse.Namespace] = None):
     """
     5.0 Main function to orchestrate the sitemap processing pipeline.
     
     Flow:
     1. Load configuration
     2. For each target domain (if scheduled):
-       a. Apply optional jitter delay
+       a. Wait for its start time (optional jitter)
        b. Recursively fetch all sitemap URLs
        c. Tag each URL with its source sitemap
        d. Process and detect changes
@@ -432,7 +1283,14 @@ def main():
     logger.info("=" * 60)
 
     # 5.1 Load configuration
-    config = load_config()
+    args = args or parse_args([])
+    if args.daemon:
+        # 5.1.1 Scheduler mode: run until SIGINT / SIGTERM
+        stop_event = threading.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(sig, lambda signum, frame: stop_event.set())
+        return run_daemon(args, stop_event)
+    config = load_config(args.config or CONFIG_FILE_PATH)
     if not config:
         logger.error("Failed to load configuration. Exiting.")
         return
@@ -441,20 +1299,54 @@ def main():
     data_dir = config.get("data_directory", "output")
     os.makedirs(data_dir, exist_ok=True)
 
-    data_processor = DataProcessor(data_dir=data_dir)
+    # 5.2.1 Coordinator mode: merge shard results, no crawling
+    if args.merge_shards:
+        merged = merge_shards(
+            data_dir,
+            args.merge_shards,
+            shard_dirs=args.shard_dirs,
+            expected_domains=[t.get("domain") for t in config.get("targets", []) if t.get("domain")],
+        )
+        return merged
+
+    # 5.2.2 Shard mode: own a consistent-hash slice of the targets
+    started_at = datetime.now(timezone.utc)
+    run_id = args.run_id or default_run_id(started_at)
+    run_metrics.reset()
+    shard = parse_shard_spec(args.shard) if args.shard else None
+    all_targets = config.get("targets", [])
+    if shard:
+        all_targets = select_shard_targets(all_targets, *shard)
+        config = {**config, "robots_cache_path": shard_robots_cache_path(data_dir, *shard)}
+        logger.info(f"{shard_label(*shard)}: {len(all_targets)} of {len(config['targets'])} targets")
+
+    section_rules = {
+        t["domain"]: t["sections"] for t in config.get("targets", []) if t.get("domain") and t.get("sections")
+    }
+    data_processor = DataProcessor(
+        data_dir=data_dir, diff_config=config.get("diff", {}), section_rules=section_rules
+    )
     
     # Get stealth/timing settings
     stealth_config = config.get("stealth", {})
 
+    # 5.2.3 Optional per-domain profiles (passed to workers via config)
+    profiling = profiling_settings(
+        args.profile, args.profile_memory, os.path.join(run_dir(data_dir, run_id), "profiles")
+    )
+    if profiling:
+        config = {**config, "profiling": profiling}
+        logger.info(f"Profiling enabled (cpu={args.profile}, memory={args.profile_memory}): {profiling['dir']}")
+
     # 5.3 Filter targets to process
     targets_to_process = []
-    for target in config.get("targets", []):
+    for target in all_targets:
         domain = target.get("domain")
         # Support both single sitemap_url and array of sitemap_urls
         sitemap_url = target.get("sitemap_url")
         sitemap_urls = target.get("sitemap_urls", [])
         
-        has_sitemaps = sitemap_url or sitemap_urls
+        has_sitemaps = sitemap_url or sitemap_urls or needs_discovery(target)
         if not domain or not has_sitemaps:
             logger.warning(f"Skipping target with missing domain or sitemap_url(s): {target}")
             continue
@@ -463,33 +1355,77 @@ def main():
             continue
             
         targets_to_process.append(target)
-    
+
+    # 5.3.0 Dry run: predicted per-domain cost and makespan, nothing fetched
+    max_workers = args.workers or config.get("max_concurrent_domains", 4)
+    planner = planner_settings(config)
+    if args.plan:
+        plan = plan_domains(
+            data_dir, targets_to_process, max_workers, offsets=lambda ts: start_offsets(ts, stealth_config)
+        )
+        print(format_plan(plan))
+        return plan
+
+    # 5.3.1 Resolve robots.txt for all domains at once (workers only read the cache)
+    prefetch_robots(config, targets_to_process)
+
+    # 5.3.2 Discover sitemap roots for domain-only targets (uses the robots cache)
+    targets_to_process = resolve_discovered_targets(config, targets_to_process)
     logger.info(f"Processing {len(targets_to_process)} domains")
+
+    # 5.3.3 Longest predicted domains first, so a big one does not set the tail
+    if planner["enabled"] and len(targets_to_process) > 1:
+        plan = plan_domains(
+            data_dir, targets_to_process, max_workers, offsets=lambda ts: start_offsets(ts, stealth_config)
+        )
+        targets_to_process = [e["target"] for e in plan["estimates"]]
+        logger.info(
+            f"Longest-first order, predicted {plan['makespan']:.0f}s "
+            f"(config order {plan['config_order_makespan']:.0f}s)"
+        )
     
     # 5.4 Process domains concurrently (configurable worker count)
     # Default: 4 workers for balance of speed vs resource usage
     # Can scale to 6-8 for 40+ domains
-    max_workers = config.get("max_concurrent_domains", 4)
+    executor_mode = args.executor or config.get("executor", "thread")
     domain_results = {}
+
+    # 5.4.1 Output files are written behind the crawl by one writer thread
+    # (process workers write their own domain, synchronously)
+    writer = WriteBehind.for_config(config) if executor_mode != "process" else None
+    data_processor.writer = writer
     
     if len(targets_to_process) == 0:
         logger.warning("No domains to process")
+    elif executor_mode == "process":
+        # Separate processes: CPU-bound parse/diff scales across cores
+        logger.info(f"Using {max_workers} worker processes")
+        domain_results = run_domains_in_processes(
+            targets_to_process, config, data_dir, stealth_config, max_workers
+        )
     elif len(targets_to_process) == 1 or max_workers == 1:
-        # Single domain or sequential mode - no threading overhead
-        for target in targets_to_process:
-            domain, result = process_domain(target, config, data_processor, stealth_config)
-            domain_results[domain] = result
-            logger.info("-" * 40)
+        # Single domain or sequential mode - no domain threads, child sitemaps still use the pool
+        with SitemapWorkPool.for_config(config) or nullcontext() as pool:
+            for target in StartQueue.for_targets(targets_to_process, stealth_config):
+                domain, result = process_domain(target, config, data_processor, stealth_config, pool=pool)
+                domain_results[domain] = result
+                logger.info("-" * 40)
     else:
         # Concurrent processing with ThreadPoolExecutor
+        # Slots cap the working domains; spare threads let a domain that only
+        # waits on retries park without holding one of the max_workers
         logger.info(f"Using {max_workers} concurrent workers")
-        with ThreadPoolExecutor(max_workers=max_workers) as executor:
-            # Submit all domain processing tasks
+        slots = WorkerSlots(max_workers)
+        pool_size = min(len(targets_to_process), max_workers * 4)
+        # Child sitemaps of every domain share one fetch pool (per-host caps)
+        with SitemapWorkPool.for_config(config) or nullcontext() as pool, \
+                ThreadPoolExecutor(max_workers=pool_size) as executor:
+            # Submit each domain once its start time comes (jitter never holds a worker)
             future_to_domain = {
                 executor.submit(
-                    process_domain, target, config, data_processor, stealth_config
+                    process_domain, target, config, data_processor, stealth_config, slots=slots, pool=pool
                 ): target.get("domain")
-                for target in targets_to_process
+                for target in StartQueue.for_targets(targets_to_process, stealth_config)
             }
             
             # Collect results as they complete
@@ -502,6 +1438,14 @@ def main():
                 except Exception as e:
                     logger.error(f"Unexpected error for {domain}: {e}")
                     domain_results[domain] = {"status": "error", "message": str(e)}
+
+    # 5.4.2 Drain the writer; a domain whose files failed to write is a failure
+    if writer is not None:
+        for domain, errors in writer.close().items():
+            domain_results[domain] = {
+                **domain_results.get(domain, {}), "status": "error", "message": f"Write failed: {errors[0]}",
+            }
+        data_processor.writer = None
     
     # 5.5 Summary of domain results
     logger.info("=" * 60)
@@ -515,19 +1459,55 @@ def main():
         else:
             logger.error(f"  [FAIL] {domain}: {result.get('message', 'failed')}")
 
+    # 5.6 Shard summary for the coordinator
+    if shard:
+        write_shard_summary(
+            data_dir,
+            run_id,
+            *shard,
+            assigned=[t.get("domain") for t in all_targets],
+            domain_results=domain_results,
+            started_at=started_at,
+        )
+
+    # 5.7 Run report: per-domain stage timings, bytes, retries, URLs/s
+    metrics_config = config.get("metrics", {})
+    report = run_metrics.report(domain_results, extra={
+        "run_id": run_id,
+        "shard": shard_label(*shard) if shard else None,
+        "executor": executor_mode,
+        "workers": max_workers,
+    })
+    report_name = f"report.{shard_label(*shard)}.json" if shard else "report.json"
+    write_report(report, args.report or metrics_config.get("report_path") or os.path.join(
+        run_dir(data_dir, run_id), report_name))
+    prometheus_path = args.prometheus_textfile or metrics_config.get("prometheus_textfile")
+    if prometheus_path:
+        write_prometheus_textfile(report, prometheus_path)
+    if planner["enabled"]:
+        record_runs(data_dir, report, domain_results, history_runs=planner["history_runs"])
+    stage_totals = ", ".join(
+        f"{name} {stage['seconds']:.1f}s" for name, stage in sorted(report["totals"]["stages"].items())
+    )
+    logger.info(f"Stage totals: {stage_totals or 'none'}")
+
     logger.info("=" * 60)
     logger.info("Sitemap processing pipeline completed")
     logger.info("=" * 60)
+    return domain_results
 
 
 if __name__ == "__main__":
     # 6.0 Entry point - handle running from different directories
+    cli_args = parse_args()
     script_dir = os.path.dirname(os.path.abspath(__file__))
     project_root = os.path.dirname(script_dir)
 
     potential_config_path = os.path.join(project_root, CONFIG_FILE_PATH)
 
-    if os.getcwd() == script_dir and os.path.exists(potential_config_path):
+    if cli_args.config:
+        pass  # Explicit config path - run where we were started
+    elif os.getcwd() == script_dir and os.path.exists(potential_config_path):
         logger.info(f"Running from src/, changing CWD to project root: {project_root}")
         os.chdir(project_root)
     elif not os.path.exists(CONFIG_FILE_PATH):
@@ -537,4 +1517,4 @@ if __name__ == "__main__":
         else:
             logger.warning(f"Config file not found in CWD or project root. load_config might fail.")
 
-    main()
+    main(cli_args)
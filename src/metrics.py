@@ -0,0 +1,325 @@
+"""
+1.0 Metrics Module
+Lightweight per-stage timers and counters for the monitoring pipeline.
+
+Key features:
+- Stage timers are exclusive within a thread: a nested stage (e.g. fetch
+  inside diff, because sitemaps stream into the diff) pauses its parent.
+  Work done for a domain on other threads (sitemap pool fetches,
+  write-behind writes) overlaps its own, so a domain's stage total is
+  busy time and can exceed its wall time
+- Everything is keyed by the current domain, set once per worker with
+  `domain_context`; deep calls (fetcher, parser) need no extra arguments
+- Per-sitemap records (bytes, fetch time, URL count, status)
+- Machine-readable JSON run report and optional Prometheus textfile
+  (node_exporter textfile collector format)
+- Process workers ship a snapshot back; the parent merges it
+
+Stages:
+    fetch      SitemapFetcher.fetch_sitemap_bytes (incl. retries, stealth)
+    fetch_wait domain thread waiting on a child fetched by the sitemap pool
+    parse      sitemap parsing (streamed batches)
+    diff       change detection in DataProcessor
+    all_time   DataProcessor._update_all_time_live
+    write      snapshot / change-log writes (inline, or on the write-behind thread)
+    write_wait domain thread blocked on a full write-behind queue or its barrier
+    status     url_status_checker HEAD checks
+"""
+
+import functools
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 1.1 Domain used when no domain context is set
+UNSCOPED = "_global"
+PROMETHEUS_PREFIX = "sitemap_monitor"
+
+_local = threading.local()
+
+
+def current_domain() -> str:
+    return getattr(_local, "domain", None) or UNSCOPED
+
+
+@contextmanager
+def domain_context(domain: str) -> Iterator[None]:
+    """
+    2.1 Attribute metrics recorded in this thread to a domain.
+    """
+    previous = getattr(_local, "domain", None)
+    _local.domain = domain
+    try:
+        yield
+    finally:
+        _local.domain = previous
+
+
+def _empty_domain() -> Dict[str, Any]:
+    return {"stages": {}, "counters": {}, "sitemaps": {}}
+
+
+class RunMetrics:
+    """
+    3.0 RunMetrics Class
+    Thread-safe accumulator for one run (one process).
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self) -> None:
+        """
+        3.1 Start a new run.
+        """
+        with self._lock:
+            self.started_at = datetime.now(timezone.utc)
+            self._started = time.perf_counter()
+            self._domains: Dict[str, Dict[str, Any]] = {}
+
+    def reset_domain(self, domain: str) -> None:
+        """
+        3.1.1 Forget one domain's metrics (daemon mode: report its last crawl only).
+        """
+        with self._lock:
+            self._domains.pop(domain, None)
+
+    def _domain(self, domain: str) -> Dict[str, Any]:
+        return self._domains.setdefault(domain, _empty_domain())
+
+    # -- recording ---------------------------------------------------------
+
+    @contextmanager
+    def stage(self, name: str, domain: Optional[str] = None) -> Iterator[None]:
+        """
+        3.2 Time a stage; time spent in nested stages is not counted here.
+        """
+        domain = domain or current_domain()
+        stack = getattr(_local, "stack", None)
+        if stack is None:
+            stack = _local.stack = []
+        frame = {"children": 0.0}
+        stack.append(frame)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            stack.pop()
+            if stack:
+                stack[-1]["children"] += elapsed
+            self.add_stage_time(domain, name, elapsed - frame["children"])
+
+    def timed_iter(self, name: str, iterator: Iterator[Any]) -> Iterator[Any]:
+        """
+        3.3 Time each pull from a lazy iterator (e.g. streamed parse batches).
+        """
+        iterator = iter(iterator)
+        while True:
+            with self.stage(name):
+                try:
+                    item = next(iterator)
+                except StopIteration:
+                    return
+            yield item
+
+    def add_stage_time(self, domain: str, name: str, seconds: float, calls: int = 1) -> None:
+        with self._lock:
+            stage = self._domain(domain)["stages"].setdefault(name, {"seconds": 0.0, "calls": 0})
+            stage["seconds"] += seconds
+            stage["calls"] += calls
+
+    def incr(self, counter: str, n: float = 1, domain: Optional[str] = None) -> None:
+        """
+        3.4 Add to a per-domain counter (bytes_downloaded, retries, ...).
+        """
+        domain = domain or current_domain()
+        with self._lock:
+            counters = self._domain(domain)["counters"]
+            counters[counter] = counters.get(counter, 0) + n
+
+    def record_sitemap(self, sitemap_url: str, domain: Optional[str] = None, **fields: Any) -> None:
+        """
+        3.5 Merge fields into the record for one sitemap file.
+        Numeric fields accumulate (a sitemap fetched twice counts twice).
+        """
+        domain = domain or current_domain()
+        with self._lock:
+            record = self._domain(domain)["sitemaps"].setdefault(sitemap_url, {})
+            for key, value in fields.items():
+                if isinstance(value, (int, float)) and not isinstance(value, bool) and key in record:
+                    record[key] += value
+                else:
+                    record[key] = value
+
+    # -- process workers ---------------------------------------------------
+
+    def snapshot(self, domain: str) -> Dict[str, Any]:
+        """
+        3.6 Plain-dict copy of one domain's metrics (picklable).
+        """
+        with self._lock:
+            return json.loads(json.dumps(self._domains.get(domain, _empty_domain())))
+
+    def merge(self, domain: str, snapshot: Dict[str, Any]) -> None:
+        """
+        3.7 Fold a worker process snapshot into this run.
+        """
+        for name, stage in snapshot.get("stages", {}).items():
+            self.add_stage_time(domain, name, stage["seconds"], stage["calls"])
+        for counter, value in snapshot.get("counters", {}).items():
+            self.incr(counter, value, domain=domain)
+        for url, record in snapshot.get("sitemaps", {}).items():
+            self.record_sitemap(url, domain=domain, **record)
+
+    # -- reporting ---------------------------------------------------------
+
+    def report(
+        self,
+        domain_results: Optional[Dict[str, Dict[str, Any]]] = None,
+        extra: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        """
+        3.8 Build the run report.
+
+        Args:
+            domain_results: domain -> result dict from the run (status, urls)
+            extra: Additional top-level fields (run_id, shard, ...)
+        """
+        domain_results = domain_results or {}
+        with self._lock:
+            domains = json.loads(json.dumps(self._domains))
+            wall = time.perf_counter() - self._started
+
+        totals: Dict[str, Any] = {"stages": {}, "counters": {}, "urls": 0}
+        report_domains = {}
+        for domain in sorted(set(domains) | set(domain_results)):
+            data = domains.get(domain, _empty_domain())
+            result = domain_results.get(domain, {})
+            stage_seconds = sum(s["seconds"] for s in data["stages"].values())
+            urls = int(result.get("urls") or result.get("urls_checked") or 0)
+            for name, stage in data["stages"].items():
+                stage["seconds"] = round(stage["seconds"], 3)
+                total = totals["stages"].setdefault(name, {"seconds": 0.0, "calls": 0})
+                total["seconds"] = round(total["seconds"] + stage["seconds"], 3)
+                total["calls"] += stage["calls"]
+            for counter, value in data["counters"].items():
+                totals["counters"][counter] = totals["counters"].get(counter, 0) + value
+            totals["urls"] += urls
+            report_domains[domain] = {
+                "status": result.get("status"),
+                "urls": urls,
+                "seconds": round(stage_seconds, 3),
+                "urls_per_sec": round(urls / stage_seconds) if urls and stage_seconds else None,
+                "stages": data["stages"],
+                "counters": data["counters"],
+                "sitemaps": [{"url": url, **record} for url, record in data["sitemaps"].items()],
+            }
+
+        return {
+            **(extra or {}),
+            "started_at": self.started_at.isoformat(),
+            "finished_at": datetime.now(timezone.utc).isoformat(),
+            "wall_seconds": round(wall, 3),
+            "urls_per_sec": round(totals["urls"] / wall) if totals["urls"] and wall else None,
+            "totals": totals,
+            "domains": report_domains,
+        }
+
+
+def _atomic_write(path: str, text: str) -> None:
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        f.write(text)
+    os.replace(tmp_path, path)
+
+
+def write_report(report: Dict[str, Any], path: str) -> str:
+    """
+    4.1 Write the JSON run report.
+    """
+    _atomic_write(path, json.dumps(report, indent=2, default=str))
+    logger.info(f"Wrote run report: {path}")
+    return path
+
+
+def _label(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def prometheus_text(report: Dict[str, Any], job: str = "sitemap_monitor") -> str:
+    """
+    4.2 Render a run report in Prometheus text exposition format.
+    """
+    p = PROMETHEUS_PREFIX
+    lines: List[str] = []
+
+    def metric(name: str, kind: str, help_text: str, samples: List[tuple]) -> None:
+        lines.append(f"# HELP {p}_{name} {help_text}")
+        lines.append(f"# TYPE {p}_{name} {kind}")
+        for labels, value in samples:
+            label_str = ",".join(f'{k}="{_label(v)}"' for k, v in {"job": job, **labels}.items())
+            lines.append(f"{p}_{name}{{{label_str}}} {value}")
+
+    domains = report.get("domains", {})
+    metric("run_duration_seconds", "gauge", "Wall time of the last run", [({}, report.get("wall_seconds", 0))])
+    metric("run_finished_timestamp_seconds", "gauge", "Unix time the last run finished",
+           [({}, round(datetime.fromisoformat(report["finished_at"]).timestamp()))])
+    metric("stage_seconds", "gauge", "Exclusive time per pipeline stage in the last run", [
+        ({"domain": d, "stage": s}, v["seconds"])
+        for d, data in domains.items() for s, v in sorted(data["stages"].items())
+    ])
+    metric("stage_calls", "gauge", "Calls per pipeline stage in the last run", [
+        ({"domain": d, "stage": s}, v["calls"])
+        for d, data in domains.items() for s, v in sorted(data["stages"].items())
+    ])
+    metric("urls", "gauge", "Page URLs seen in the last run", [
+        ({"domain": d}, data["urls"]) for d, data in domains.items()
+    ])
+    metric("domain_success", "gauge", "1 if the domain's last run succeeded", [
+        ({"domain": d}, 1 if data.get("status") == "success" else 0) for d, data in domains.items()
+    ])
+    counters = sorted({c for data in domains.values() for c in data["counters"]})
+    for counter in counters:
+        metric(counter, "gauge", f"{counter.replace('_', ' ').capitalize()} in the last run", [
+            ({"domain": d}, data["counters"][counter])
+            for d, data in domains.items() if counter in data["counters"]
+        ])
+    return "\n".join(lines) + "\n"
+
+
+def write_prometheus_textfile(report: Dict[str, Any], path: str, job: str = "sitemap_monitor") -> str:
+    """
+    4.3 Write a .prom file for the node_exporter textfile collector (atomic).
+    """
+    _atomic_write(path, prometheus_text(report, job=job))
+    logger.info(f"Wrote Prometheus textfile: {path}")
+    return path
+
+
+# 5.0 Process-wide metrics for the current run
+run_metrics = RunMetrics()
+
+
+def timed(stage: str) -> Callable:
+    """
+    5.1 Decorator: record each call of the function as a stage of run_metrics.
+    """
+    def decorator(func: Callable) -> Callable:
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with run_metrics.stage(stage):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
@@ -0,0 +1,217 @@
+"""
+1.0 Planner Module
+Per-domain run history and longest-first domain scheduling.
+
+Key features:
+- After every batch run, each domain's wall time, sitemap requests,
+  sitemap files and URL count are appended to its history (last
+  `history_runs` runs kept)
+- Predicted duration is the median of the domain's recent successful
+  runs, so one slow or aborted run does not reorder the whole schedule
+- A domain without history is predicted at the longest known duration:
+  it may be huge, and starting an unknown domain early costs little
+- Longest processing time first (LPT): domains are handed to the pool in
+  descending predicted duration. Simulating the pool's greedy list
+  scheduling over the workers gives the predicted makespan (LPT is
+  within 4/3 of the optimal assignment)
+- Start offsets (startup jitter) are part of the simulation: a domain
+  cannot start before its offset, so the plan shows the makespan the
+  run will actually see
+- `--plan` prints the predictions and the makespan without fetching
+
+Config:
+    "planner": {"enabled": true, "history_runs": 10}
+
+Layout:
+    output/<domain>/<domain>_runs.json
+"""
+
+import heapq
+import json
+import logging
+import os
+from datetime import datetime, timezone
+from statistics import median
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# 1.1 Defaults for the `planner` config block
+DEFAULT_PLANNER_CONFIG = {
+    "enabled": True,
+    "history_runs": 10,
+}
+
+
+def planner_settings(config: Dict[str, Any]) -> Dict[str, Any]:
+    return {**DEFAULT_PLANNER_CONFIG, **(config.get("planner") or {})}
+
+
+def history_path(data_dir: str, domain: str) -> str:
+    return os.path.join(data_dir, domain, f"{domain}_runs.json")
+
+
+def load_history(data_dir: str, domain: str) -> List[Dict[str, Any]]:
+    """
+    2.1 A domain's recorded runs, oldest first (empty if none yet).
+    """
+    path = history_path(data_dir, domain)
+    if not os.path.exists(path):
+        return []
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            return json.load(f).get("runs", [])
+    except (OSError, ValueError) as e:
+        logger.warning(f"Could not read run history {path}: {e}")
+        return []
+
+
+def record_runs(
+    data_dir: str,
+    report: Dict[str, Any],
+    domain_results: Dict[str, Dict[str, Any]],
+    history_runs: int = 10,
+) -> int:
+    """
+    2.2 Append this run's per-domain figures to each domain's history.
+
+    Args:
+        data_dir: Output directory (per-domain folders)
+        report: Run report (see metrics.RunMetrics.report)
+        domain_results: domain -> result dict of this run
+        history_runs: Runs kept per domain
+
+    Returns:
+        Number of domains recorded
+    """
+    finished_at = report.get("finished_at") or datetime.now(timezone.utc).isoformat()
+    recorded = 0
+    for domain, result in domain_results.items():
+        data = report.get("domains", {}).get(domain, {})
+        seconds = result.get("elapsed_seconds") or data.get("seconds")
+        if not seconds:
+            continue
+        run = {
+            "finished_at": finished_at,
+            "status": result.get("status"),
+            "seconds": round(float(seconds), 3),
+            "requests": int(data.get("counters", {}).get("http_requests", 0)),
+            "sitemaps": len(data.get("sitemaps", [])),
+            "urls": int(data.get("urls") or 0),
+        }
+        runs = (load_history(data_dir, domain) + [run])[-history_runs:]
+        path = history_path(data_dir, domain)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"domain": domain, "runs": runs}, f, indent=2)
+        os.replace(tmp_path, path)
+        recorded += 1
+    return recorded
+
+
+def estimate_domains(data_dir: str, targets: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    3.1 Predicted seconds, requests and URLs per target, from its history.
+
+    Returns:
+        One estimate per target, in target order; `runs` is the number of
+        successful runs behind it (0 = no history, predicted as the
+        longest known domain)
+    """
+    estimates = []
+    for target in targets:
+        domain = target.get("domain")
+        runs = [r for r in load_history(data_dir, domain) if r.get("status") == "success"]
+        estimate = {"domain": domain, "runs": len(runs), "target": target}
+        for field in ("seconds", "requests", "sitemaps", "urls"):
+            estimate[field] = median(r.get(field, 0) for r in runs) if runs else None
+        estimates.append(estimate)
+
+    known = [e["seconds"] for e in estimates if e["seconds"] is not None]
+    for estimate in estimates:
+        if estimate["seconds"] is None:
+            estimate["seconds"] = max(known) if known else 0.0
+    return estimates
+
+
+def simulate(estimates: List[Dict[str, Any]], workers: int) -> float:
+    """
+    3.2 Greedy list scheduling in the given order: each domain starts on the
+    first free worker, not before its `offset`. Sets `worker`, `start` and
+    `finish` on each estimate.
+
+    Returns:
+        Predicted makespan (seconds)
+    """
+    free = [(0.0, worker) for worker in range(max(1, workers))]
+    heapq.heapify(free)
+    makespan = 0.0
+    for estimate in estimates:
+        free_at, worker = heapq.heappop(free)
+        start = max(free_at, estimate.get("offset", 0.0))
+        finish = start + estimate["seconds"]
+        estimate.update(worker=worker, start=start, finish=finish)
+        heapq.heappush(free, (finish, worker))
+        makespan = max(makespan, finish)
+    return makespan
+
+
+def plan_domains(
+    data_dir: str,
+    targets: List[Dict[str, Any]],
+    workers: int,
+    offsets: Optional[Callable[[List[Dict[str, Any]]], List[float]]] = None,
+) -> Dict[str, Any]:
+    """
+    3.3 Longest-first order and its predicted makespan (vs. config order).
+
+    Args:
+        data_dir: Output directory (per-domain folders)
+        targets: Targets to run
+        workers: Concurrent domains
+        offsets: targets (in dispatch order) -> start offset per target
+            (see main.start_offsets); no offsets when omitted
+
+    Returns:
+        {"estimates": [...] in LPT order, "makespan", "config_order_makespan", "workers"}
+    """
+    def with_offsets(estimates: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        starts = offsets([e["target"] for e in estimates]) if offsets else [0.0] * len(estimates)
+        return [{**e, "offset": float(start)} for e, start in zip(estimates, starts)]
+
+    estimates = estimate_domains(data_dir, targets)
+    config_order_makespan = simulate(with_offsets(estimates), workers)
+    # Stable sort: equal predictions keep config order
+    ordered = with_offsets(sorted(estimates, key=lambda e: e["seconds"], reverse=True))
+    makespan = simulate(ordered, workers)
+    return {
+        "estimates": ordered,
+        "makespan": makespan,
+        "config_order_makespan": config_order_makespan,
+        "workers": workers,
+    }
+
+
+def format_plan(plan: Dict[str, Any]) -> str:
+    """
+    3.4 Plain-text table for `--plan`.
+    """
+    def num(value: Optional[float], fmt: str) -> str:
+        return "-" if value is None else format(value, fmt)
+
+    lines = [
+        f"{'domain':<32} {'runs':>4} {'requests':>9} {'sitemaps':>8} {'urls':>10} {'seconds':>9} "
+        f"{'offset':>6} {'worker':>6} {'start':>8} {'finish':>8}"
+    ]
+    for e in plan["estimates"]:
+        lines.append(
+            f"{e['domain']:<32} {e['runs']:>4} {num(e['requests'], ',.0f'):>9} {num(e['sitemaps'], ',.0f'):>8} "
+            f"{num(e['urls'], ',.0f'):>10} {e['seconds']:>9.1f} {e.get('offset', 0.0):>6.0f} {e['worker']:>6} "
+            f"{e['start']:>8.1f} {e['finish']:>8.1f}"
+        )
+    lines.append(
+        f"Predicted wall time with {plan['workers']} workers: {plan['makespan']:.1f}s longest-first "
+        f"({plan['config_order_makespan']:.1f}s in config order)"
+    )
+    return "\n".join(lines)
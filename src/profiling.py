@@ -0,0 +1,189 @@
+"""
+1.0 Profiling Module
+On-demand CPU (cProfile) and memory (tracemalloc) profiles per domain.
+
+Key features:
+- `--profile` / `--profile-memory` on main.py and url_status_checker.py
+- One profile per domain: <domain>.pstats (load with pstats or snakeviz),
+  <domain>.cpu.txt (top functions) and <domain>.memory.txt (top allocations)
+- Settings travel in the config dict, so thread and process workers
+  profile themselves; nothing is imported or enabled when profiling is off
+
+Notes:
+- cProfile hooks only the thread that enables it, so thread-pool domains
+  get separate CPU profiles
+- tracemalloc is process-wide: under the thread pool a domain's memory
+  report also contains allocations of domains running at the same time
+  (the report says so). Use `--executor process` or `--workers 1` for
+  clean per-domain memory reports
+"""
+
+import itertools
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Optional
+
+logger = logging.getLogger(__name__)
+
+# 1.1 Report sizes
+DEFAULT_TOP = 30
+DEFAULT_MEMORY_FRAMES = 1
+
+_tracemalloc_lock = threading.Lock()
+# Profiled blocks currently tracing: id -> True once another block overlapped
+_tracemalloc_active: Dict[int, bool] = {}
+_tracemalloc_tokens = itertools.count()
+
+
+def profiling_settings(
+    cpu: bool, memory: bool, output_dir: str, top: int = DEFAULT_TOP
+) -> Optional[Dict[str, Any]]:
+    """
+    2.1 Build the `profiling` config entry (None when both are off).
+    """
+    if not cpu and not memory:
+        return None
+    return {"cpu": cpu, "memory": memory, "dir": output_dir, "top": top}
+
+
+def _safe_name(domain: str) -> str:
+    return "".join(c if c.isalnum() or c in ".-_" else "_" for c in domain)
+
+
+def _start_tracemalloc(frames: int) -> int:
+    """
+    2.2 Start tracemalloc unless another profiled domain already has.
+    """
+    import tracemalloc
+
+    with _tracemalloc_lock:
+        if not _tracemalloc_active and not tracemalloc.is_tracing():
+            tracemalloc.start(frames)
+        token = next(_tracemalloc_tokens)
+        _tracemalloc_active[token] = False
+        if len(_tracemalloc_active) > 1:
+            for other in _tracemalloc_active:
+                _tracemalloc_active[other] = True
+        return token
+
+
+def _stop_tracemalloc(token: int) -> bool:
+    """
+    2.3 Stop tracemalloc after the last profiled domain; True if others overlapped this one.
+    """
+    import tracemalloc
+
+    with _tracemalloc_lock:
+        shared = _tracemalloc_active.pop(token)
+        if not _tracemalloc_active:
+            tracemalloc.stop()
+        return shared
+
+
+def _write_cpu_report(profiler, base: str, domain: str, top: int) -> None:
+    import io
+    import pstats
+
+    profiler.dump_stats(f"{base}.pstats")
+    out = io.StringIO()
+    stats = pstats.Stats(profiler, stream=out)
+    out.write(f"CPU profile: {domain}\n\n")
+    stats.sort_stats("cumulative").print_stats(top)
+    stats.sort_stats("tottime").print_stats(top)
+    with open(f"{base}.cpu.txt", "w", encoding="utf-8") as f:
+        f.write(out.getvalue())
+
+
+def _write_memory_report(before, after, peak: int, shared: bool, base: str, domain: str,
+                         seconds: float, top: int) -> None:
+    import tracemalloc
+
+    # Leave out the profilers' own bookkeeping
+    ignore = [
+        tracemalloc.Filter(False, tracemalloc.__file__),
+        tracemalloc.Filter(False, "*/cProfile.py"),
+        tracemalloc.Filter(False, "<frozen importlib._bootstrap*"),
+    ]
+    before, after = before.filter_traces(ignore), after.filter_traces(ignore)
+    growth = after.compare_to(before, "lineno")
+    retained = after.statistics("lineno")
+    lines = [
+        f"Memory profile: {domain}",
+        f"Wall time: {seconds:.1f}s",
+        f"Peak traced memory: {peak / 1e6:.1f} MB",
+        f"Net growth: {sum(s.size_diff for s in growth) / 1e6:+.1f} MB",
+    ]
+    if shared:
+        lines.append("NOTE: other domains were traced in this process at the same time; "
+                     "their allocations are included (use --executor process for per-domain numbers)")
+    lines += ["", f"Top {top} allocation sites by growth during the domain:"]
+    lines += [f"  {s}" for s in growth[:top]]
+    lines += ["", f"Top {top} allocation sites still held at the end:"]
+    lines += [f"  {s}" for s in retained[:top]]
+    with open(f"{base}.memory.txt", "w", encoding="utf-8") as f:
+        f.write("\n".join(lines) + "\n")
+
+
+@contextmanager
+def domain_profile(domain: str, settings: Optional[Dict[str, Any]]) -> Iterator[None]:
+    """
+    3.0 Profile the enclosed block for one domain when settings ask for it.
+
+    Args:
+        domain: Domain being processed (used for file names)
+        settings: `profiling` config entry from profiling_settings(), or None
+    """
+    # 3.1 Off: no profiler, no imports
+    if not settings:
+        yield
+        return
+
+    top = settings.get("top", DEFAULT_TOP)
+    os.makedirs(settings["dir"], exist_ok=True)
+    base = os.path.join(settings["dir"], _safe_name(domain))
+
+    # 3.2 Start profilers
+    profiler = None
+    if settings.get("cpu"):
+        import cProfile
+
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError as e:
+            # Python 3.12+ allows one active profiler per process
+            logger.warning(f"CPU profile skipped for {domain}: {e} (use --workers 1 or --executor process)")
+            profiler = None
+
+    tracing = bool(settings.get("memory"))
+    if tracing:
+        import tracemalloc
+
+        token = _start_tracemalloc(settings.get("memory_frames", DEFAULT_MEMORY_FRAMES))
+        tracemalloc.reset_peak()
+        before = tracemalloc.take_snapshot()
+
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        # 3.3 Stop and write reports (never fail the domain over a profile)
+        seconds = time.perf_counter() - started
+        if profiler is not None:
+            profiler.disable()
+        if tracing:
+            after = tracemalloc.take_snapshot()
+            peak = tracemalloc.get_traced_memory()[1]
+            shared = _stop_tracemalloc(token)
+        try:
+            if profiler is not None:
+                _write_cpu_report(profiler, base, domain, top)
+                logger.info(f"CPU profile for {domain}: {base}.pstats")
+            if tracing:
+                _write_memory_report(before, after, peak, shared, base, domain, seconds, top)
+                logger.info(f"Memory profile for {domain}: {base}.memory.txt")
+        except Exception as e:
+            logger.error(f"Could not write profile for {domain}: {type(e).__name__}: {e}")
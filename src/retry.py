@@ -0,0 +1,158 @@
+"""
+1.0 Retry Module
+Deferred retries for sitemap fetches: jittered backoff and a retry queue.
+
+Key features:
+- Retryable outcomes (429, 5xx, timeouts, dropped connections) are raised
+  as RetryableFetchError instead of being slept on inside the worker
+- Backoff is exponential with full jitter (uniform between 0 and
+  base * 2^attempt, capped), so hosts recovering from an outage are not
+  hit by every domain's retries at the same instant; Retry-After wins
+  when the server sends one
+- RetryQueue: per-crawl heap of files waiting to be fetched again. The
+  crawl keeps fetching other sitemap files and picks retries up once due.
+  When only retries are left the domain's thread still sleeps until the
+  next one is due; it gives its concurrency slot to another domain meanwhile
+- Budgets: `max_retries` attempts per request, `domain_budget` retries
+  per domain crawl (a host that is down does not soak up the run)
+
+Config:
+    "max_retries": 3,
+    "retry": {"base_seconds": 1, "max_seconds": 60, "domain_budget": 50}
+"""
+
+import heapq
+import itertools
+import logging
+import random
+import time
+from email.utils import parsedate_to_datetime
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 1.1 Responses worth another attempt
+RETRYABLE_STATUSES = frozenset({429, 500, 502, 503, 504})
+
+# 1.2 Defaults for the `retry` config block
+DEFAULT_RETRY_CONFIG = {
+    "base_seconds": 1.0,
+    "max_seconds": 60.0,
+    "domain_budget": 50,
+}
+
+
+class RetryableFetchError(Exception):
+    """A fetch failed in a way that may succeed later (429, 5xx, timeout, connection)."""
+
+    def __init__(self, url: str, reason: str, retry_after: Optional[float] = None):
+        super().__init__(f"{reason} fetching {url}")
+        self.url = url
+        self.reason = reason
+        self.retry_after = retry_after
+
+
+def retry_settings(config: Dict[str, Any]) -> Dict[str, Any]:
+    return {**DEFAULT_RETRY_CONFIG, **(config.get("retry") or {})}
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    2.1 Seconds to wait from a Retry-After header (delta-seconds or HTTP date).
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+def backoff_delay(
+    attempt: int,
+    base_seconds: float = 1.0,
+    max_seconds: float = 60.0,
+    retry_after: Optional[float] = None,
+    rng: Optional[random.Random] = None,
+) -> float:
+    """
+    2.2 Delay before retry number `attempt` (0-based): full jitter, capped.
+    """
+    ceiling = min(max_seconds, base_seconds * (2 ** attempt))
+    delay = (rng or random).uniform(0, ceiling)
+    if retry_after is not None:
+        delay = max(delay, min(retry_after, max_seconds))
+    return delay
+
+
+class RetryQueue:
+    """
+    3.0 RetryQueue Class
+    Files of one domain crawl waiting for another attempt, ordered by due time.
+    """
+
+    def __init__(
+        self,
+        max_attempts: int = 3,
+        base_seconds: float = 1.0,
+        max_seconds: float = 60.0,
+        domain_budget: Optional[int] = 50,
+        rng: Optional[random.Random] = None,
+    ):
+        self.max_attempts = max_attempts
+        self.base_seconds = base_seconds
+        self.max_seconds = max_seconds
+        self.domain_budget = domain_budget
+        self.rng = rng or random.Random()
+        self.attempts: Dict[str, int] = {}
+        self.scheduled = 0
+        self._heap: List[Tuple[float, int, str]] = []
+        self._seq = itertools.count()
+
+    @classmethod
+    def for_config(cls, config: Dict[str, Any], max_attempts: int) -> "RetryQueue":
+        settings = retry_settings(config)
+        return cls(
+            max_attempts=max_attempts,
+            base_seconds=float(settings["base_seconds"]),
+            max_seconds=float(settings["max_seconds"]),
+            domain_budget=settings["domain_budget"],
+        )
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def schedule(self, error: RetryableFetchError, now: Optional[float] = None) -> Optional[float]:
+        """
+        3.1 Queue a failed file for later; returns its delay, or None when a budget is spent.
+        """
+        url = error.url
+        attempt = self.attempts.get(url, 0)
+        if attempt >= self.max_attempts:
+            return None
+        if self.domain_budget is not None and self.scheduled >= self.domain_budget:
+            logger.warning(f"Retry budget ({self.domain_budget}) spent for this crawl, giving up on {url}")
+            return None
+        delay = backoff_delay(attempt, self.base_seconds, self.max_seconds, error.retry_after, self.rng)
+        self.attempts[url] = attempt + 1
+        self.scheduled += 1
+        heapq.heappush(self._heap, ((now if now is not None else time.monotonic()) + delay, next(self._seq), url))
+        return delay
+
+    def pop_due(self, now: Optional[float] = None) -> List[str]:
+        """
+        3.2 Remove and return every file whose retry is due.
+        """
+        now = now if now is not None else time.monotonic()
+        due = []
+        while self._heap and self._heap[0][0] <= now:
+            due.append(heapq.heappop(self._heap)[2])
+        return due
+
+    def seconds_until_due(self, now: Optional[float] = None) -> float:
+        if not self._heap:
+            return 0.0
+        return max(0.0, self._heap[0][0] - (now if now is not None else time.monotonic()))
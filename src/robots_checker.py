@@ -8,13 +8,19 @@ Usage:
     from src.robots_checker import RobotsChecker
     
     checker = RobotsChecker()
-    allowed_bots = checker.get_allowed_bots(domain, bot_list)
+    checker.prefetch(["www.example.com", "www.example.org"])  # concurrent, cache only
+    allowed_bots = checker.filter_allowed_bots(domain, bot_list)
 """
 
+import hashlib
 import logging
 import re
+import threading
+import time
 import requests
-from typing import Dict, List, Optional, Set
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, List, NamedTuple, Optional, Set, Tuple
 from urllib.parse import urlparse
 from datetime import datetime, timezone
 import json
@@ -26,6 +32,13 @@ logger = logging.getLogger(__name__)
 # Cache location for robots.txt data
 DEFAULT_CACHE_PATH = "output/robots_cache.json"
 
+# Prefetch: short timeout, many hosts at once
+PREFETCH_TIMEOUT = 5
+PREFETCH_WORKERS = 16
+
+# After a failed fetch (timeout, 5xx), don't retry a host for this long in-process
+FAILED_RETRY_SECONDS = 3600
+
 # =============================================================================
 # BOT NAME MAPPING
 # Maps user agent string patterns to robots.txt directive names
@@ -120,6 +133,80 @@ COMPLIANT_BOTS = {
 }
 
 
+# =============================================================================
+# PRECOMPILED MATCHING
+# =============================================================================
+
+# One automaton for every bot name: a zero-width lookahead per position
+# finds overlapping names in a single pass over the user agent
+_BOT_NAME_RE = re.compile(
+    "(?=(" + "|".join(re.escape(name) for name in sorted(BOT_NAME_PATTERNS, key=len, reverse=True)) + "))"
+)
+
+
+@lru_cache(maxsize=1024)
+def robot_names_for_ua(user_agent: str) -> FrozenSet[str]:
+    """
+    robots.txt agent names (lowercased) that govern a user agent string.
+    """
+    names = set()
+    for match in _BOT_NAME_RE.finditer(user_agent):
+        names.update(robot.lower() for robot in BOT_NAME_PATTERNS[match.group(1)])
+    return frozenset(names)
+
+
+class RobotsGroups(NamedTuple):
+    """Parsed robots.txt: rules per agent name, agents disallowed from "/", Sitemap lines."""
+    rules: Dict[str, List[Tuple[str, str]]]
+    blocked: FrozenSet[str]
+    sitemaps: Tuple[str, ...] = ()
+
+
+# Group directives kept per agent (others, e.g. Host, are ignored)
+GROUP_DIRECTIVES = ('allow', 'disallow', 'crawl-delay')
+
+
+def parse_robots_groups(robots_content: str) -> RobotsGroups:
+    """
+    Parse robots.txt into per-agent (directive, value) rules.
+    
+    Consecutive User-agent lines share the rules that follow them; a new
+    User-agent line after rules starts a new group. Sitemap lines belong
+    to no group and are collected in file order.
+    """
+    rules: Dict[str, List[Tuple[str, str]]] = {}
+    blocked = set()
+    sitemaps: List[str] = []
+    agents: List[str] = []
+    in_rules = False
+    
+    for line in robots_content.split('\n'):
+        line = line.split('#', 1)[0].strip()
+        if not line or ':' not in line:
+            continue
+        field, value = (part.strip() for part in line.split(':', 1))
+        field = field.lower()
+        
+        if field == 'user-agent':
+            if in_rules:
+                agents, in_rules = [], False
+            agents.append(value)
+            rules.setdefault(value, [])
+        elif field == 'sitemap':
+            if value and value not in sitemaps:
+                sitemaps.append(value)
+        elif field in GROUP_DIRECTIVES and agents:
+            in_rules = True
+            for agent in agents:
+                rules[agent].append((field, value))
+                # Disallow: / means entire site is blocked
+                if field == 'disallow' and value == '/':
+                    blocked.add(agent)
+                    logger.debug(f"Bot '{agent}' is fully blocked")
+    
+    return RobotsGroups(rules, frozenset(blocked), tuple(sitemaps))
+
+
 class RobotsChecker:
     """
     Check robots.txt to filter allowed bots.
@@ -127,10 +214,21 @@ class RobotsChecker:
     Caches robots.txt content to avoid repeated fetches.
     """
     
-    def __init__(self, cache_path: Optional[str] = None, cache_ttl_hours: int = 24):
+    def __init__(self, cache_path: Optional[str] = None, cache_ttl_hours: int = 24, history: bool = True):
         self.cache_path = Path(cache_path or DEFAULT_CACHE_PATH)
         self.cache_ttl_hours = cache_ttl_hours
         self.cache = self._load_cache()
+        # Content-addressed body history next to the cache (see robots_history)
+        self.history = None
+        if history:
+            from src.robots_history import history_for_cache
+            self.history = history_for_cache(str(self.cache_path))
+        self._lock = threading.Lock()
+        # domain -> time of the last failed fetch (not persisted)
+        self._failed_at: Dict[str, float] = {}
+        # domain -> (content, robots hash, blocked names); (domain, hash, UAs) -> allowed UAs
+        self._parsed: Dict[str, Tuple[Optional[str], str, FrozenSet[str]]] = {}
+        self._allowed: Dict[Tuple[str, str, Tuple[str, ...]], Tuple[str, ...]] = {}
         
     def _load_cache(self) -> Dict:
         """Load robots.txt cache from disk."""
@@ -143,16 +241,33 @@ class RobotsChecker:
         return {"domains": {}}
     
     def _save_cache(self):
-        """Save robots.txt cache to disk."""
+        """
+        Save robots.txt cache to disk.
+        
+        Other worker processes may have saved entries since this one loaded
+        the cache, so newer on-disk entries are merged in, and the file is
+        replaced atomically (readers never see a half-written cache).
+        """
         try:
             os.makedirs(self.cache_path.parent, exist_ok=True)
-            with open(self.cache_path, 'w') as f:
-                json.dump(self.cache, f, indent=2)
+            on_disk = self._load_cache().get("domains", {})
+            # One writer per process: worker threads share this checker
+            with self._lock:
+                for domain, entry in on_disk.items():
+                    mine = self.cache["domains"].get(domain)
+                    if mine is None or entry.get("fetched_at", "") > mine.get("fetched_at", ""):
+                        self.cache["domains"][domain] = entry
+                tmp_path = self.cache_path.with_name(f"{self.cache_path.name}.{os.getpid()}.tmp")
+                with open(tmp_path, 'w') as f:
+                    json.dump(self.cache, f, indent=2)
+                os.replace(tmp_path, self.cache_path)
         except Exception as e:
             logger.warning(f"Could not save robots cache: {e}")
     
     def _is_cache_valid(self, domain: str) -> bool:
-        """Check if cached robots.txt is still valid."""
+        """Check if cached robots.txt is still valid (or recently failed to fetch)."""
+        if time.monotonic() - self._failed_at.get(domain, float("-inf")) < FAILED_RETRY_SECONDS:
+            return True
         if domain not in self.cache["domains"]:
             return False
         
@@ -162,16 +277,19 @@ class RobotsChecker:
         
         return age_hours < self.cache_ttl_hours
     
-    def fetch_robots_txt(self, domain: str, timeout: int = 10) -> Optional[str]:
+    def fetch_robots_txt(self, domain: str, timeout: int = 10, save: bool = True) -> Optional[str]:
         """
         Fetch robots.txt for a domain.
         
-        Returns content string or None if failed.
+        Returns content string or None if failed. A 4xx answer (no
+        robots.txt) is cached like content; after a timeout or 5xx the
+        last cached copy, if any, is used and the host is not retried
+        for FAILED_RETRY_SECONDS.
         """
         # Check cache first
         if self._is_cache_valid(domain):
             logger.debug(f"Using cached robots.txt for {domain}")
-            return self.cache["domains"][domain].get("content")
+            return self.cache["domains"].get(domain, {}).get("content")
         
         url = f"https://{domain}/robots.txt"
         
@@ -181,27 +299,68 @@ class RobotsChecker:
                 timeout=timeout,
                 headers={"User-Agent": "Mozilla/5.0 (compatible; SitemapMonitor/1.0)"}
             )
-            
-            if response.status_code == 200:
-                content = response.text
-                
-                # Cache it
-                self.cache["domains"][domain] = {
-                    "content": content,
-                    "fetched_at": datetime.now(timezone.utc).isoformat(),
-                    "status_code": 200
-                }
-                self._save_cache()
-                
-                logger.info(f"Fetched robots.txt for {domain} ({len(content)} bytes)")
-                return content
-            else:
-                logger.warning(f"robots.txt for {domain} returned {response.status_code}")
-                return None
-                
         except Exception as e:
             logger.warning(f"Could not fetch robots.txt for {domain}: {e}")
-            return None
+            return self._fetch_failed(domain)
+
+        if response.status_code >= 500:
+            logger.warning(f"robots.txt for {domain} returned {response.status_code}")
+            return self._fetch_failed(domain)
+
+        content = response.text if response.status_code == 200 else None
+        with self._lock:
+            self.cache["domains"][domain] = {
+                "content": content,
+                "fetched_at": datetime.now(timezone.utc).isoformat(),
+                "status_code": response.status_code,
+            }
+            self._failed_at.pop(domain, None)
+        if save:
+            self._save_cache()
+        if self.history is not None:
+            try:
+                self.history.record(domain, content, response.status_code)
+            except Exception as e:
+                logger.warning(f"Could not record robots.txt history for {domain}: {e}")
+
+        if content is None:
+            logger.warning(f"robots.txt for {domain} returned {response.status_code}")
+        else:
+            logger.info(f"Fetched robots.txt for {domain} ({len(content)} bytes)")
+        return content
+
+    def _fetch_failed(self, domain: str) -> Optional[str]:
+        """Remember a failed fetch; fall back to the last cached copy (even if stale)."""
+        with self._lock:
+            self._failed_at[domain] = time.monotonic()
+        return self.cache["domains"].get(domain, {}).get("content")
+
+    def prefetch(
+        self,
+        domains: Iterable[str],
+        timeout: float = PREFETCH_TIMEOUT,
+        max_workers: int = PREFETCH_WORKERS,
+    ) -> int:
+        """
+        Fetch robots.txt for many hosts concurrently into the cache.
+        
+        Hosts with a valid cache entry are skipped; the cache file is
+        written once at the end. Afterwards, lookups for these hosts are
+        served from memory (fetched, cached 4xx, or recently failed).
+        
+        Returns:
+            Number of hosts fetched
+        """
+        stale = sorted({d for d in domains if d and not self._is_cache_valid(d)})
+        if not stale:
+            return 0
+        
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(stale)), thread_name_prefix="robots") as pool:
+            list(pool.map(lambda d: self.fetch_robots_txt(d, timeout=timeout, save=False), stale))
+        self._save_cache()
+        logger.info(f"Prefetched robots.txt for {len(stale)} hosts in {time.perf_counter() - start:.1f}s")
+        return len(stale)
     
     def parse_blocked_bots(self, robots_content: str) -> Set[str]:
         """
@@ -209,48 +368,42 @@ class RobotsChecker:
         
         A bot is considered "blocked" if it has Disallow: / (entire site).
         Partial blocks (like Disallow: /thmb/) are NOT considered blocked
-        since we're fetching sitemaps, not those paths.
+        since we're fetching sitemaps, not those paths. Consecutive
+        User-agent lines form one group that shares the rules below them.
         """
-        blocked = set()
-        current_agent = None
-        
-        for line in robots_content.split('\n'):
-            line = line.strip()
-            
-            # Skip comments and empty lines
-            if not line or line.startswith('#'):
-                continue
-            
-            # Parse User-agent directive
-            if line.lower().startswith('user-agent:'):
-                agent = line.split(':', 1)[1].strip()
-                current_agent = agent
-                continue
-            
-            # Parse Disallow directive
-            if line.lower().startswith('disallow:') and current_agent:
-                path = line.split(':', 1)[1].strip()
-                
-                # Disallow: / means entire site is blocked
-                if path == '/':
-                    blocked.add(current_agent)
-                    logger.debug(f"Bot '{current_agent}' is fully blocked")
-        
-        return blocked
+        return set(parse_robots_groups(robots_content).blocked)
     
-    def get_blocked_bots(self, domain: str) -> Set[str]:
+    def _blocked_names(self, domain: str) -> Tuple[str, FrozenSet[str]]:
         """
-        Get set of bot names that are blocked for a domain.
+        (robots hash, lowercased fully-blocked agent names) for a domain.
         
-        Fetches robots.txt (cached) and parses it.
+        robots.txt is parsed once per cache entry: the result is kept until
+        the cached content object changes (refetch, TTL expiry).
         """
         content = self.fetch_robots_txt(domain)
+        with self._lock:
+            memo = self._parsed.get(domain)
+        if memo is not None and memo[0] is content:
+            return memo[1], memo[2]
         
         if not content:
             # If we can't fetch robots.txt, assume nothing is blocked
-            return set()
+            digest, blocked = "", frozenset()
+        else:
+            digest = hashlib.sha1(content.encode("utf-8", "replace")).hexdigest()
+            blocked = frozenset(name.lower() for name in parse_robots_groups(content).blocked)
+        with self._lock:
+            self._parsed[domain] = (content, digest, blocked)
+        return digest, blocked
+    
+    def get_blocked_bots(self, domain: str) -> Set[str]:
+        """
+        Get set of bot names that are blocked for a domain.
         
-        return self.parse_blocked_bots(content)
+        Fetches robots.txt (cached) and parses it once per cache entry.
+        Names are lowercased (robots.txt agent matching is case-insensitive).
+        """
+        return set(self._blocked_names(domain)[1])
     
     def is_bot_blocked(self, domain: str, bot_ua: str) -> bool:
         """
@@ -263,26 +416,15 @@ class RobotsChecker:
         Returns:
             True if blocked, False if allowed
         """
-        blocked = self.get_blocked_bots(domain)
-        
-        if not blocked:
-            return False
-        
-        # Check if any of our bot name patterns match blocked bots
-        for pattern_name, robot_names in BOT_NAME_PATTERNS.items():
-            if pattern_name in bot_ua:
-                # This UA contains this bot name
-                for robot_name in robot_names:
-                    if robot_name in blocked:
-                        logger.debug(f"Bot '{pattern_name}' blocked by robots.txt ({robot_name})")
-                        return True
-        
-        return False
+        return bot_ua not in self.filter_allowed_bots(domain, [bot_ua])
     
     def filter_allowed_bots(self, domain: str, bot_uas: List[str]) -> List[str]:
         """
         Filter a list of bot user agents to only include allowed ones.
         
+        Memoized per (domain, robots hash, user agents): repeated calls
+        (e.g. per URL) cost a dict lookup.
+        
         Args:
             domain: The domain to check
             bot_uas: List of full user agent strings
@@ -290,30 +432,27 @@ class RobotsChecker:
         Returns:
             List of user agents that are NOT blocked by robots.txt
         """
-        blocked = self.get_blocked_bots(domain)
+        digest, blocked = self._blocked_names(domain)
         
         if not blocked:
             # Nothing blocked, return all
             return bot_uas
         
-        allowed = []
+        key = (domain, digest, tuple(bot_uas))
+        with self._lock:
+            allowed = self._allowed.get(key)
+        if allowed is not None:
+            return list(allowed)
+        
+        allowed = [ua for ua in bot_uas if not (robot_names_for_ua(ua) & blocked)]
         for ua in bot_uas:
-            is_blocked = False
-            
-            # Check each bot pattern
-            for pattern_name, robot_names in BOT_NAME_PATTERNS.items():
-                if pattern_name in ua:
-                    for robot_name in robot_names:
-                        if robot_name in blocked:
-                            is_blocked = True
-                            break
-                    if is_blocked:
-                        break
-            
-            if not is_blocked:
-                allowed.append(ua)
-            else:
+            if ua not in allowed:
                 logger.debug(f"Filtering out blocked UA: {ua[:50]}...")
+        with self._lock:
+            # Lists for the domain's previous robots.txt are no longer reachable
+            for stale in [k for k in self._allowed if k[0] == domain and k[1] != digest]:
+                del self._allowed[stale]
+            self._allowed[key] = tuple(allowed)
         
         logger.info(f"robots.txt filter: {len(allowed)}/{len(bot_uas)} bots allowed for {domain}")
         
@@ -0,0 +1,257 @@
+"""
+1.0 Robots History Module
+Content-addressed robots.txt history with structural diffs.
+
+Key features:
+- Every distinct robots.txt body is stored once, named by its SHA-1
+  (a 4xx "no robots.txt" is stored as the empty body)
+- Each host has a timeline of hash changes; a fetch that returns the
+  same body writes nothing, so storage grows only when robots.txt changes
+- Changes are diffed on the parsed rule sets (see robots_checker), per
+  User-agent group: Allow / Disallow added or removed, Crawl-delay
+  changed, Sitemap lines added or removed. Formatting, comment and
+  ordering edits produce no change rows
+- Diffs read stored blobs; nothing is re-fetched
+
+Layout:
+    output/_robots/blobs/<sha1>.txt          (one file per distinct body)
+    output/_robots/timeline/<host>.csv       (observed_at, content_hash, ...)
+    output/_robots/changes.csv               (one row per structural change)
+
+Usage:
+    py -m src.robots_history www.example.com          # timeline + last diff
+"""
+
+import argparse
+import hashlib
+import logging
+import os
+import threading
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional
+
+import pandas as pd
+
+from src.robots_checker import parse_robots_groups
+
+logger = logging.getLogger(__name__)
+
+# 1.1 Files
+HISTORY_DIR_NAME = "_robots"
+TIMELINE_COLUMNS = ["observed_at", "content_hash", "status_code", "size", "changes"]
+CHANGE_COLUMNS = [
+    "detected_at", "host", "agent", "directive", "change", "value", "old_value", "from_hash", "to_hash",
+]
+
+
+def content_hash(content: Optional[str]) -> str:
+    return hashlib.sha1((content or "").encode("utf-8", "replace")).hexdigest()
+
+
+def _safe_name(host: str) -> str:
+    return "".join(c if c.isalnum() or c in ".-_" else "_" for c in host)
+
+
+# =============================================================================
+# 2.0 STRUCTURAL DIFF
+# =============================================================================
+
+def diff_robots(old_content: Optional[str], new_content: Optional[str]) -> List[Dict[str, Any]]:
+    """
+    2.1 Rule-level changes between two robots.txt bodies.
+
+    Returns rows of {agent, directive, change, value, old_value}; change is
+    "added", "removed" or "changed" (Crawl-delay only). Sitemap rows have
+    an empty agent.
+    """
+    old = parse_robots_groups(old_content or "")
+    new = parse_robots_groups(new_content or "")
+    changes: List[Dict[str, Any]] = []
+
+    def row(agent, directive, change, value, old_value=None):
+        changes.append({
+            "agent": agent, "directive": directive, "change": change, "value": value, "old_value": old_value,
+        })
+
+    for agent in sorted(set(old.rules) | set(new.rules), key=str.lower):
+        before, after = old.rules.get(agent, []), new.rules.get(agent, [])
+        for directive in ("allow", "disallow"):
+            was = {v for d, v in before if d == directive}
+            now = {v for d, v in after if d == directive}
+            for value in sorted(now - was):
+                row(agent, directive, "added", value)
+            for value in sorted(was - now):
+                row(agent, directive, "removed", value)
+        was_delay = next((v for d, v in before if d == "crawl-delay"), None)
+        now_delay = next((v for d, v in after if d == "crawl-delay"), None)
+        if was_delay != now_delay:
+            change = "added" if was_delay is None else "removed" if now_delay is None else "changed"
+            row(agent, "crawl-delay", change, now_delay, was_delay)
+
+    for value in [s for s in new.sitemaps if s not in old.sitemaps]:
+        row("", "sitemap", "added", value)
+    for value in [s for s in old.sitemaps if s not in new.sitemaps]:
+        row("", "sitemap", "removed", value)
+    return changes
+
+
+# =============================================================================
+# 3.0 HISTORY STORE
+# =============================================================================
+
+class RobotsHistory:
+    """
+    3.0 RobotsHistory Class
+    Blob store plus per-host timelines under <data_dir>/_robots.
+    """
+
+    def __init__(self, root_dir: str):
+        self.root_dir = root_dir
+        self._lock = threading.Lock()
+        # host -> last recorded hash (read from the timeline once)
+        self._last_hash: Dict[str, Optional[str]] = {}
+
+    def blob_path(self, digest: str) -> str:
+        return os.path.join(self.root_dir, "blobs", f"{digest}.txt")
+
+    def timeline_path(self, host: str) -> str:
+        return os.path.join(self.root_dir, "timeline", f"{_safe_name(host)}.csv")
+
+    @property
+    def changes_path(self) -> str:
+        return os.path.join(self.root_dir, "changes.csv")
+
+    def load(self, digest: str) -> Optional[str]:
+        """
+        3.1 Body stored under a hash (None if unknown).
+        """
+        try:
+            with open(self.blob_path(digest), "r", encoding="utf-8") as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def timeline(self, host: str) -> pd.DataFrame:
+        """
+        3.2 A host's hash changes, oldest first.
+        """
+        path = self.timeline_path(host)
+        if not os.path.exists(path):
+            return pd.DataFrame(columns=TIMELINE_COLUMNS)
+        return pd.read_csv(path, dtype={"content_hash": str})
+
+    def last_hash(self, host: str) -> Optional[str]:
+        if host not in self._last_hash:
+            timeline = self.timeline(host)
+            self._last_hash[host] = None if timeline.empty else timeline["content_hash"].iloc[-1]
+        return self._last_hash[host]
+
+    def _write_blob(self, digest: str, content: str) -> None:
+        path = self.blob_path(digest)
+        if os.path.exists(path):
+            return
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+    @staticmethod
+    def _append(path: str, df: pd.DataFrame) -> None:
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        df.to_csv(path, mode="a", index=False, header=not os.path.exists(path))
+
+    def record(
+        self,
+        host: str,
+        content: Optional[str],
+        status_code: Optional[int] = 200,
+        observed_at: Optional[datetime] = None,
+    ) -> Optional[List[Dict[str, Any]]]:
+        """
+        3.3 Record a fetched body; returns its structural changes, or None if unchanged.
+
+        The first observation of a host returns an empty list (nothing to
+        diff against). A 4xx (content None) is recorded as the empty body.
+        """
+        body = content or ""
+        digest = content_hash(body)
+        with self._lock:
+            previous = self.last_hash(host)
+            if previous == digest:
+                return None
+
+            observed_at = observed_at or datetime.now(timezone.utc)
+            self._write_blob(digest, body)
+            changes = [] if previous is None else diff_robots(self.load(previous), body)
+            self._append(self.timeline_path(host), pd.DataFrame([{
+                "observed_at": observed_at.isoformat(),
+                "content_hash": digest,
+                "status_code": status_code,
+                "size": len(body),
+                "changes": len(changes),
+            }], columns=TIMELINE_COLUMNS))
+            if changes:
+                rows = pd.DataFrame(changes).assign(
+                    detected_at=observed_at.isoformat(), host=host, from_hash=previous, to_hash=digest,
+                )
+                self._append(self.changes_path, rows[CHANGE_COLUMNS])
+            self._last_hash[host] = digest
+
+        if changes:
+            summary = ", ".join(f"{c['change']} {c['directive']} {c['value'] or ''}".strip() for c in changes[:5])
+            more = f" (+{len(changes) - 5} more)" if len(changes) > 5 else ""
+            logger.warning(f"robots.txt changed for {host}: {summary}{more}")
+        elif previous is not None:
+            logger.info(f"robots.txt for {host} changed without rule changes")
+        return changes
+
+    def diff(self, host: str, from_hash: Optional[str] = None, to_hash: Optional[str] = None) -> List[Dict[str, Any]]:
+        """
+        3.4 Structural diff between two recorded versions (default: the last two).
+        """
+        hashes = list(self.timeline(host)["content_hash"])
+        if to_hash is None:
+            to_hash = hashes[-1] if hashes else None
+        if from_hash is None:
+            earlier = hashes[:hashes.index(to_hash)] if to_hash in hashes else []
+            from_hash = earlier[-1] if earlier else None
+        if to_hash is None:
+            return []
+        return diff_robots(self.load(from_hash) if from_hash else None, self.load(to_hash))
+
+
+def history_for_cache(cache_path: str) -> RobotsHistory:
+    """
+    3.5 History store next to a robots cache file (<data_dir>/_robots).
+    """
+    return RobotsHistory(os.path.join(os.path.dirname(os.path.abspath(cache_path)), HISTORY_DIR_NAME))
+
+
+# =============================================================================
+# 4.0 CLI
+# =============================================================================
+
+def main(argv: Optional[List[str]] = None) -> None:
+    parser = argparse.ArgumentParser(description="Show a host's robots.txt history and last structural diff")
+    parser.add_argument("host", help="Host as fetched, e.g. www.example.com")
+    parser.add_argument("--data-dir", default="output", help="Data directory (default: output)")
+    args = parser.parse_args(argv)
+
+    history = RobotsHistory(os.path.join(args.data_dir, HISTORY_DIR_NAME))
+    timeline = history.timeline(args.host)
+    if timeline.empty:
+        print(f"No robots.txt history for {args.host}")
+        return
+    print(timeline.to_string(index=False))
+    print()
+    changes = history.diff(args.host)
+    if not changes:
+        print("No rule changes in the last version")
+    for c in changes:
+        old = f" (was {c['old_value']})" if c["old_value"] is not None else ""
+        print(f"  {c['change']:>8} {c['agent'] or '-':<20} {c['directive']:<12} {c['value'] or ''}{old}")
+
+
+if __name__ == "__main__":
+    main()
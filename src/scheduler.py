@@ -0,0 +1,383 @@
+"""
+1.0 Scheduler Module
+Per-sitemap-file change history: adaptive re-crawl intervals for the
+daemon, change-rate estimates and fetch-budget ordering for every crawl.
+
+Key features:
+- Every sitemap file (index or child) has its own poll interval, learned
+  from its content hash: a changed file is polled sooner (interval x
+  `speedup`), an unchanged one later (interval x `backoff`), clamped to
+  [min_interval, max_interval] - hot sitemaps end up hourly, static
+  archives weekly
+- A domain is due when any of its sitemap files is due; files that are
+  not due are not fetched. Their page URLs are carried forward from the
+  domain snapshot, so the diff never sees them as removed
+- A fetched file whose hash is unchanged is not parsed again (same
+  carry-forward)
+- Change-rate model: each file's change rate is estimated from its fetch
+  history (Cho & Garcia-Molina estimator over observed hash changes),
+  shrunk toward the rate its URLs declare via <changefreq>; a newer
+  <lastmod> for the file in its parent index means it certainly changed
+- Under a per-domain `fetch_budget` (sitemap requests per crawl), the
+  children of each index are fetched in order of their probability of
+  having changed since the last fetch; the rest are carried forward
+- State is one JSON file per domain, written atomically after a
+  successful crawl
+- A failed crawl (daemon) backs the domain off: not due again for
+  `error_interval` x 2^(failures-1), capped at max_interval, so a host
+  that errors or rate-limits is not re-crawled on every tick
+
+Layout:
+    output/<domain>/<domain>_schedule.json
+"""
+
+import json
+import logging
+import math
+import os
+import time
+from typing import Any, Dict, Iterable, List, Optional
+
+from src.w3c_datetime import parse_w3c_datetime
+
+logger = logging.getLogger(__name__)
+
+# 1.1 Interval defaults (minutes)
+DEFAULT_SCHEDULER_CONFIG = {
+    "min_interval_minutes": 60,          # hot sitemaps: hourly
+    "max_interval_minutes": 7 * 24 * 60,  # static archives: weekly
+    "initial_interval_minutes": 24 * 60,
+    "speedup": 0.5,                      # interval factor after a change
+    "backoff": 1.5,                      # interval factor after no change
+    "tick_seconds": 60,                  # max sleep between due checks
+    "error_interval_minutes": 5,         # first wait after a failed crawl (doubles per failure)
+    "fetch_budget": None,                # max sitemap requests per domain crawl
+    "prior_weight": 2.0,                 # weight of declared changefreq, in observed intervals
+    "lastmod_unchanged_factor": 0.25,    # P(changed) factor when the index lastmod is not newer
+}
+
+# 1.2 Declared <changefreq> -> expected days between changes
+CHANGEFREQ_DAYS = {
+    "always": 1 / 24,
+    "hourly": 1 / 24,
+    "daily": 1,
+    "weekly": 7,
+    "monthly": 30,
+    "yearly": 365,
+    "never": 3650,
+}
+
+# Sitemap file metadata kept per file (same columns as <domain>_sitemaps.csv)
+RECORD_FIELDS = ["sitemap_type", "url_count", "content_hash", "content_length", "fetched_at", "changefreq"]
+
+
+def scheduler_settings(config: Dict[str, Any], target: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    2.1 Merge scheduler defaults, the global `scheduler` block and per-target overrides.
+    """
+    settings = {**DEFAULT_SCHEDULER_CONFIG, **config.get("scheduler", {})}
+    for key in ("min_interval_minutes", "max_interval_minutes", "initial_interval_minutes", "fetch_budget"):
+        if target and key in target:
+            settings[key] = target[key]
+    return settings
+
+
+class SitemapSchedule:
+    """
+    3.0 SitemapSchedule Class
+    Per-domain poll state: hash, interval and last fetch of each sitemap file.
+    """
+
+    def __init__(
+        self,
+        domain: str,
+        path: str,
+        settings: Optional[Dict[str, Any]] = None,
+        use_intervals: bool = True,
+    ):
+        """
+        3.1 Load a domain's schedule (empty if none yet).
+
+        Args:
+            domain: Domain the schedule belongs to
+            path: JSON state file (<data_dir>/<domain>/<domain>_schedule.json)
+            settings: Scheduler settings (see scheduler_settings)
+            use_intervals: Skip files that are not due (daemon). Batch runs
+                fetch every file (budget permitting) and only record history
+        """
+        self.domain = domain
+        self.path = path
+        self.settings = {**DEFAULT_SCHEDULER_CONFIG, **(settings or {})}
+        self.use_intervals = use_intervals
+        self.sitemaps: Dict[str, Dict[str, Any]] = {}
+        self.seen: set = set()
+        # Consecutive failed crawls (kept across load(): a failure discards the crawl's state)
+        self.failures = 0
+        self.retry_at = 0.0
+        self.begin_crawl()
+        self.load()
+
+    # -- persistence -------------------------------------------------------
+
+    def begin_crawl(self) -> None:
+        """
+        3.1.1 Reset the per-crawl request count and budget plan.
+        """
+        self.fetch_count = 0
+        self.deferred: set = set()
+
+    def load(self) -> None:
+        """
+        3.2 (Re)load state from disk, discarding unsaved changes.
+        """
+        self.sitemaps = {}
+        self.seen = set()
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                self.sitemaps = json.load(f).get("sitemaps", {})
+        except (OSError, ValueError) as e:
+            logger.warning(f"Could not read schedule {self.path}: {e}; starting fresh")
+
+    def save(self) -> None:
+        """
+        3.3 Prune files not seen in this crawl and write state atomically.
+        """
+        if self.seen:
+            self.sitemaps = {url: s for url, s in self.sitemaps.items() if url in self.seen}
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"domain": self.domain, "sitemaps": self.sitemaps}, f, indent=2)
+        os.replace(tmp_path, self.path)
+        self.seen = set()
+
+    # -- intervals ---------------------------------------------------------
+
+    def _minutes(self, key: str) -> float:
+        return float(self.settings[key]) * 60
+
+    def interval(self, sitemap_url: str) -> float:
+        state = self.sitemaps.get(sitemap_url)
+        return state["interval_seconds"] if state else self._minutes("initial_interval_minutes")
+
+    def next_due(self, sitemap_url: str) -> float:
+        """
+        3.4 Epoch seconds when a sitemap file should next be fetched (0 = never fetched).
+        """
+        state = self.sitemaps.get(sitemap_url)
+        if not state:
+            return 0.0
+        return state["last_fetched"] + state["interval_seconds"]
+
+    def is_due(self, sitemap_url: str, now: Optional[float] = None) -> bool:
+        return self.next_due(sitemap_url) <= (time.time() if now is None else now)
+
+    def should_fetch(self, sitemap_url: str, now: Optional[float] = None) -> bool:
+        """
+        3.4.1 False if the file was deferred by the budget, or (daemon) is not due.
+        """
+        if sitemap_url in self.deferred:
+            return False
+        return not self.use_intervals or self.is_due(sitemap_url, now)
+
+    def domain_next_due(self, roots: Iterable[str]) -> float:
+        """
+        3.5 Earliest due time over the domain's root sitemaps and known files
+        (not before the error backoff of a failed crawl).
+        """
+        urls = list(roots) + list(self.sitemaps)
+        return max(min((self.next_due(url) for url in urls), default=0.0), self.retry_at)
+
+    def record_failure(self, now: Optional[float] = None) -> float:
+        """
+        3.5.1 Back the domain off after a failed crawl; returns when it is due again.
+        """
+        now = time.time() if now is None else now
+        self.failures += 1
+        delay = min(
+            self._minutes("error_interval_minutes") * 2 ** (self.failures - 1),
+            self._minutes("max_interval_minutes"),
+        )
+        self.retry_at = now + delay
+        return self.retry_at
+
+    def record_success(self) -> None:
+        """
+        3.5.2 Clear the error backoff after a successful crawl.
+        """
+        self.failures = 0
+        self.retry_at = 0.0
+
+    # -- recording ---------------------------------------------------------
+
+    def record_fetch(self, sitemap_url: str, content_hash: str, now: Optional[float] = None) -> bool:
+        """
+        3.6 Record a fetch and adapt the interval; returns True if the content changed.
+        """
+        now = time.time() if now is None else now
+        self.seen.add(sitemap_url)
+        self.fetch_count += 1
+        state = self.sitemaps.get(sitemap_url)
+        if state is None:
+            self.sitemaps[sitemap_url] = {
+                "interval_seconds": self._minutes("initial_interval_minutes"),
+                "first_fetched": now,
+                "last_fetched": now,
+                "last_changed": now,
+                "fetches": 1,
+                "changes": 0,
+                "content_hash": content_hash,
+            }
+            return True
+
+        changed = state.get("content_hash") != content_hash
+        factor = self.settings["speedup"] if changed else self.settings["backoff"]
+        state["interval_seconds"] = min(
+            max(state["interval_seconds"] * factor, self._minutes("min_interval_minutes")),
+            self._minutes("max_interval_minutes"),
+        )
+        state["last_fetched"] = now
+        state["fetches"] = state.get("fetches", 0) + 1
+        if changed:
+            state["last_changed"] = now
+            state["changes"] = state.get("changes", 0) + 1
+            state["content_hash"] = content_hash
+        return changed
+
+    def record_parsed(
+        self,
+        sitemap_url: str,
+        record: Dict[str, Any],
+        children: Optional[List[Dict[str, Any]]] = None,
+    ) -> None:
+        """
+        3.7 Keep the file's metadata record (and child list for indexes) for carry-forward.
+
+        Args:
+            sitemap_url: Sitemap file URL
+            record: Metadata record (RECORD_FIELDS, plus declared changefreq for urlsets)
+            children: For indexes, [{"loc", "lastmod"}] of the child files
+        """
+        state = self.sitemaps.get(sitemap_url)
+        if state is None:
+            return
+        state["record"] = {k: record.get(k) for k in RECORD_FIELDS}
+        if record.get("changefreq"):
+            state["changefreq"] = record["changefreq"]
+        if children is not None:
+            state["children"] = [c["loc"] for c in children]
+            state["child_lastmod"] = {c["loc"]: c["lastmod"] for c in children if c.get("lastmod")}
+
+    def mark_carried(self, sitemap_url: str) -> None:
+        """
+        3.8 Keep a file that was not fetched this crawl (its URLs are carried forward).
+        """
+        self.seen.add(sitemap_url)
+
+    # -- carry-forward -----------------------------------------------------
+
+    def sitemap_type(self, sitemap_url: str) -> Optional[str]:
+        return (self.sitemaps.get(sitemap_url, {}).get("record") or {}).get("sitemap_type")
+
+    def children(self, sitemap_url: str) -> Optional[List[str]]:
+        return self.sitemaps.get(sitemap_url, {}).get("children")
+
+    def carried_record(self, sitemap_url: str) -> Optional[Dict[str, Any]]:
+        """
+        3.9 Metadata record of a carried-forward file, for <domain>_sitemaps.csv.
+        """
+        record = self.sitemaps.get(sitemap_url, {}).get("record")
+        if not record:
+            return None
+        return {"sitemap_url": sitemap_url, "domain": self.domain, **record}
+
+    # -- change-rate model -------------------------------------------------
+
+    def change_rate(self, sitemap_url: str) -> float:
+        """
+        3.11 Estimated changes per day of a sitemap file.
+
+        With n observed fetch intervals (mean length I days) of which X ended
+        in a changed hash, the Cho & Garcia-Molina estimator
+            r = -ln((n - X + 0.5) / (n + 0.5)) / I
+        corrects for several changes falling into one interval. It is
+        shrunk toward the declared <changefreq> rate with `prior_weight`
+        pseudo-intervals, so new files start from what the site declares.
+        """
+        state = self.sitemaps.get(sitemap_url, {})
+        declared_days = CHANGEFREQ_DAYS.get(str(state.get("changefreq", "")).lower())
+        prior = 1 / declared_days if declared_days else 86400 / self._minutes("initial_interval_minutes")
+
+        n = state.get("fetches", 0) - 1
+        span_days = (state.get("last_fetched", 0) - state.get("first_fetched", state.get("last_fetched", 0))) / 86400
+        if n <= 0 or span_days <= 0:
+            return prior
+        changes = min(state.get("changes", 0), n)
+        observed = -math.log((n - changes + 0.5) / (n + 0.5)) / (span_days / n)
+        weight = float(self.settings["prior_weight"])
+        return (n * observed + weight * prior) / (n + weight)
+
+    def change_probability(
+        self, sitemap_url: str, now: Optional[float] = None, declared_lastmod: Optional[str] = None
+    ) -> float:
+        """
+        3.12 Probability that a file changed since its last fetch.
+
+        Poisson model P = 1 - exp(-rate * elapsed). A <lastmod> in the parent
+        index newer than the last fetch makes it 1; an older one scales it
+        down by `lastmod_unchanged_factor` (lastmods are often, not always,
+        maintained).
+        """
+        state = self.sitemaps.get(sitemap_url)
+        if not state:
+            return 1.0
+        now = time.time() if now is None else now
+        lastmod = parse_w3c_datetime(declared_lastmod)
+        if lastmod is not None and lastmod > state["last_fetched"]:
+            return 1.0
+        elapsed_days = max(now - state["last_fetched"], 0) / 86400
+        probability = 1 - math.exp(-self.change_rate(sitemap_url) * elapsed_days)
+        if lastmod is not None:
+            probability *= float(self.settings["lastmod_unchanged_factor"])
+        return probability
+
+    def plan_children(self, parent_url: str, children: List[str], now: Optional[float] = None) -> None:
+        """
+        3.13 Spend the rest of the crawl's fetch budget on the children most likely changed.
+
+        Children never fetched before are always fetched (nothing to carry
+        forward) and come out of the budget first. The others are ranked by
+        change_probability; those beyond the budget are deferred to a later
+        crawl and carried forward.
+        """
+        budget = self.settings.get("fetch_budget")
+        if not budget:
+            return
+        now = time.time() if now is None else now
+        lastmods = self.sitemaps.get(parent_url, {}).get("child_lastmod", {})
+        known = [c for c in children if self.carried_record(c) and self.should_fetch(c, now)]
+        unknown = sum(1 for c in children if not self.carried_record(c))
+        remaining = max(int(budget) - self.fetch_count - unknown, 0)
+        ranked = sorted(known, key=lambda c: self.change_probability(c, now, lastmods.get(c)), reverse=True)
+        deferred = ranked[remaining:]
+        self.deferred.update(deferred)
+        if deferred:
+            logger.info(
+                f"{self.domain}: fetch budget {budget}: fetching {min(remaining, len(ranked))} of "
+                f"{len(ranked)} known children of {parent_url}, deferring {len(deferred)}"
+            )
+
+    def summary(self) -> Dict[str, Any]:
+        """
+        3.10 Interval overview for logs (fastest / slowest file, in hours).
+        """
+        intervals = [s["interval_seconds"] for s in self.sitemaps.values()]
+        if not intervals:
+            return {"files": 0}
+        return {
+            "files": len(intervals),
+            "min_interval_hours": round(min(intervals) / 3600, 2),
+            "max_interval_hours": round(max(intervals) / 3600, 2),
+        }
@@ -0,0 +1,284 @@
+"""
+1.0 Sharding Module
+Spread targets over several runner nodes and merge their results.
+
+Key features:
+- `--shard i/N` selects this node's targets by rendezvous (highest random
+  weight) hashing on domain: stable across runs and config edits, and
+  changing N only moves the domains that must move
+- Every domain belongs to exactly one shard, so per-domain output
+  directories from different nodes never overlap
+- Each shard writes a run summary and its own robots.txt cache file; a
+  coordinator merges summaries, robots caches and (optionally) output
+  directories copied back from other nodes
+
+Layout:
+    output/
+        _runs/<run_id>/shard-0-of-4.json   (per-shard summary)
+        _runs/<run_id>/summary.json        (merged by the coordinator)
+        robots_cache.shard-0-of-4.json     (per-shard robots cache)
+"""
+
+import hashlib
+import json
+import logging
+import os
+import shutil
+from datetime import datetime, timezone
+from glob import glob
+from typing import Any, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# 1.1 Layout constants
+RUNS_DIR = "_runs"
+ROBOTS_CACHE_NAME = "robots_cache.json"
+
+
+def parse_shard_spec(spec: str) -> Tuple[int, int]:
+    """
+    2.1 Parse "i/N" into (shard_index, n_shards); shards are numbered 0..N-1.
+    """
+    try:
+        index_str, count_str = spec.split("/", 1)
+        shard_index, n_shards = int(index_str), int(count_str)
+    except (AttributeError, ValueError):
+        raise ValueError(f"Invalid shard spec '{spec}', expected i/N (e.g. 0/4)")
+    if n_shards < 1 or not 0 <= shard_index < n_shards:
+        raise ValueError(f"Invalid shard spec '{spec}': need 0 <= i < N")
+    return shard_index, n_shards
+
+
+def shard_label(shard_index: int, n_shards: int) -> str:
+    return f"shard-{shard_index}-of-{n_shards}"
+
+
+def shard_of(domain: str, n_shards: int) -> int:
+    """
+    2.2 Shard that owns a domain (rendezvous hashing).
+
+    Each shard scores the domain with a stable hash; the highest score
+    wins. Uses sha1 rather than hash() so every node agrees.
+    """
+    if n_shards <= 1:
+        return 0
+    key = domain.strip().lower()
+    scores = [
+        int.from_bytes(hashlib.sha1(f"{key}#{shard}".encode("utf-8")).digest()[:8], "big")
+        for shard in range(n_shards)
+    ]
+    return max(range(n_shards), key=scores.__getitem__)
+
+
+def select_shard_targets(
+    targets: List[Dict[str, Any]], shard_index: int, n_shards: int
+) -> List[Dict[str, Any]]:
+    """
+    2.3 Targets owned by one shard (config order preserved).
+    """
+    return [t for t in targets if t.get("domain") and shard_of(t["domain"], n_shards) == shard_index]
+
+
+def default_run_id(now: Optional[datetime] = None) -> str:
+    """
+    2.4 Run id shared by all shards of one scheduled run (UTC date).
+    """
+    return (now or datetime.now(timezone.utc)).strftime("%Y-%m-%d")
+
+
+def run_dir(data_dir: str, run_id: str) -> str:
+    return os.path.join(data_dir, RUNS_DIR, run_id)
+
+
+def shard_robots_cache_path(data_dir: str, shard_index: int, n_shards: int) -> str:
+    """
+    2.5 Per-shard robots cache path, seeded from the shared cache if present.
+    """
+    path = os.path.join(data_dir, f"robots_cache.{shard_label(shard_index, n_shards)}.json")
+    shared = os.path.join(data_dir, ROBOTS_CACHE_NAME)
+    if not os.path.exists(path) and os.path.exists(shared):
+        os.makedirs(data_dir, exist_ok=True)
+        shutil.copyfile(shared, path)
+    return path
+
+
+def _write_json(path: str, payload: Dict[str, Any]) -> None:
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(payload, f, indent=2, default=str)
+    os.replace(tmp_path, path)
+
+
+def write_shard_summary(
+    data_dir: str,
+    run_id: str,
+    shard_index: int,
+    n_shards: int,
+    assigned: List[str],
+    domain_results: Dict[str, Dict[str, Any]],
+    started_at: datetime,
+) -> str:
+    """
+    3.1 Write this shard's run summary.
+
+    Args:
+        assigned: Every domain this shard owns (including unscheduled ones)
+        domain_results: domain -> result dict for domains that ran
+
+    Returns:
+        Path of the summary file
+    """
+    path = os.path.join(run_dir(data_dir, run_id), f"{shard_label(shard_index, n_shards)}.json")
+    _write_json(path, {
+        "run_id": run_id,
+        "shard_index": shard_index,
+        "n_shards": n_shards,
+        "data_dir": os.path.abspath(data_dir),
+        "started_at": started_at.isoformat(),
+        "finished_at": datetime.now(timezone.utc).isoformat(),
+        "assigned": sorted(assigned),
+        "skipped": sorted(set(assigned) - set(domain_results)),
+        "domains": domain_results,
+    })
+    logger.info(f"Wrote shard summary: {path}")
+    return path
+
+
+def merge_robots_caches(cache_paths: List[str], dest_path: str) -> int:
+    """
+    3.2 Merge robots caches into dest_path (newest fetched_at per domain wins).
+
+    Returns:
+        Number of domains in the merged cache
+    """
+    merged: Dict[str, Any] = {"domains": {}}
+    for path in [dest_path] + list(cache_paths):
+        if not os.path.exists(path):
+            continue
+        try:
+            with open(path, "r") as f:
+                domains = json.load(f).get("domains", {})
+        except Exception as e:
+            logger.warning(f"Could not read robots cache {path}: {e}")
+            continue
+        for domain, entry in domains.items():
+            current = merged["domains"].get(domain)
+            if current is None or entry.get("fetched_at", "") > current.get("fetched_at", ""):
+                merged["domains"][domain] = entry
+    _write_json(dest_path, merged)
+    return len(merged["domains"])
+
+
+def merge_shards(
+    data_dir: str,
+    run_id: str,
+    shard_dirs: Optional[List[str]] = None,
+    expected_domains: Optional[List[str]] = None,
+) -> Dict[str, Any]:
+    """
+    3.3 Coordinator: merge shard summaries (and outputs) into one run summary.
+
+    Args:
+        data_dir: Merged output directory
+        run_id: Run to merge
+        shard_dirs: Output directories of the shards (default: [data_dir]).
+            Domain directories found in other dirs are copied into data_dir.
+        expected_domains: All configured domains, to report unassigned ones
+
+    Returns:
+        The merged summary (also written to _runs/<run_id>/summary.json)
+    """
+    shard_dirs = shard_dirs or [data_dir]
+    summaries: Dict[int, Dict[str, Any]] = {}
+    n_shards_seen = set()
+    sources: Dict[int, str] = {}
+
+    # 3.3.1 Collect shard summaries from every node's output
+    for shard_dir in shard_dirs:
+        for path in sorted(glob(os.path.join(run_dir(shard_dir, run_id), "shard-*-of-*.json"))):
+            with open(path, "r", encoding="utf-8") as f:
+                summary = json.load(f)
+            index = summary["shard_index"]
+            n_shards_seen.add(summary["n_shards"])
+            if index in summaries and sources[index] != shard_dir:
+                logger.warning(f"Shard {index} reported by both {sources[index]} and {shard_dir}")
+            summaries[index] = summary
+            sources[index] = shard_dir
+
+    if not summaries:
+        raise FileNotFoundError(f"No shard summaries for run {run_id} in {shard_dirs}")
+    if len(n_shards_seen) > 1:
+        raise ValueError(f"Shard summaries disagree on shard count: {sorted(n_shards_seen)}")
+    n_shards = n_shards_seen.pop()
+
+    # 3.3.2 Combine domain results; domains must be owned by exactly one shard
+    domains: Dict[str, Dict[str, Any]] = {}
+    owners: Dict[str, int] = {}
+    conflicts = []
+    for index, summary in sorted(summaries.items()):
+        for domain in summary.get("assigned", []):
+            if domain in owners and owners[domain] != index:
+                conflicts.append(domain)
+            owners[domain] = index
+        for domain, result in summary.get("domains", {}).items():
+            domains[domain] = {**result, "shard": index}
+
+    missing_shards = sorted(set(range(n_shards)) - set(summaries))
+    unassigned = sorted(set(expected_domains or []) - set(owners))
+
+    # 3.3.3 Bring domain outputs from other nodes into data_dir
+    copied = 0
+    for index, summary in summaries.items():
+        source = sources[index]
+        if os.path.abspath(source) == os.path.abspath(data_dir):
+            continue
+        for domain in summary.get("domains", {}):
+            src_dir = os.path.join(source, domain)
+            if os.path.isdir(src_dir):
+                shutil.copytree(src_dir, os.path.join(data_dir, domain), dirs_exist_ok=True)
+                copied += 1
+
+    # 3.3.4 Fold per-shard robots caches into the shared cache
+    robots_files = [
+        path for shard_dir in shard_dirs
+        for path in glob(os.path.join(shard_dir, "robots_cache.shard-*-of-*.json"))
+    ]
+    robots_domains = merge_robots_caches(robots_files, os.path.join(data_dir, ROBOTS_CACHE_NAME))
+    for path in robots_files:
+        os.remove(path)
+
+    statuses = [r.get("status") for r in domains.values()]
+    merged = {
+        "run_id": run_id,
+        "n_shards": n_shards,
+        "shards_reported": sorted(summaries),
+        "missing_shards": missing_shards,
+        "conflicts": sorted(set(conflicts)),
+        "unassigned_domains": unassigned,
+        "started_at": min(s["started_at"] for s in summaries.values()),
+        "finished_at": max(s["finished_at"] for s in summaries.values()),
+        "totals": {
+            "domains": len(domains),
+            "success": statuses.count("success"),
+            "warning": statuses.count("warning"),
+            "error": statuses.count("error"),
+            "urls": sum(int(r.get("urls", 0) or 0) for r in domains.values()),
+            "copied_domain_dirs": copied,
+            "robots_cache_domains": robots_domains,
+        },
+        "domains": domains,
+    }
+    _write_json(os.path.join(run_dir(data_dir, run_id), "summary.json"), merged)
+
+    logger.info(
+        f"Merged {len(summaries)}/{n_shards} shards for run {run_id}: "
+        f"{merged['totals']['domains']} domains, {merged['totals']['urls']:,} URLs"
+    )
+    if missing_shards:
+        logger.warning(f"Missing shard summaries: {missing_shards}")
+    if conflicts:
+        logger.error(f"Domains claimed by more than one shard: {merged['conflicts']}")
+    if unassigned:
+        logger.warning(f"Configured domains no shard reported: {unassigned}")
+    return merged
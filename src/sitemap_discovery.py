@@ -0,0 +1,259 @@
+"""
+1.0 Sitemap Discovery Module
+Find a domain's sitemap roots from robots.txt and common locations.
+
+Key features:
+- Targets with only a `domain` (or `"discover": true`) get their sitemap
+  roots discovered instead of listed by hand
+- Candidates: `Sitemap:` lines of the (cached) robots.txt of the domain
+  and its www. host, plus common paths (/sitemap.xml, /sitemap_index.xml, ...)
+- All candidates are probed concurrently with a short timeout and no
+  retries; only responses that parse as a sitemap index or urlset count
+- Root selection: each candidate covers itself and everything it lists
+  (transitively through other candidates). The smallest set of roots
+  covering every discovered sitemap file is chosen greedily (robots.txt
+  entries first), so a root already listed by another index is never
+  crawled twice
+- The result is saved per domain and reused until `ttl_hours` passes
+
+Layout:
+    output/<domain>/<domain>_discovery.json
+"""
+
+import json
+import logging
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Set
+from urllib.parse import urlparse, urlunparse
+
+from src.robots_checker import RobotsChecker, parse_robots_groups
+from src.sitemap_fetcher import SitemapFetcher
+from src.sitemap_parser import SitemapParser
+
+logger = logging.getLogger(__name__)
+
+# 1.1 Where sites usually put their sitemaps (tried on the bare and www. host)
+COMMON_SITEMAP_PATHS = [
+    "/sitemap.xml",
+    "/sitemap_index.xml",
+    "/sitemap-index.xml",
+    "/sitemap/sitemap-index.xml",
+    "/sitemaps/sitemap.xml",
+    "/sitemap.xml.gz",
+]
+
+# 1.2 Defaults for the `discovery` config block
+DEFAULT_DISCOVERY_CONFIG = {
+    "probe_timeout": 10,
+    "probe_workers": 8,
+    "ttl_hours": 7 * 24,
+}
+
+_memo_lock = threading.Lock()
+# domain -> (expires_at, roots); avoids re-reading the JSON every daemon tick
+_memo: Dict[str, Any] = {}
+
+
+def needs_discovery(target: Dict[str, Any]) -> bool:
+    """
+    2.1 True for targets without sitemap URLs (unless `"discover": false`) or with `"discover": true`.
+    """
+    if target.get("discover") is not None:
+        return bool(target["discover"])
+    return bool(target.get("domain")) and not (target.get("sitemap_url") or target.get("sitemap_urls"))
+
+
+def normalize_sitemap_url(url: str) -> str:
+    """
+    2.2 Lowercase scheme and host, drop the fragment (path and query kept).
+    """
+    parts = urlparse(url.strip())
+    return urlunparse((parts.scheme.lower(), parts.netloc.lower(), parts.path or "/", parts.params, parts.query, ""))
+
+
+def candidate_urls(domain: str, robots_checker: Optional[RobotsChecker]) -> Dict[str, List[str]]:
+    """
+    2.3 Sitemap URLs declared in robots.txt, and common locations to probe.
+    """
+    bare = domain[4:] if domain.startswith("www.") else domain
+    hosts = [f"www.{bare}", bare]
+    declared: List[str] = []
+    if robots_checker is not None:
+        for host in hosts:
+            content = robots_checker.fetch_robots_txt(host)
+            for url in parse_robots_groups(content or "").sitemaps:
+                url = normalize_sitemap_url(url)
+                if url.startswith(("http://", "https://")) and url not in declared:
+                    declared.append(url)
+    common = [f"https://{host}{path}" for host in hosts for path in COMMON_SITEMAP_PATHS]
+    return {"robots": declared, "common": [u for u in common if u not in declared]}
+
+
+def probe_sitemaps(urls: List[str], fetcher: SitemapFetcher, max_workers: int) -> Dict[str, Dict[str, Any]]:
+    """
+    2.4 Fetch candidates concurrently; keep the ones that parse as a sitemap.
+
+    Returns:
+        url -> {"type": "sitemapindex"|"urlset", "children": [normalized child URLs]}
+    """
+    parser = SitemapParser()
+
+    def probe(url: str) -> Optional[Dict[str, Any]]:
+        content = fetcher.fetch_sitemap_bytes(url)
+        if not content:
+            return None
+        parsed = parser.iter_sitemap(content, sitemap_url=url)
+        if parsed["type"] == "sitemapindex":
+            children = [c.get("loc") if isinstance(c, dict) else c for c in parsed["urls"] or []]
+            return {"type": "sitemapindex", "children": [normalize_sitemap_url(c) for c in children if c]}
+        if parsed["type"] == "urlset":
+            return {"type": "urlset", "children": []}
+        return None
+
+    if not urls:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(urls)), thread_name_prefix="discover") as pool:
+        results = dict(zip(urls, pool.map(probe, urls)))
+    return {url: result for url, result in results.items() if result}
+
+
+def covering_roots(probed: Dict[str, Dict[str, Any]], preferred: Optional[List[str]] = None) -> List[str]:
+    """
+    2.5 Smallest set of probed sitemaps whose closure covers every known sitemap file.
+
+    A candidate covers itself, its listed children, and (transitively)
+    whatever other probed candidates it lists. Greedy set cover: the
+    candidate covering the most uncovered files wins; ties go to
+    `preferred` (robots.txt) entries, then the shorter URL.
+    """
+    closure: Dict[str, Set[str]] = {}
+    for url in probed:
+        covered, stack = set(), [url]
+        while stack:
+            node = stack.pop()
+            if node in covered:
+                continue
+            covered.add(node)
+            stack.extend(probed.get(node, {}).get("children", []))
+        closure[url] = covered
+
+    universe = set().union(*closure.values()) if closure else set()
+    rank = {url: i for i, url in enumerate(preferred or [])}
+    roots: List[str] = []
+    uncovered = set(universe)
+    while uncovered:
+        best = max(
+            closure,
+            key=lambda u: (len(closure[u] & uncovered), -rank.get(u, len(rank)), -len(u)),
+        )
+        gain = closure[best] & uncovered
+        if not gain:
+            break
+        roots.append(best)
+        uncovered -= gain
+    return roots
+
+
+def discover_sitemaps(
+    domain: str,
+    robots_checker: Optional[RobotsChecker] = None,
+    fetcher: Optional[SitemapFetcher] = None,
+    settings: Optional[Dict[str, Any]] = None,
+    configured: Optional[List[str]] = None,
+) -> Dict[str, Any]:
+    """
+    3.0 Discover a domain's sitemap roots.
+
+    Args:
+        configured: Sitemap URLs already in the target; probed too and
+            preferred over discovered ones on ties
+
+    Returns:
+        {"domain", "roots", "robots", "probed", "discovered_at"}
+    """
+    settings = {**DEFAULT_DISCOVERY_CONFIG, **(settings or {})}
+    fetcher = fetcher or SitemapFetcher({
+        "timeout": settings["probe_timeout"],
+        "max_retries": 0,
+        "download_delay": 0,
+        "stealth_fallback": False,
+    })
+    started = time.perf_counter()
+    candidates = candidate_urls(domain, robots_checker)
+    configured = [normalize_sitemap_url(u) for u in configured or []]
+    preferred = configured + [u for u in candidates["robots"] if u not in configured]
+    common = [u for u in candidates["common"] if u not in preferred]
+    probed = probe_sitemaps(preferred + common, fetcher, settings["probe_workers"])
+    roots = covering_roots(probed, preferred=preferred)
+    logger.info(
+        f"Discovered {len(roots)} sitemap roots for {domain} "
+        f"({len(probed)} of {len(preferred) + len(common)} candidates found, "
+        f"{len(candidates['robots'])} from robots.txt) in {time.perf_counter() - started:.1f}s"
+    )
+    return {
+        "domain": domain,
+        "roots": roots,
+        "robots": candidates["robots"],
+        "probed": {url: {"type": r["type"], "children": len(r["children"])} for url, r in probed.items()},
+        "discovered_at": datetime.now(timezone.utc).isoformat(),
+    }
+
+
+def discovery_path(data_dir: str, domain: str) -> str:
+    return os.path.join(data_dir, domain, f"{domain}_discovery.json")
+
+
+def resolve_target_sitemaps(
+    target: Dict[str, Any],
+    config: Dict[str, Any],
+    robots_checker: Optional[RobotsChecker] = None,
+    fetcher: Optional[SitemapFetcher] = None,
+) -> Dict[str, Any]:
+    """
+    3.1 The target with discovered `sitemap_urls` filled in (unchanged if it needs none).
+
+    Uses the saved discovery while it is younger than `ttl_hours`;
+    otherwise discovers again and saves atomically. A target with no
+    sitemap found comes back without sitemap URLs.
+    """
+    if not needs_discovery(target):
+        return target
+    domain = target["domain"]
+    settings = {**DEFAULT_DISCOVERY_CONFIG, **config.get("discovery", {})}
+    path = discovery_path(config.get("data_directory", "output"), domain)
+    now = time.time()
+
+    with _memo_lock:
+        memo = _memo.get(domain)
+    roots = memo[1] if memo and memo[0] > now else None
+
+    if roots is None and os.path.exists(path):
+        try:
+            if now - os.path.getmtime(path) < settings["ttl_hours"] * 3600:
+                with open(path, "r", encoding="utf-8") as f:
+                    roots = json.load(f).get("roots") or None
+        except Exception as e:
+            logger.warning(f"Could not read discovery for {domain}: {e}")
+
+    if roots is None:
+        configured = target.get("sitemap_urls") or ([target["sitemap_url"]] if target.get("sitemap_url") else [])
+        result = discover_sitemaps(domain, robots_checker, fetcher, settings, configured=configured)
+        roots = result["roots"]
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(result, f, indent=2)
+            os.replace(tmp_path, path)
+        except Exception as e:
+            logger.warning(f"Could not save discovery for {domain}: {e}")
+
+    with _memo_lock:
+        _memo[domain] = (now + settings["ttl_hours"] * 3600, roots)
+    resolved = {k: v for k, v in target.items() if k != "sitemap_url"}
+    resolved["sitemap_urls"] = list(roots)
+    return resolved
@@ -3,20 +3,41 @@
 Fetches XML sitemap content from URLs with retry logic.
 
 Key features:
-- Automatic retry on transient failures (429, 500, 502, 503, 504)
-- Exponential backoff between retries
+- Retry on transient failures (429, 500, 502, 503, 504, timeouts) with
+  jittered exponential backoff (see retry). With defer_retries the
+  failure is raised instead, so the caller can queue the file and keep
+  its worker busy with other sitemaps
 - Configurable timeout and user agent
 - Session reuse for connection pooling
 - Simple download delay for politeness (not stealth - sitemaps are public)
 - StealthFetcher fallback for 403 Forbidden responses
+- Transparent decompression of gzipped sitemap files (.xml.gz)
+- Bytes-through path (fetch_sitemap_bytes): the raw body goes straight to
+  the parser, which decodes per the XML declaration; no charset detection
+  pass and no str round trip on multi-megabyte sitemaps
+- An interrupted body is resumed with a Range request (If-Range against
+  the ETag / Last-Modified) instead of downloaded again from byte zero
+- Bodies are streamed (and gunzipped) chunk by chunk into a spooled temp
+  file (fetch_sitemap_body): in memory up to `spool_threshold_mb`, on disk
+  beyond it, so memory per fetch stays bounded. A file larger than
+  `max_sitemap_mb` (uncompressed; also stops gzip bombs) is dropped
+- Bytes, retries and stealth fallbacks counted in the run metrics
 """
 
+import hashlib
+import re
+import tempfile
+import threading
+import zlib
 import requests
 from requests.adapters import HTTPAdapter
 from urllib3.util.retry import Retry
 import logging
 import time
-from typing import Optional, Dict, Any
+from typing import IO, Optional, Dict, Any, Tuple
+
+from src.metrics import run_metrics, timed
+from src.retry import RETRYABLE_STATUSES, RetryableFetchError, backoff_delay, parse_retry_after, retry_settings
 
 # Import StealthFetcher - prefer shared library, fallback to local copy
 try:
@@ -31,6 +52,102 @@ except ImportError:
 
 logger = logging.getLogger(__name__)
 
+GZIP_MAGIC = b"\x1f\x8b"
+CHUNK_SIZE = 64 * 1024
+
+# 1.2 Sitemap protocol limits per file (reported, not enforced)
+PROTOCOL_MAX_URLS = 50_000
+PROTOCOL_MAX_BYTES = 50 * 1024 * 1024
+
+# 1.3 Defaults for the `limits` config block (MB are uncompressed bytes;
+#     the per-domain caps are opt-in)
+DEFAULT_LIMITS = {
+    "spool_threshold_mb": 8,
+    "max_sitemap_mb": 200,
+    "max_domain_mb": None,
+    "max_domain_urls": None,
+}
+# encoding="..." in the XML declaration (first bytes of the document)
+XML_ENCODING_RE = re.compile(rb'^\s*<\?xml[^>]*?encoding\s*=\s*["\']([A-Za-z0-9._-]+)["\']')
+
+
+def decode_xml(content: bytes) -> str:
+    """
+    1.1 Decode an XML body per its BOM / XML declaration (UTF-8 by default).
+    """
+    if content.startswith(b"\xef\xbb\xbf"):
+        return content[3:].decode("utf-8", errors="replace")
+    match = XML_ENCODING_RE.match(content[:200])
+    encoding = match.group(1).decode("ascii") if match else "utf-8"
+    try:
+        return content.decode(encoding, errors="replace")
+    except LookupError:
+        return content.decode("utf-8", errors="replace")
+
+
+def protocol_warnings(url_count: Optional[int], size: Optional[int]) -> str:
+    """
+    1.4 Which sitemap protocol limits (50k URLs, 50 MB) a file exceeds, e.g. "urls>50000".
+    """
+    warnings = []
+    if url_count and url_count > PROTOCOL_MAX_URLS:
+        warnings.append(f"urls>{PROTOCOL_MAX_URLS}")
+    if size and size > PROTOCOL_MAX_BYTES:
+        warnings.append(f"bytes>{PROTOCOL_MAX_BYTES}")
+    return ";".join(warnings)
+
+
+class SitemapBody:
+    """
+    1.5 A fetched sitemap body in a spooled temp file, positioned at the start.
+    
+    Attributes:
+        file: Readable binary file (memory below the spool threshold, disk above)
+        size: Uncompressed size in bytes
+        sha256: Hex digest of the uncompressed body
+    """
+
+    def __init__(self, file: IO[bytes], size: int, sha256: str):
+        self.file = file
+        self.size = size
+        self.sha256 = sha256
+
+    @property
+    def on_disk(self) -> bool:
+        return bool(getattr(self.file, "_rolled", False))
+
+    def read(self) -> bytes:
+        self.file.seek(0)
+        return self.file.read()
+
+    def close(self) -> None:
+        self.file.close()
+
+    def __len__(self) -> int:
+        return self.size
+
+    def __enter__(self) -> "SitemapBody":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.close()
+
+
+def inflate_capped(inflater: Any, data: bytes, room: int) -> Tuple[Any, bytes]:
+    """
+    1.6 Inflate gzip data to at most `room` bytes (so a gzip bomb stops there).
+    Concatenated gzip members are followed, as gzip.decompress allows.
+
+    Returns:
+        (inflater for the next chunk, inflated bytes)
+    """
+    out = inflater.decompress(data, room)
+    while inflater.eof and inflater.unused_data and len(out) < room:
+        rest = inflater.unused_data
+        inflater = zlib.decompressobj(wbits=16 + zlib.MAX_WBITS)
+        out += inflater.decompress(rest, room - len(out))
+    return inflater, out
+
 
 class SitemapFetcher:
     """
@@ -49,6 +166,9 @@ class SitemapFetcher:
                 - max_retries: Number of retry attempts (default: 3)
                 - download_delay: Delay between requests in seconds (default: 1.5)
                 - stealth_fallback: Enable StealthFetcher on 403 (default: True)
+                - limits: spool_threshold_mb / max_sitemap_mb (see DEFAULT_LIMITS)
+                - resume_attempts: Resumes of an interrupted body (default: 3)
+                - retry: base_seconds / max_seconds of the backoff (see retry)
         """
         # 2.1.1 Extract config values with defaults
         config = config or {}
@@ -62,10 +182,16 @@ class SitemapFetcher:
         self.max_retries = config.get("max_retries", 3)
         self.download_delay = float(config.get("download_delay", 1.5))
         self.stealth_fallback = config.get("stealth_fallback", True) and STEALTH_AVAILABLE
+        limits = {**DEFAULT_LIMITS, **(config.get("limits") or {})}
+        self.spool_threshold = int(float(limits["spool_threshold_mb"]) * 1024 * 1024)
+        self.max_sitemap_bytes = int(float(limits["max_sitemap_mb"]) * 1024 * 1024)
+        self.resume_attempts = int(config.get("resume_attempts", 3))
+        self.retry = retry_settings(config)
         
         # 2.1.2 Track requests for delay logic
         self.request_count = 0
         self.last_request_time = 0
+        self._delay_lock = threading.Lock()
         
         # 2.1.3 Create session with retry strategy
         self.session = self._create_session_with_retries()
@@ -90,26 +216,19 @@ class SitemapFetcher:
 
     def _create_session_with_retries(self) -> requests.Session:
         """
-        2.2 Create a requests Session with automatic retry logic.
+        2.2 Create a requests Session for sitemap fetches.
         
-        Retry strategy:
-        - Retries on: 429 (rate limit), 500, 502, 503, 504 (server errors)
-        - Backoff: 1s, 2s, 4s between retries (exponential)
-        - Also retries on connection errors
+        urllib3 does not retry: its backoff sleeps inside the worker
+        thread. Retries are driven by fetch_sitemap_body (or the caller's
+        RetryQueue) instead.
         
         Returns:
             Configured requests.Session object
         """
         session = requests.Session()
         
-        # Define retry strategy
-        retry_strategy = Retry(
-            total=self.max_retries,
-            backoff_factor=1,  # 1s, 2s, 4s between retries
-            status_forcelist=[429, 500, 502, 503, 504],
-            allowed_methods=["HEAD", "GET"],  # Only retry safe methods
-            raise_on_status=False,  # Don't raise, let us handle it
-        )
+        # No adapter-level retries (429/5xx come back as responses)
+        retry_strategy = Retry(total=0, raise_on_status=False)
         
         # Mount adapter to both http and https
         adapter = HTTPAdapter(max_retries=retry_strategy)
@@ -128,31 +247,87 @@ class SitemapFetcher:
         Sitemaps are public and sites expect bots to fetch them,
         so this is just basic politeness - not stealth.
         """
-        if self.request_count == 0:
+        # Reserve the next request slot under the lock, sleep outside it:
+        # concurrent fetches (sitemap pool) still start download_delay apart
+        with self._delay_lock:
+            now = time.time()
+            if self.request_count == 0:
+                start = now
+            else:
+                start = max(now, self.last_request_time + self.download_delay)
             self.request_count += 1
-            self.last_request_time = time.time()
-            return
-        
-        # Ensure minimum time since last request
-        elapsed = time.time() - self.last_request_time
-        wait_time = max(0, self.download_delay - elapsed)
+            self.last_request_time = start
         
+        wait_time = start - time.time()
         if wait_time > 0:
             time.sleep(wait_time)
-        
-        self.request_count += 1
-        self.last_request_time = time.time()
 
     def fetch_sitemap_xml(self, sitemap_url: str, timeout: Optional[int] = None) -> Optional[str]:
         """
-        2.4 Fetch XML content from a sitemap URL.
+        2.4 Fetch XML content from a sitemap URL, as a string.
+        
+        Kept for callers that want text; the crawl uses fetch_sitemap_body.
+        
+        Returns:
+            XML content as string if successful, None otherwise
+        """
+        content = self.fetch_sitemap_bytes(sitemap_url, timeout=timeout)
+        return decode_xml(content) if content else None
+
+    def fetch_sitemap_bytes(self, sitemap_url: str, timeout: Optional[int] = None) -> Optional[bytes]:
+        """
+        2.4.0 Fetch the raw XML body of a sitemap URL (gzip already undone), in memory.
+        """
+        body = self.fetch_sitemap_body(sitemap_url, timeout=timeout)
+        if body is None:
+            return None
+        with body:
+            return body.read()
+
+    @timed("fetch")
+    def fetch_sitemap_body(
+        self, sitemap_url: str, timeout: Optional[int] = None, defer_retries: bool = False
+    ) -> Optional[SitemapBody]:
+        """
+        2.4.00 Stream a sitemap's raw XML body into a spooled temp file.
+        
+        The body is read in chunks, gunzipped on the fly and hashed as it
+        arrives; it never exists as one str or bytes object. Bytes are
+        handed to the parser as-is: response.text would run charset
+        detection over the whole body when the server declares none.
         
         Args:
             sitemap_url: The URL of the sitemap to fetch
             timeout: Optional override for request timeout
+            defer_retries: Raise RetryableFetchError on a transient failure
+                instead of backing off here (the caller schedules the retry)
             
         Returns:
-            XML content as string if successful, None otherwise
+            SitemapBody (caller closes it) if successful, None otherwise
+        """
+        attempt = 0
+        while True:
+            try:
+                return self._fetch_body_once(sitemap_url, timeout)
+            except RetryableFetchError as e:
+                run_metrics.incr("fetch_errors")
+                if defer_retries:
+                    raise
+                if attempt >= self.max_retries:
+                    logger.error(f"Failed to fetch {sitemap_url}: {e.reason} after {self.max_retries} retries")
+                    return None
+                delay = backoff_delay(
+                    attempt, self.retry["base_seconds"], self.retry["max_seconds"], e.retry_after
+                )
+                attempt += 1
+                run_metrics.incr("retries")
+                run_metrics.record_sitemap(sitemap_url, retries=1)
+                logger.warning(f"{e.reason} for {sitemap_url}, retry {attempt}/{self.max_retries} in {delay:.1f}s")
+                time.sleep(delay)
+
+    def _fetch_body_once(self, sitemap_url: str, timeout: Optional[int] = None) -> Optional[SitemapBody]:
+        """
+        2.4.01 One attempt of fetch_sitemap_body; transient failures raise RetryableFetchError.
         """
         # 2.4.1 Validate URL
         if not sitemap_url or not sitemap_url.startswith(("http://", "https://")):
@@ -167,48 +342,229 @@ class SitemapFetcher:
         logger.info(f"Fetching sitemap: {sitemap_url}")
         
         try:
-            # 2.4.3 Make request (retries handled automatically by adapter)
-            response = self.session.get(sitemap_url, timeout=timeout)
+            # 2.4.3 Make request (retries are scheduled by the caller)
+            started = time.perf_counter()
+            response = self.session.get(sitemap_url, timeout=timeout, stream=True)
             
             # 2.4.4 Check for success
             if response.status_code == 200:
-                content_length = len(response.text)
+                with response:
+                    body, wire_bytes = self._spool_body(sitemap_url, response, timeout)
+                self._record_response(sitemap_url, response, time.perf_counter() - started, wire_bytes)
+                if body is None:
+                    return None
                 logger.info(
                     f"Successfully fetched {sitemap_url} "
-                    f"(status={response.status_code}, size={content_length:,} bytes)"
+                    f"(status={response.status_code}, size={body.size:,} bytes"
+                    f"{', spooled to disk' if body.on_disk else ''})"
                 )
-                return response.text
+                return body
+            
+            self._record_response(sitemap_url, response, time.perf_counter() - started, len(response.content))
             
             # 2.4.5 Try StealthFetcher fallback on 402/403 (blocking responses)
-            elif response.status_code in (402, 403) and self.stealth_fallback and self.stealth_fetcher:
+            if response.status_code in (402, 403) and self.stealth_fallback and self.stealth_fetcher:
                 logger.warning(
                     f"Got {response.status_code} for {sitemap_url}, trying StealthFetcher fallback..."
                 )
-                return self._stealth_fallback(sitemap_url)
+                run_metrics.incr("stealth_fallbacks")
+                content = self._stealth_fallback(sitemap_url)
+                if isinstance(content, str):
+                    content = content.encode("utf-8")
+                return self._body_from_bytes(sitemap_url, content) if content else None
             
-            else:
-                logger.error(
-                    f"Failed to fetch {sitemap_url}: "
-                    f"status={response.status_code} after {self.max_retries} retries"
+            elif response.status_code in RETRYABLE_STATUSES:
+                raise RetryableFetchError(
+                    sitemap_url,
+                    f"status={response.status_code}",
+                    parse_retry_after(response.headers.get("Retry-After")),
                 )
+            
+            else:
+                logger.error(f"Failed to fetch {sitemap_url}: status={response.status_code}")
                 return None
                 
         except requests.exceptions.Timeout:
-            logger.error(f"Timeout fetching {sitemap_url} after {timeout}s")
-            return None
+            raise RetryableFetchError(sitemap_url, f"Timeout after {timeout}s")
             
         except requests.exceptions.ConnectionError as e:
-            logger.error(f"Connection error fetching {sitemap_url}: {e}")
-            return None
+            raise RetryableFetchError(sitemap_url, f"Connection error ({e})")
             
         except requests.exceptions.RequestException as e:
             logger.error(f"Request error fetching {sitemap_url}: {e}")
             return None
             
+        except RetryableFetchError:
+            raise
+            
         except Exception as e:
             logger.error(f"Unexpected error fetching {sitemap_url}: {e}")
             return None
 
+    def _spool_body(
+        self, sitemap_url: str, response: requests.Response, timeout: Optional[float] = None
+    ) -> Tuple[Optional[SitemapBody], int]:
+        """
+        2.4.7 Copy a streamed 200 response into a SitemapBody.
+        
+        Gzipped sitemap files (.xml.gz) arrive as a gzip body, not as
+        Content-Encoding, so requests leaves them compressed; they are
+        inflated chunk by chunk. Returns (None, bytes read) when the
+        uncompressed size passes max_sitemap_bytes.
+        
+        A body cut off mid-transfer (dropped connection, read timeout) is
+        resumed from the last byte received (see _resume_request) up to
+        resume_attempts times; the inflater and hash simply carry on.
+        """
+        spool = tempfile.SpooledTemporaryFile(max_size=self.spool_threshold, prefix="sitemap-")
+        state: Dict[str, Any] = {}
+
+        def reset() -> None:
+            spool.seek(0)
+            spool.truncate()
+            state.update(digest=hashlib.sha256(), size=0, offset=0, inflater=None)
+
+        reset()
+        wire_bytes = attempts = 0
+        try:
+            while True:
+                try:
+                    for chunk in response.iter_content(chunk_size=CHUNK_SIZE):
+                        if not chunk:
+                            continue
+                        if state["offset"] == 0 and chunk[:2] == GZIP_MAGIC:
+                            state["inflater"] = zlib.decompressobj(wbits=16 + zlib.MAX_WBITS)
+                        state["offset"] += len(chunk)
+                        wire_bytes += len(chunk)
+                        data = chunk
+                        inflater = state["inflater"]
+                        if inflater is not None:
+                            # Output capped at one byte over the limit, so a gzip bomb
+                            # never inflates further than that
+                            room = self.max_sitemap_bytes + 1 - state["size"]
+                            state["inflater"], data = inflate_capped(inflater, chunk, room)
+                        state["size"] += len(data)
+                        if state["size"] > self.max_sitemap_bytes:
+                            logger.error(
+                                f"Sitemap {sitemap_url} exceeds max_sitemap_mb "
+                                f"({self.max_sitemap_bytes // (1024 * 1024)} MB uncompressed). Dropped."
+                            )
+                            run_metrics.incr("sitemaps_too_large")
+                            run_metrics.record_sitemap(sitemap_url, error="too_large")
+                            spool.close()
+                            return None, wire_bytes
+                        state["digest"].update(data)
+                        spool.write(data)
+                    break
+                except (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError) as e:
+                    response.close()
+                    if attempts >= self.resume_attempts:
+                        raise
+                    attempts += 1
+                    logger.warning(
+                        f"Download of {sitemap_url} interrupted after {state['offset']:,} bytes "
+                        f"({type(e).__name__}), attempt {attempts}/{self.resume_attempts}"
+                    )
+                    response, resumed = self._resume_request(sitemap_url, response, state["offset"], timeout)
+                    if resumed:
+                        run_metrics.incr("resumes")
+                        run_metrics.incr("resumed_bytes", state["offset"])
+                    else:
+                        run_metrics.incr("restarts")
+                        reset()
+        except Exception:
+            spool.close()
+            raise
+        finally:
+            response.close()
+            if attempts:
+                run_metrics.record_sitemap(sitemap_url, resumes=attempts)
+        spool.seek(0)
+        return SitemapBody(spool, state["size"], state["digest"].hexdigest()), wire_bytes
+
+    def _resume_request(
+        self, sitemap_url: str, failed: requests.Response, offset: int, timeout: Optional[float]
+    ) -> Tuple[requests.Response, bool]:
+        """
+        2.4.9 Re-request an interrupted body; returns (response, resumed).
+        
+        Ranged ("Range: bytes=<offset>-") when the first response allowed
+        it: Accept-Ranges: bytes, no Content-Encoding (the offset counts
+        bytes as sent), and a validator for If-Range - a strong ETag, else
+        Last-Modified. If-Range makes a server whose file changed in
+        between answer 200 with the whole new body instead of a mismatched
+        tail. Anything but a matching 206 is treated as a full refetch.
+        """
+        headers = failed.headers
+        etag = headers.get("ETag")
+        validator = etag if etag and not etag.startswith("W/") else headers.get("Last-Modified")
+        ranged = (
+            offset > 0
+            and validator
+            and headers.get("Accept-Ranges", "").lower() == "bytes"
+            and headers.get("Content-Encoding", "identity").lower() == "identity"
+        )
+        request_headers = {"Range": f"bytes={offset}-", "If-Range": validator} if ranged else {}
+        response = self.session.get(sitemap_url, timeout=timeout or self.timeout, stream=True, headers=request_headers)
+        run_metrics.incr("http_requests")
+        if response.status_code == 206 and ranged:
+            content_range = response.headers.get("Content-Range", "")
+            if content_range.startswith(f"bytes {offset}-"):
+                logger.info(f"Resuming {sitemap_url} at byte {offset:,}")
+                return response, True
+            response.close()
+            response = self.session.get(sitemap_url, timeout=timeout or self.timeout, stream=True)
+            run_metrics.incr("http_requests")
+        if response.status_code != 200:
+            response.close()
+            raise requests.exceptions.ConnectionError(
+                f"Refetch of {sitemap_url} after interruption returned {response.status_code}"
+            )
+        logger.info(f"Refetching {sitemap_url} from the start ({'ranges not supported' if not ranged else 'changed'})")
+        return response, False
+
+    def _body_from_bytes(self, sitemap_url: str, content: bytes) -> Optional[SitemapBody]:
+        """
+        2.4.8 Wrap an in-memory body (stealth fallback) as a SitemapBody.
+        
+        Same cap as a streamed body: gzip is inflated to at most one byte
+        over max_sitemap_bytes, and a larger body is dropped (None).
+        """
+        if content[:2] == GZIP_MAGIC:
+            _, content = inflate_capped(
+                zlib.decompressobj(wbits=16 + zlib.MAX_WBITS), content, self.max_sitemap_bytes + 1
+            )
+        if len(content) > self.max_sitemap_bytes:
+            logger.error(
+                f"Sitemap {sitemap_url} exceeds max_sitemap_mb "
+                f"({self.max_sitemap_bytes // (1024 * 1024)} MB uncompressed). Dropped."
+            )
+            run_metrics.incr("sitemaps_too_large")
+            run_metrics.record_sitemap(sitemap_url, error="too_large")
+            return None
+        spool = tempfile.SpooledTemporaryFile(max_size=self.spool_threshold, prefix="sitemap-")
+        spool.write(content)
+        spool.seek(0)
+        return SitemapBody(spool, len(content), hashlib.sha256(content).hexdigest())
+
+    def _record_response(self, sitemap_url: str, response: requests.Response, seconds: float, n_bytes: int) -> None:
+        """
+        2.4.6 Count bytes and status for the run report.
+
+        The session never retries (Retry(total=0)): retries are counted
+        where they are scheduled (fetch_sitemap_body, the retry queue).
+        """
+        run_metrics.incr("http_requests")
+        run_metrics.incr("bytes_downloaded", n_bytes)
+        if response.status_code != 200:
+            run_metrics.incr("http_errors")
+        run_metrics.record_sitemap(
+            sitemap_url,
+            status=response.status_code,
+            bytes=n_bytes,
+            fetch_seconds=round(seconds, 3),
+        )
+
     def _stealth_fallback(self, url: str) -> Optional[str]:
         """
         2.5 Try to fetch URL using StealthFetcher when normal request gets 403.
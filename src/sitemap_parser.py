@@ -1,11 +1,20 @@
+import io
 import logging
-from typing import List, Dict, Optional, Union, Tuple, Any
+from typing import IO, List, Dict, Optional, Union, Any, Iterator
 from lxml import etree # Using lxml for robust parsing and namespace handling
 import pandas as pd
 from datetime import datetime
 
+from src.metrics import run_metrics, timed
+
 logger = logging.getLogger(__name__)
 
+# Rows per DataFrame batch yielded by the streaming parser
+DEFAULT_BATCH_SIZE = 10_000
+
+# Columns of each streamed URL batch
+URL_BATCH_COLUMNS = ['loc', 'lastmod', 'changefreq', 'priority']
+
 # Common sitemap namespaces
 SITEMAP_NS = {
     'sm': 'http://www.sitemaps.org/schemas/sitemap/0.9',
@@ -15,18 +24,28 @@ SITEMAP_NS = {
     'video': 'http://www.google.com/schemas/sitemap-video/1.1'
 }
 
+# Clark-notation tags used by the streaming parser
+_SM = '{%s}' % SITEMAP_NS['sm']
+TAG_URLSET = _SM + 'urlset'
+TAG_SITEMAPINDEX = _SM + 'sitemapindex'
+TAG_URL = _SM + 'url'
+TAG_SITEMAP = _SM + 'sitemap'
+_URL_FIELD_TAGS = {_SM + name: name for name in URL_BATCH_COLUMNS}
+
 class SitemapParser:
     def __init__(self):
         logger.info("SitemapParser initialized.")
 
-    def parse_sitemap(self, xml_content: str, sitemap_url: str = "") -> Dict[str, Union[str, List[Dict[str, Any]], None]]:
+    @timed("parse")
+    def parse_sitemap(self, xml_content: Union[str, bytes], sitemap_url: str = "") -> Dict[str, Union[str, List[Dict[str, Any]], None]]:
         """
         Parses the given XML sitemap content.
 
         Determines if it's a sitemap index or a URL set and extracts relevant data.
 
         Args:
-            xml_content: The XML content of the sitemap as a string.
+            xml_content: The XML content of the sitemap, as a string or as the raw
+                         body (bytes are decoded by lxml per the XML declaration).
             sitemap_url: The URL from which this sitemap was fetched (for logging/context).
 
         Returns:
@@ -41,10 +60,12 @@ class SitemapParser:
             return {"type": "error", "urls": None, "error_message": "Empty XML content"}
         
         try:
-            # lxml requires bytes for parsing, so encode the string
+            # lxml requires bytes for parsing, so encode a string
             # Also, recover mode attempts to parse even mildly malformed XML
+            if isinstance(xml_content, str):
+                xml_content = xml_content.encode('utf-8')
             parser = etree.XMLParser(recover=True, remove_blank_text=True)
-            root = etree.fromstring(xml_content.encode('utf-8'), parser=parser)
+            root = etree.fromstring(xml_content, parser=parser)
             
             # Determine if it's a sitemap index or a urlset
             # The localname part extracts tag name without namespace
@@ -81,6 +102,141 @@ class SitemapParser:
             logger.error(f"An unexpected error occurred during sitemap parsing for {sitemap_url}: {e}")
             return {"type": "error", "urls": None, "error_message": f"Unexpected error: {e}"}
 
+    def iter_sitemap(
+        self,
+        xml_content: Union[str, bytes, IO[bytes]],
+        sitemap_url: str = "",
+        batch_size: int = DEFAULT_BATCH_SIZE,
+    ) -> Dict[str, Any]:
+        """
+        Streaming variant of parse_sitemap for the URL pipeline.
+
+        Uses lxml iterparse and clears each element once it is read, so a
+        urlset is never held as a full tree or as a list of per-URL dicts.
+
+        Args:
+            xml_content: The XML content of the sitemap; pass the raw body (bytes,
+                         or a binary file such as SitemapBody.file, read lazily
+                         while batches are consumed) so lxml decodes it per
+                         the XML declaration.
+            sitemap_url: The URL from which this sitemap was fetched (for logging/context).
+            batch_size: Number of URL rows per yielded DataFrame.
+
+        Returns:
+            A dictionary with:
+                'type': 'sitemapindex' or 'urlset' or 'error'
+                'urls': List of child sitemap URLs (sitemapindex only).
+                'batches': Generator of DataFrames with URL_BATCH_COLUMNS (urlset only).
+                'error_message': A string describing the error, if any.
+        """
+        if not xml_content:
+            logger.error(f"Cannot parse empty XML content (from {sitemap_url}).")
+            return {"type": "error", "urls": None, "batches": None, "error_message": "Empty XML content"}
+
+        if isinstance(xml_content, str):
+            xml_content = xml_content.encode('utf-8')
+        source = xml_content if hasattr(xml_content, 'read') else io.BytesIO(xml_content)
+
+        events = etree.iterparse(
+            source,
+            events=("start", "end"),
+            tag=[TAG_URLSET, TAG_SITEMAPINDEX, TAG_URL, TAG_SITEMAP],
+            recover=True,
+            remove_blank_text=True,
+        )
+
+        try:
+            event, root = next(events)
+        except StopIteration:
+            root = None
+        except etree.XMLSyntaxError as e:
+            logger.error(f"XML syntax error while parsing sitemap from {sitemap_url}: {e}")
+            return {"type": "error", "urls": None, "batches": None, "error_message": f"XMLSyntaxError: {e}"}
+
+        if root is not None and root.tag == TAG_SITEMAPINDEX:
+            logger.info(f"Parsing as sitemap index (streaming): {sitemap_url}")
+            with run_metrics.stage("parse"):
+                sitemap_links = self._stream_sitemap_links(events, sitemap_url)
+            return {"type": "sitemapindex", "urls": sitemap_links, "batches": None, "error_message": None}
+
+        if root is not None and root.tag == TAG_URLSET:
+            logger.info(f"Parsing as URL set (streaming): {sitemap_url}")
+            batches = run_metrics.timed_iter("parse", self._stream_url_batches(events, batch_size, sitemap_url))
+            return {"type": "urlset", "urls": None, "batches": batches, "error_message": None}
+
+        # Unknown or non-namespaced root: fall back to the tree parser (rare, small files)
+        if hasattr(xml_content, 'read'):
+            xml_content.seek(0)
+            xml_content = xml_content.read()
+        result = self.parse_sitemap(xml_content, sitemap_url=sitemap_url)
+        result["batches"] = None
+        if result["type"] == "urlset":
+            rows = result.pop("urls") or []
+            result["urls"] = None
+            result["batches"] = iter([pd.DataFrame(rows, columns=URL_BATCH_COLUMNS)])
+        return result
+
+    def _stream_sitemap_links(self, events, sitemap_url: str) -> List[str]:
+        """Collects child sitemap URLs from an iterparse stream of a sitemapindex."""
+        sitemap_urls = []
+        try:
+            for event, element in events:
+                if event != "end" or element.tag != TAG_SITEMAP:
+                    continue
+                loc_el = element.find('sm:loc', SITEMAP_NS)
+                if loc_el is not None and loc_el.text:
+                    sitemap_urls.append(loc_el.text.strip())
+                element.clear()
+        except etree.XMLSyntaxError as e:
+            logger.error(f"XML syntax error in sitemap index {sitemap_url}: {e}")
+        logger.debug(f"Extracted {len(sitemap_urls)} sitemap links from index.")
+        return sitemap_urls
+
+    def _stream_url_batches(self, events, batch_size: int, sitemap_url: str) -> Iterator[pd.DataFrame]:
+        """Yields URL entries from an iterparse stream as column-oriented DataFrame batches."""
+        columns: Dict[str, List[Optional[str]]] = {name: [] for name in URL_BATCH_COLUMNS}
+        skipped = 0
+        total = 0
+
+        try:
+            for event, element in events:
+                if event != "end" or element.tag != TAG_URL:
+                    continue
+
+                entry = dict.fromkeys(URL_BATCH_COLUMNS)
+                for child in element:
+                    name = _URL_FIELD_TAGS.get(child.tag)
+                    if name and entry[name] is None and child.text:
+                        entry[name] = child.text.strip()
+
+                # Free the parsed element and any already-processed siblings
+                element.clear()
+                while element.getprevious() is not None:
+                    del element.getparent()[0]
+
+                if not entry['loc']:
+                    # A URL entry without a <loc> is invalid according to sitemap protocol, skip it.
+                    skipped += 1
+                    continue
+
+                for name in URL_BATCH_COLUMNS:
+                    columns[name].append(entry[name])
+
+                if len(columns['loc']) >= batch_size:
+                    total += len(columns['loc'])
+                    yield pd.DataFrame(columns, columns=URL_BATCH_COLUMNS)
+                    columns = {name: [] for name in URL_BATCH_COLUMNS}
+        except etree.XMLSyntaxError as e:
+            logger.error(f"XML syntax error while streaming {sitemap_url}: {e}")
+
+        if columns['loc']:
+            total += len(columns['loc'])
+            yield pd.DataFrame(columns, columns=URL_BATCH_COLUMNS)
+
+        if skipped:
+            logger.warning(f"Skipped {skipped} URL entries without <loc> tag in {sitemap_url}")
+        logger.debug(f"Streamed {total} URL entries from urlset.")
+
     def _extract_sitemap_links_from_index(self, root_element: etree._Element) -> List[str]:
         """Extracts sitemap URLs from a sitemapindex element."""
         sitemap_urls = []
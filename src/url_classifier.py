@@ -0,0 +1,259 @@
+"""
+1.0 URL Classifier Module
+Vectorized section / subsection / path_depth classification of URLs.
+
+Key features:
+- Whole-batch classification with Arrow string kernels (no per-row Python loop)
+- Optional per-domain path-prefix rule table (longest prefix wins)
+- Results cached by URL fingerprint, so re-classifying a known snapshot
+  is a hash + index lookup
+"""
+
+import logging
+import threading
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from pandas.api.types import union_categoricals
+
+from src.external_diff import url_fingerprints
+
+logger = logging.getLogger(__name__)
+
+# 1.1 Defaults
+ROOT_SECTION = "home"
+DEFAULT_CACHE_MAX_URLS = 2_000_000
+
+CLASSIFIED_COLUMNS = ["section", "subsection", "path_depth"]
+
+
+def compile_rules(rules: Optional[List[Dict[str, Any]]]) -> List[Dict[str, Any]]:
+    """
+    2.1 Normalize a rule table and order it longest prefix first.
+
+    Each rule is a dict like:
+        {"prefix": "/mortgages/refinance/", "section": "mortgages", "subsection": "refinance"}
+    "subsection" is optional - when omitted it comes from the URL path.
+    Prefixes match whole path segments, case-insensitively.
+    """
+    compiled = []
+    for rule in rules or []:
+        prefix = str(rule.get("prefix") or "").strip().lower().strip("/")
+        if not prefix or not rule.get("section"):
+            logger.warning(f"Ignoring section rule without prefix/section: {rule}")
+            continue
+        compiled.append({
+            "prefix": f"/{prefix}/",
+            "section": str(rule["section"]),
+            "subsection": rule.get("subsection"),
+        })
+    return sorted(compiled, key=lambda r: len(r["prefix"]), reverse=True)
+
+
+def _classify_arrow(locs: pd.Series, rules: Optional[List[Dict[str, Any]]]):
+    """
+    2.2 Arrow kernels behind classify_urls.
+
+    Returns:
+        Tuple of (section Categorical, subsection Categorical, path_depth ndarray)
+    """
+    urls = pa.array(locs.to_numpy(dtype=object), type=pa.string(), from_pandas=True)
+
+    # 2.2.1 Path after scheme://host/ (the padding keeps every split in range)
+    parts = pc.split_pattern(pc.binary_join_element_wise(urls, "//", "/"), "/", max_splits=3)
+    path = pc.list_element(parts, 3)
+    if pc.any(pc.match_substring(path, "?")).as_py() or pc.any(pc.match_substring(path, "#")).as_py():
+        path = pc.replace_substring_regex(path, r"[?#].*$", "")
+    path = pc.utf8_trim(path, "/")
+    if pc.any(pc.match_substring(path, "//")).as_py():
+        path = pc.replace_substring_regex(path, r"/{2,}", "/")
+
+    # 2.2.2 Default: first two path segments
+    is_root = pc.equal(path, "")
+    segments = pc.split_pattern(pc.binary_join_element_wise(path, "", "/"), "/", max_splits=2)
+    section = pc.if_else(is_root, ROOT_SECTION, pc.list_element(segments, 0))
+    subsection = pc.list_element(segments, 1)
+    subsection = pc.if_else(pc.equal(subsection, ""), pa.scalar(None, pa.string()), subsection)
+    path_depth = pc.if_else(is_root, 0, pc.add(pc.count_substring(path, "/"), 1)).fill_null(0)
+
+    # 2.2.3 Rule table overrides (longest prefix first, first match wins)
+    if rules:
+        lowered = pc.utf8_lower(pc.binary_join_element_wise("/", path, "/", ""))
+        unmatched = pa.array(np.ones(len(urls), dtype=bool))
+        for rule in rules:
+            hit = pc.and_(unmatched, pc.starts_with(lowered, rule["prefix"]))
+            if not pc.any(hit).as_py():
+                continue
+            section = pc.if_else(hit, rule["section"], section)
+            if rule["subsection"] is not None:
+                subsection = pc.if_else(hit, str(rule["subsection"]), subsection)
+            unmatched = pc.and_not(unmatched, hit)
+
+    # Null URLs classify as nothing
+    if urls.null_count:
+        section = pc.if_else(urls.is_null(), pa.scalar(None, pa.string()), section)
+
+    return (
+        pc.dictionary_encode(section).to_pandas(),
+        pc.dictionary_encode(subsection).to_pandas(),
+        path_depth.to_numpy(zero_copy_only=False).astype("int64"),
+    )
+
+
+def _to_frame(section, subsection, path_depth, index: pd.Index) -> pd.DataFrame:
+    return pd.DataFrame(
+        {
+            "section": np.asarray(section, dtype=object),
+            "subsection": np.asarray(subsection, dtype=object),
+            "path_depth": path_depth,
+        },
+        index=index,
+    )
+
+
+def classify_urls(locs: pd.Series, rules: Optional[List[Dict[str, Any]]] = None) -> pd.DataFrame:
+    """
+    2.3 Classify a Series of absolute URLs into section, subsection and path_depth.
+
+    Default classification is path based:
+        https://x.com/                   -> home, None, 0
+        https://x.com/mortgages/         -> mortgages, None, 1
+        https://x.com/mortgages/rates/ny -> mortgages, rates, 3
+
+    Args:
+        locs: URLs to classify
+        rules: Compiled rule table (see compile_rules); applied over the default
+
+    Returns:
+        DataFrame aligned to locs.index with CLASSIFIED_COLUMNS
+    """
+    if locs.empty:
+        return _to_frame([], [], np.array([], dtype="int64"), locs.index)
+    return _to_frame(*_classify_arrow(locs, rules), index=locs.index)
+
+
+class UrlClassifier:
+    """
+    3.0 UrlClassifier Class
+    Per-domain rule tables plus a fingerprint-keyed result cache.
+
+    The cache keeps, per domain, a short list of segments: a fingerprint
+    Index with section and subsection as categoricals and path_depth as a
+    small int array. New URLs become a new segment; equal-sized neighbours
+    are merged (binary-counter style), so there are O(log n) segments and
+    each Index hash table is built once rather than once per batch.
+    Only cache misses go through the string kernels. Thread-safe: one
+    instance is shared by concurrent domain workers.
+    """
+
+    def __init__(
+        self,
+        section_rules: Optional[Dict[str, List[Dict[str, Any]]]] = None,
+        cache_max_urls: int = DEFAULT_CACHE_MAX_URLS,
+    ):
+        self.cache_max_urls = cache_max_urls
+        self._rules = {
+            domain: compile_rules(rules) for domain, rules in (section_rules or {}).items()
+        }
+        self._cache: Dict[str, List[Dict[str, Any]]] = {}
+        self._lock = threading.Lock()
+
+    def set_rules(self, domain: str, rules: Optional[List[Dict[str, Any]]]) -> None:
+        """
+        3.1 Replace a domain's rule table (drops its cached results).
+        """
+        with self._lock:
+            self._rules[domain] = compile_rules(rules)
+            self._cache.pop(domain, None)
+
+    def classify(self, domain: str, locs: pd.Series) -> pd.DataFrame:
+        """
+        3.2 Classify URLs for a domain, reusing cached results.
+
+        Returns:
+            DataFrame aligned to locs.index with CLASSIFIED_COLUMNS
+        """
+        if locs.empty:
+            return classify_urls(locs)
+
+        fingerprints = url_fingerprints(locs).to_numpy()
+        with self._lock:
+            segments = list(self._cache.get(domain, []))
+            rules = self._rules.get(domain)
+
+        # 3.2.1 Cache lookup, newest segment first
+        result = pd.DataFrame(index=locs.index, columns=CLASSIFIED_COLUMNS, dtype=object)
+        miss = np.ones(len(fingerprints), dtype=bool)
+        for segment in reversed(segments):
+            if not miss.any():
+                break
+            lookup = np.flatnonzero(miss)
+            positions = segment["index"].get_indexer(fingerprints[lookup])
+            found = positions >= 0
+            if not found.any():
+                continue
+            rows, positions = lookup[found], positions[found]
+            result.iloc[rows, 0] = np.asarray(segment["section"].take(positions), dtype=object)
+            result.iloc[rows, 1] = np.asarray(segment["subsection"].take(positions), dtype=object)
+            result.iloc[rows, 2] = segment["path_depth"].take(positions)
+            miss[rows] = False
+
+        # 3.2.2 Classify misses and cache them
+        if miss.any():
+            section, subsection, path_depth = _classify_arrow(locs[miss], rules)
+            if miss.all():
+                result = _to_frame(section, subsection, path_depth, index=locs.index)
+            else:
+                rows = np.flatnonzero(miss)
+                result.iloc[rows, 0] = np.asarray(section, dtype=object)
+                result.iloc[rows, 1] = np.asarray(subsection, dtype=object)
+                result.iloc[rows, 2] = path_depth
+            self._remember(domain, fingerprints[miss], section, subsection, path_depth)
+
+        result["path_depth"] = result["path_depth"].astype("int64")
+        return result
+
+    def _remember(self, domain: str, fingerprints: np.ndarray, section, subsection, path_depth) -> None:
+        """
+        3.3 Add newly classified URLs to the domain cache as a new segment.
+        """
+        index = pd.Index(fingerprints, dtype="uint64")
+        keep = ~index.duplicated(keep="first")
+        segment = {
+            "index": index[keep],
+            "section": pd.Categorical(section)[keep],
+            "subsection": pd.Categorical(subsection)[keep],
+            "path_depth": np.asarray(path_depth)[keep].astype("int16"),
+        }
+
+        with self._lock:
+            segments = self._cache.setdefault(domain, [])
+            segments.append(segment)
+
+            # Merge equal-sized neighbours; keeps segment count logarithmic
+            while len(segments) > 1 and len(segments[-1]["index"]) >= len(segments[-2]["index"]):
+                newer = segments.pop()
+                older = segments.pop()
+                # Concurrent classify of the same URLs: keep the older entry
+                fresh = older["index"].get_indexer(newer["index"]) < 0
+                segments.append({
+                    "index": older["index"].append(newer["index"][fresh]),
+                    "section": union_categoricals([older["section"], newer["section"][fresh]]),
+                    "subsection": union_categoricals([older["subsection"], newer["subsection"][fresh]]),
+                    "path_depth": np.concatenate([older["path_depth"], newer["path_depth"][fresh]]),
+                })
+
+            # Oldest segments go first when the cache is full
+            while len(segments) > 1 and sum(len(seg["index"]) for seg in segments) > self.cache_max_urls:
+                segments.pop(0)
+
+    def cache_size(self, domain: Optional[str] = None) -> int:
+        """
+        3.4 Number of cached URLs (one domain or all).
+        """
+        with self._lock:
+            domains = [domain] if domain is not None else list(self._cache)
+            return sum(len(seg["index"]) for d in domains for seg in self._cache.get(d, []))
@@ -20,6 +20,7 @@ Usage:
     python -m src.url_status_checker
     python -m src.url_status_checker --domain bankrate.com
     python -m src.url_status_checker --check-type removed --limit 50
+    python -m src.url_status_checker --domain bankrate.com --profile --profile-memory
 """
 
 import argparse
@@ -36,6 +37,12 @@ from typing import Dict, List, Optional, Any, Tuple
 from urllib.parse import urlparse
 from glob import glob
 
+from src.change_log import change_log_months, iter_change_log
+from src.metrics import domain_context, run_metrics, timed, write_prometheus_textfile, write_report
+from src.profiling import domain_profile, profiling_settings
+from src.sharding import default_run_id, run_dir
+from src.w3c_datetime import to_epoch_seconds
+
 # Import StealthFetcher - prefer shared library, fallback to local copy
 try:
     from seo_intel.stealth import StealthFetcher, ProbeResult
@@ -364,6 +371,7 @@ def _stealth_head_fallback(url: str) -> Optional[Dict]:
         return None
 
 
+@timed("status")
 def check_url_head(
     url: str,
     user_agent: Optional[str] = None,
@@ -458,6 +466,7 @@ def check_url_head(
         
         # 3.3.1 Try stealth fallback on 403 Forbidden
         if response.status_code == 403 and STEALTH_AVAILABLE:
+            run_metrics.incr("stealth_fallbacks")
             stealth_result = _stealth_head_fallback(url)
             if stealth_result and stealth_result.get('status_code') == 200:
                 logger.info(f"Stealth fallback succeeded for {url}")
@@ -746,8 +755,8 @@ def get_urls_to_check(
     """
     domain_dir = os.path.join(data_dir, domain)
     
-    # Find recent change log files
-    change_files = glob(os.path.join(domain_dir, f"{domain}_changes_*.csv"))
+    # Find recent change log files (one per month, possibly several segments)
+    change_files = change_log_months(domain_dir, domain)
     
     if not change_files:
         logger.info(f"No change logs found for {domain}")
@@ -755,16 +764,18 @@ def get_urls_to_check(
     
     # Load and combine recent changes
     all_changes = []
-    cutoff_date = datetime.now(timezone.utc) - timedelta(days=days_back)
+    cutoff_ts = int((datetime.now(timezone.utc) - timedelta(days=days_back)).timestamp())
     
     for file_path in sorted(change_files, reverse=True):
         try:
-            df = pd.read_csv(file_path)
-            if 'detected_at' in df.columns:
-                # Use utc=True to handle mixed timezone formats consistently
-                df['detected_at'] = pd.to_datetime(df['detected_at'], errors='coerce', utc=True)
-                df = df[df['detected_at'] >= cutoff_date]
-            all_changes.append(df)
+            for df in iter_change_log([file_path]):
+                # Schema v3 stores epoch seconds; older segments are parsed (cached per value)
+                detected_ts = df['detected_at_ts'].astype('Int64')
+                missing = detected_ts.isna()
+                if missing.any():
+                    detected_ts[missing] = to_epoch_seconds(df.loc[missing, 'detected_at'])
+                df['detected_at_ts'] = detected_ts
+                all_changes.append(df[(detected_ts >= cutoff_ts).fillna(False)])
         except Exception as e:
             logger.warning(f"Could not read {file_path}: {e}")
     
@@ -785,8 +796,8 @@ def get_urls_to_check(
     filtered = combined[combined['change_type'].isin(change_types)]
     
     # Deduplicate by URL, keep most recent
-    if not filtered.empty and 'detected_at' in filtered.columns:
-        filtered = filtered.sort_values('detected_at', ascending=False)
+    if not filtered.empty and 'detected_at_ts' in filtered.columns:
+        filtered = filtered.sort_values('detected_at_ts', ascending=False)
         filtered = filtered.drop_duplicates(subset=['loc'], keep='first')
     
     # Prioritize: removed > discovered > modified
@@ -864,7 +875,8 @@ def check_urls_for_domain(
     results = []
     failures = 0
     
-    # 5.2 Get delay settings (default 1.5-4 seconds between requests)
+    # 5.2 Get delay settings (default 1.5-4 seconds between requests;
+    # base_delay 0 turns delays off, e.g. against a local test server)
     base_delay = domain_config.get("base_delay", 2.5)
     delay_jitter = domain_config.get("delay_jitter", 1.5)
     
@@ -874,7 +886,7 @@ def check_urls_for_domain(
             continue
         
         # 5.3 Human-like delay pattern between requests
-        if i > 0:
+        if i > 0 and base_delay > 0:
             # Gaussian distribution centered on base_delay for more natural timing
             delay = max(0.5, random.gauss(base_delay, delay_jitter))
             
@@ -926,6 +938,9 @@ def check_urls_for_domain(
         else:
             result['fate'] = f'other_{result["status_code"]}'
         
+        run_metrics.incr("status_checks")
+        run_metrics.incr(f"status_{result['fate']}")
+        
         # 5.5 Detect X-Robots-Tag signals
         x_robots = result.get('h_x_robots_tag', '')
         if x_robots:
@@ -1107,40 +1122,41 @@ def process_domain_status(
     Returns:
         Tuple of (domain, result_dict) for aggregation
     """
-    try:
-        logger.info(f"\n--- Checking {domain} ---")
+    with domain_context(domain), domain_profile(domain, config.get("profiling")):
+        try:
+            logger.info(f"\n--- Checking {domain} ---")
         
-        # Override limit if specified
-        if limit:
-            domain_config = get_domain_status_config(config, domain)
-            domain_config["max_per_run"] = limit
-            # Note: We don't modify shared config here to avoid race conditions
+            # Override limit if specified
+            if limit:
+                domain_config = get_domain_status_config(config, domain)
+                domain_config["max_per_run"] = limit
+                # Note: We don't modify shared config here to avoid race conditions
         
-        results_df = check_urls_for_domain(
-            domain=domain,
-            config=config,
-            data_dir=data_dir,
-            force=force
-        )
+            results_df = check_urls_for_domain(
+                domain=domain,
+                config=config,
+                data_dir=data_dir,
+                force=force
+            )
         
-        if results_df is not None and not results_df.empty:
-            # Save history
-            save_daily_history(results_df, domain, data_dir)
+            if results_df is not None and not results_df.empty:
+                # Save history
+                save_daily_history(results_df, domain, data_dir)
             
-            # Generate redirect map
-            generate_redirect_map(results_df, domain, data_dir)
+                # Generate redirect map
+                generate_redirect_map(results_df, domain, data_dir)
             
-            # Print summary
-            print_summary(results_df, domain)
+                # Print summary
+                print_summary(results_df, domain)
             
-            return (domain, {"status": "success", "urls_checked": len(results_df)})
-        else:
-            return (domain, {"status": "skipped", "message": "No URLs to check or disabled"})
+                return (domain, {"status": "success", "urls_checked": len(results_df)})
+            else:
+                return (domain, {"status": "skipped", "message": "No URLs to check or disabled"})
             
-    except Exception as e:
-        logger.error(f"FAILED processing status checks for {domain}: {type(e).__name__}: {e}")
-        logger.exception("Full traceback:")
-        return (domain, {"status": "error", "message": str(e)})
+        except Exception as e:
+            logger.error(f"FAILED processing status checks for {domain}: {type(e).__name__}: {e}")
+            logger.exception("Full traceback:")
+            return (domain, {"status": "error", "message": str(e)})
 
 
 def main():
@@ -1171,8 +1187,29 @@ def main():
         default=None,
         help="Override max URLs per domain"
     )
+    parser.add_argument(
+        "--report",
+        default=None,
+        help="Run report JSON path (default: <data-dir>/_runs/<date>/status_report.json)"
+    )
+    parser.add_argument(
+        "--prometheus-textfile",
+        default=None,
+        help="Also write metrics as a Prometheus .prom file"
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="cProfile each domain (<data-dir>/_runs/<date>/status_profiles/<domain>.pstats)"
+    )
+    parser.add_argument(
+        "--profile-memory",
+        action="store_true",
+        help="tracemalloc each domain (<data-dir>/_runs/<date>/status_profiles/<domain>.memory.txt)"
+    )
     
     args = parser.parse_args()
+    run_metrics.reset()
     
     logger.info("=" * 60)
     logger.info("Starting URL Status Checker")
@@ -1180,6 +1217,12 @@ def main():
     logger.info("=" * 60)
     
     config = load_config()
+    profiling = profiling_settings(
+        args.profile, args.profile_memory,
+        os.path.join(run_dir(args.data_dir, default_run_id()), "status_profiles")
+    )
+    if profiling:
+        config = {**config, "profiling": profiling}
     
     # Determine which domains to check
     if args.domain:
@@ -1221,6 +1264,13 @@ def main():
                 logger.error(f"Error retrieving result for {domain}: {e}")
                 domain_results[domain] = {"status": "error", "message": str(e)}
     
+    # Run report (per-domain check timings and fates)
+    report = run_metrics.report(domain_results, extra={"tool": "url_status_checker"})
+    write_report(report, args.report or os.path.join(
+        run_dir(args.data_dir, default_run_id()), "status_report.json"))
+    if args.prometheus_textfile:
+        write_prometheus_textfile(report, args.prometheus_textfile, job="url_status_checker")
+    
     # Summary
     logger.info("=" * 60)
     logger.info("URL Status Checker complete")
@@ -0,0 +1,136 @@
+"""
+1.0 W3C Datetime Module
+Fast, cached normalization of sitemap <lastmod> values to epoch seconds.
+
+Key features:
+- One compiled regex for the W3C datetime profile the sitemap protocol
+  uses (YYYY, YYYY-MM, YYYY-MM-DD, then hh:mm[:ss[.s]] with Z or +hh:mm),
+  tolerating a space for "T", "+hhmm" offsets and a missing offset (UTC)
+- Anything else (RFC 2822 dates, odd spellings) falls back to pandas,
+  once per distinct string
+- String -> epoch cache: a sitemap repeats a handful of lastmod values
+  across thousands of URLs, so a column is parsed once per distinct value
+  (pd.factorize) and the cache carries over between batches and domains
+- Timestamps are int64 seconds since the epoch (UTC); unparseable values
+  are <NA>. Sub-second fractions are truncated
+
+Usage:
+    parse_w3c_datetime("2025-01-02T10:00:00+01:00")  # 1735808400
+    to_epoch_seconds(df["lastmod"])                   # Int64 Series
+"""
+
+import calendar
+import logging
+import re
+import threading
+from datetime import datetime
+from typing import Any, Dict, Optional
+
+import numpy as np
+import pandas as pd
+
+logger = logging.getLogger(__name__)
+
+# 1.1 W3C datetime profile (https://www.w3.org/TR/NOTE-datetime), slightly lenient
+W3C_DATETIME_RE = re.compile(
+    r"^\s*(\d{4})(?:-(\d{2})(?:-(\d{2})"
+    r"(?:[T ](\d{2}):(\d{2})(?::(\d{2})(?:[.,]\d+)?)?"
+    r"\s*(Z|[+-]\d{2}(?::?\d{2})?)?)?)?)?\s*$",
+    re.IGNORECASE,
+)
+
+# 1.2 Distinct strings kept before the cache is cleared (~100 MB worst case)
+MAX_CACHE_ENTRIES = 500_000
+
+_cache: Dict[str, Optional[int]] = {}
+# Guards the cache and the counters (parsing runs on the sitemap thread pools)
+_cache_lock = threading.Lock()
+_stats = {"hits": 0, "misses": 0, "fallbacks": 0}
+
+
+def _parse_uncached(value: str) -> Optional[int]:
+    """
+    2.1 Parse one string: compiled W3C regex first, pandas as the fallback.
+    """
+    match = W3C_DATETIME_RE.match(value)
+    if match:
+        year, month, day, hour, minute, second, tzd = match.groups()
+        try:
+            # Validates month/day/hour ranges
+            stamp = datetime(
+                int(year), int(month or 1), int(day or 1),
+                int(hour or 0), int(minute or 0), int(second or 0),
+            )
+        except ValueError:
+            return None
+        epoch = calendar.timegm(stamp.timetuple())
+        if tzd and tzd.upper() != "Z":
+            digits = tzd[1:].replace(":", "")
+            offset = int(digits[:2]) * 3600 + int(digits[2:4] or 0) * 60
+            epoch -= offset if tzd[0] == "+" else -offset
+        return epoch
+
+    with _cache_lock:
+        _stats["fallbacks"] += 1
+    ts = pd.to_datetime(value, errors="coerce", utc=True)
+    return None if pd.isna(ts) else int(ts.timestamp())
+
+
+def parse_w3c_datetime(value: Any) -> Optional[int]:
+    """
+    2.2 Epoch seconds (UTC) of a lastmod-style value; None if missing or invalid.
+
+    Accepts strings (cached) and datetime / Timestamp objects.
+    """
+    if not isinstance(value, str):
+        if value is None or pd.isna(value):
+            return None
+        if isinstance(value, datetime):
+            # Naive datetimes are taken as UTC, like offset-less strings
+            if value.tzinfo is None:
+                return calendar.timegm(value.timetuple())
+            return int(value.timestamp())
+        return parse_w3c_datetime(str(value))
+    if not value:
+        return None
+
+    cached = _cache.get(value, _cache)
+    if cached is not _cache:
+        with _cache_lock:
+            _stats["hits"] += 1
+        return cached
+    epoch = _parse_uncached(value)
+    with _cache_lock:
+        _stats["misses"] += 1
+        if len(_cache) >= MAX_CACHE_ENTRIES:
+            _cache.clear()
+        _cache[value] = epoch
+    return epoch
+
+
+def to_epoch_seconds(values: pd.Series) -> pd.Series:
+    """
+    3.1 Normalize a column of lastmod / timestamp values to Int64 epoch seconds.
+
+    Each distinct value is parsed once (pd.factorize), then broadcast back.
+    """
+    codes, uniques = pd.factorize(values, use_na_sentinel=True)
+    parsed = [parse_w3c_datetime(u) for u in uniques]
+    lookup = pd.array(parsed + [None], dtype="Int64")
+    # Code -1 (missing) picks the trailing <NA>
+    return pd.Series(lookup.take(np.where(codes < 0, len(parsed), codes)), index=values.index)
+
+
+def cache_info() -> Dict[str, int]:
+    """
+    3.2 Cache size and hit / miss / fallback counts (for benchmarks and logs).
+    """
+    with _cache_lock:
+        return {"entries": len(_cache), **_stats}
+
+
+def clear_cache() -> None:
+    with _cache_lock:
+        _cache.clear()
+        for key in _stats:
+            _stats[key] = 0
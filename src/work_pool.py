@@ -0,0 +1,177 @@
+"""
+1.0 Work Pool Module
+Shared fetch pool: the child sitemap, not the domain, is the unit of
+scheduling for network work.
+
+Key features:
+- One pool of fetch threads serves every domain in the run. A domain with
+  400 child sitemaps keeps the whole pool busy once the small domains are
+  done, instead of fetching one file at a time on its own worker
+- Per-host cap: at most `per_host` fetches in flight per host. Work over
+  the cap waits in a per-host queue, not on a pool thread, so a capped
+  host never idles threads another host could use
+- Per-domain prefetch window: a crawl keeps up to `prefetch` child
+  sitemaps fetched or in flight ahead of its parser (each one a bounded
+  spool file). Parse, diff and write stay on the domain's thread; the
+  domain's diff and write finish once its last sitemap is in
+- Politeness is unchanged: the fetcher spaces request starts by
+  download_delay across threads
+
+Config:
+    "sitemap_pool": {"workers": 8, "per_host": 2, "prefetch": 4}
+    (workers 0 = fetch on the domain's thread, one file at a time)
+"""
+
+import logging
+import threading
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Callable, Deque, Dict, Iterable, Optional, Tuple
+from urllib.parse import urlparse
+
+from src.metrics import domain_context, run_metrics
+
+logger = logging.getLogger(__name__)
+
+# 1.1 Defaults for the `sitemap_pool` config block
+DEFAULT_POOL_CONFIG = {
+    "workers": 8,
+    "per_host": 2,
+    "prefetch": 4,
+}
+
+
+def pool_settings(config: Dict[str, Any]) -> Dict[str, Any]:
+    return {**DEFAULT_POOL_CONFIG, **(config.get("sitemap_pool") or {})}
+
+
+class SitemapWorkPool:
+    """
+    2.0 SitemapWorkPool Class
+    Thread pool shared by all domains, with a concurrency cap per host.
+    """
+
+    def __init__(self, workers: int = 8, per_host: int = 2, prefetch: int = 4):
+        self.workers = workers
+        self.per_host = max(1, per_host)
+        self.prefetch = max(1, prefetch)
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="sitemap")
+        self._lock = threading.Lock()
+        self._active: Dict[str, int] = {}
+        self._waiting: Dict[str, Deque[Tuple[Future, Callable, tuple]]] = {}
+
+    @classmethod
+    def for_config(cls, config: Dict[str, Any]) -> Optional["SitemapWorkPool"]:
+        """
+        2.1 Pool from the `sitemap_pool` config block (None when workers is 0).
+        """
+        settings = pool_settings(config)
+        if not settings["workers"]:
+            return None
+        return cls(int(settings["workers"]), int(settings["per_host"]), int(settings["prefetch"]))
+
+    def submit(self, host: str, fn: Callable, *args: Any) -> Future:
+        """
+        2.2 Run fn(*args) on the pool once `host` has a free slot.
+        """
+        future: Future = Future()
+        with self._lock:
+            if self._active.get(host, 0) < self.per_host:
+                self._active[host] = self._active.get(host, 0) + 1
+            else:
+                self._waiting.setdefault(host, deque()).append((future, fn, args))
+                return future
+        self._executor.submit(self._run, host, future, fn, args)
+        return future
+
+    def _run(self, host: str, future: Future, fn: Callable, args: tuple) -> None:
+        if future.set_running_or_notify_cancel():
+            try:
+                future.set_result(fn(*args))
+            except BaseException as e:
+                future.set_exception(e)
+        # The host's slot passes to its next queued task (back of the pool's queue)
+        with self._lock:
+            waiting = self._waiting.get(host)
+            if not waiting:
+                self._active[host] -= 1
+                self._waiting.pop(host, None)
+                return
+            following = waiting.popleft()
+        self._executor.submit(self._run, host, *following)
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=True)
+
+    def __enter__(self) -> "SitemapWorkPool":
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.shutdown()
+
+
+class SitemapPrefetch:
+    """
+    3.0 SitemapPrefetch Class
+    One domain crawl's window of child sitemaps fetched ahead on the pool.
+
+    The walk announces children in the order it will visit them (want)
+    and collects each body when it gets there (take). Files it never
+    announced (roots, retries) are fetched on the calling thread.
+    """
+
+    def __init__(self, pool: SitemapWorkPool, fetcher: Any, domain: str, defer_retries: bool = False):
+        self.pool = pool
+        self.fetcher = fetcher
+        self.domain = domain
+        self.defer_retries = defer_retries
+        self._upcoming: Deque[str] = deque()
+        self._futures: Dict[str, Future] = {}
+
+    def want(self, urls: Iterable[str]) -> None:
+        """
+        3.1 Children the walk visits next (depth first: ahead of earlier siblings).
+        """
+        urls = [url for url in dict.fromkeys(urls) if url not in self._futures]
+        self._upcoming.extendleft(reversed(urls))
+        self._fill()
+
+    def take(self, url: str):
+        """
+        3.2 The fetched body of url (re-raises its fetch error, e.g. RetryableFetchError).
+        """
+        future = self._futures.pop(url, None)
+        try:
+            if future is None:
+                if url in self._upcoming:
+                    self._upcoming.remove(url)
+                return self.fetcher.fetch_sitemap_body(url, defer_retries=self.defer_retries)
+            with run_metrics.stage("fetch_wait"):
+                return future.result()
+        finally:
+            self._fill()
+
+    def _fill(self) -> None:
+        while self._upcoming and len(self._futures) < self.pool.prefetch:
+            url = self._upcoming.popleft()
+            self._futures[url] = self.pool.submit(urlparse(url).netloc, self._fetch, url)
+
+    def _fetch(self, url: str):
+        with domain_context(self.domain):
+            return self.fetcher.fetch_sitemap_body(url, defer_retries=self.defer_retries)
+
+    def close(self) -> None:
+        """
+        3.3 Drop what the walk never collected (aborted crawl): cancel or close.
+        """
+        self._upcoming.clear()
+        for future in self._futures.values():
+            if future.cancel():
+                continue
+            try:
+                body = future.result()
+            except BaseException:
+                continue
+            if body is not None:
+                body.close()
+        self._futures.clear()
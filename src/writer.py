@@ -0,0 +1,142 @@
+"""
+1.0 Writer Module
+Write-behind stage for per-domain output files.
+
+Key features:
+- One writer thread takes finished frames off a bounded queue and writes
+  them, so the next domain's fetch, parse and diff overlap with disk
+  I/O. A full queue blocks the producer: frames waiting to be written
+  stay bounded
+- Whole-file outputs (snapshot, all-time, sitemaps) are committed
+  atomically: written to <path>.tmp, fsynced, then renamed over the old
+  file. A crash leaves the previous file or the new one, never half of one
+- Appends (change log segments, sitemap history) keep their order: a
+  single thread writes everything
+- Per-domain barrier: reading a domain's files first waits for that
+  domain's queued writes
+- A failed write is logged and counted (`write_errors`); close() returns
+  the failures per domain so the run can report them
+
+Config:
+    "write_behind": {"enabled": true, "queue_size": 4}
+"""
+
+import contextlib
+import logging
+import os
+import queue
+import threading
+from typing import Any, Callable, Dict, List, Optional
+
+import pandas as pd
+
+from src.metrics import domain_context, run_metrics
+
+logger = logging.getLogger(__name__)
+
+# 1.1 Defaults for the `write_behind` config block
+DEFAULT_WRITER_CONFIG = {
+    "enabled": True,
+    "queue_size": 4,
+}
+
+
+def atomic_write_csv(df: pd.DataFrame, path: str) -> None:
+    """
+    2.1 Write a CSV to <path>.tmp, fsync it and rename it over path.
+    """
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp_path = path + ".tmp"
+    try:
+        with open(tmp_path, "w", encoding="utf-8", newline="") as f:
+            df.to_csv(f, index=False)
+            f.flush()
+            os.fsync(f.fileno())
+    except BaseException:
+        with contextlib.suppress(OSError):
+            os.remove(tmp_path)
+        raise
+    os.replace(tmp_path, path)
+
+
+def commit_file(tmp_path: str, path: str) -> None:
+    """
+    2.2 fsync a finished <path>.tmp and rename it over path.
+    """
+    with open(tmp_path, "rb") as f:
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def append_csv(df: pd.DataFrame, path: str) -> None:
+    """
+    2.3 Append rows to a CSV (header only when the file is new).
+    """
+    df.to_csv(path, mode="a", index=False, header=not os.path.exists(path))
+
+
+class WriteBehind:
+    """
+    3.0 WriteBehind Class
+    Single writer thread fed by a bounded queue of write jobs.
+    """
+
+    def __init__(self, queue_size: int = 4):
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max(1, queue_size))
+        self._idle = threading.Condition()
+        self._pending: Dict[str, int] = {}
+        self.errors: Dict[str, List[str]] = {}
+        self._thread = threading.Thread(target=self._run, name="write-behind", daemon=True)
+        self._thread.start()
+
+    @classmethod
+    def for_config(cls, config: Dict[str, Any]) -> Optional["WriteBehind"]:
+        settings = {**DEFAULT_WRITER_CONFIG, **(config.get("write_behind") or {})}
+        if not settings["enabled"]:
+            return None
+        return cls(int(settings["queue_size"]))
+
+    def submit(self, domain: str, fn: Callable, *args: Any) -> None:
+        """
+        3.1 Queue fn(*args) as one of domain's writes (blocks while the queue is full).
+        """
+        with self._idle:
+            self._pending[domain] = self._pending.get(domain, 0) + 1
+        self._queue.put((domain, fn, args))
+
+    def _run(self) -> None:
+        while True:
+            job = self._queue.get()
+            if job is None:
+                return
+            domain, fn, args = job
+            try:
+                with domain_context(domain), run_metrics.stage("write"):
+                    fn(*args)
+            except Exception as e:
+                logger.error(f"Write-behind failed for {domain}: {type(e).__name__}: {e}")
+                run_metrics.incr("write_errors", domain=domain)
+                with self._idle:
+                    self.errors.setdefault(domain, []).append(f"{type(e).__name__}: {e}")
+            finally:
+                with self._idle:
+                    self._pending[domain] -= 1
+                    if not self._pending[domain]:
+                        del self._pending[domain]
+                    self._idle.notify_all()
+
+    def wait(self, domain: Optional[str] = None) -> None:
+        """
+        3.2 Block until domain's queued writes (all writes without a domain) are done.
+        """
+        with self._idle:
+            self._idle.wait_for(lambda: not (self._pending.get(domain) if domain else self._pending))
+
+    def close(self) -> Dict[str, List[str]]:
+        """
+        3.3 Drain the queue, stop the thread; returns failed writes per domain.
+        """
+        self.wait()
+        self._queue.put(None)
+        self._thread.join()
+        return dict(self.errors)
@@ -0,0 +1,204 @@
+"""
+End-to-End Benchmark
+Crawl, diff and status-check a synthetic domain served by a local HTTP
+stand-in (tests/sitemap_server.py), and report throughput to JSON.
+
+Each case (domain size) runs twice, each run in a fresh subprocess so
+peak RSS (ru_maxrss) belongs to that run alone:
+  seed   - first crawl, no snapshot on disk yet
+  steady - second crawl after the server bumps every 20th lastmod
+
+A run drives main.process_domain, then url_status_checker.check_urls_for_domain
+on the URLs the change log picked up. The server runs in this (parent)
+process with injectable latency, 403/429 rates and redirects, and can
+serve gzipped children.
+
+Reported per run: URLs/s, bytes on the wire, requests by status, peak RSS,
+and stage timings from src.metrics (fetch, parse, diff, all_time, write, status).
+
+Run: py tests/bench_e2e.py
+     py tests/bench_e2e.py --sizes 10000 1000000 --gzip --latency-ms 20 --json bench_e2e.json
+     py tests/bench_e2e.py --sizes 100000 --forbidden-rate 0.05 --rate-limited-rate 0.05
+"""
+
+import argparse
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+# Add project root to path
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from tests.sitemap_server import DEFAULT_URLS_PER_CHILD, SitemapServer
+
+DOMAIN = "bench.test"
+
+
+def run_case(spec: dict) -> dict:
+    """Runs one crawl + status check in this process (cwd = the case's data dir)."""
+    import logging
+
+    from src import main as main_module
+    from src import url_status_checker
+    from src.data_processor import DataProcessor
+    from src.metrics import domain_context, run_metrics
+
+    logging.disable(logging.INFO)
+
+    data_dir = spec["data_dir"]
+    target = {
+        "domain": DOMAIN,
+        "sitemap_url": spec["sitemap_url"],
+        "user_agent": "BenchE2E/1.0",
+        "download_delay": 0,
+        "status_check": {
+            "max_per_run": spec["status_urls"],
+            "base_delay": 0,
+            "timeout": 5,
+            "failure_threshold": 1.0,
+        },
+    }
+    config = {"targets": [target], "stealth_fallback": False, "max_retries": 2}
+    data_processor = DataProcessor(data_dir=data_dir, diff_config=spec["diff"])
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # 1. Crawl + diff
+    start = time.perf_counter()
+    _, crawl = main_module.process_domain(target, config, data_processor, {})
+    crawl_seconds = time.perf_counter() - start
+    rss_after_crawl = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+
+    # 2. Status checks over the change log
+    status = {"checked": 0, "fates": {}}
+    start = time.perf_counter()
+    if spec["status_urls"]:
+        with domain_context(DOMAIN):
+            results = url_status_checker.check_urls_for_domain(DOMAIN, config, data_dir=data_dir, force=True)
+        if results is not None:
+            status["checked"] = len(results)
+            status["fates"] = results["fate"].value_counts().to_dict()
+    status_seconds = time.perf_counter() - start
+
+    # 3. Stage timings and counters from the pipeline's own run metrics
+    urls = crawl.get("urls", 0)
+    report = run_metrics.report({DOMAIN: crawl})["domains"][DOMAIN]
+    stages = {name: stage["seconds"] for name, stage in report["stages"].items()}
+
+    return {
+        "crawl_status": crawl.get("status"),
+        "urls": urls,
+        "crawl_seconds": round(crawl_seconds, 3),
+        "urls_per_sec": round(urls / crawl_seconds) if crawl_seconds else None,
+        "status_checked": status["checked"],
+        "status_fates": status["fates"],
+        "status_checks_per_sec": (
+            round(status["checked"] / status_seconds, 1) if status["checked"] and status_seconds else None
+        ),
+        "stages": stages,
+        "counters": report["counters"],
+        "baseline_rss_mb": round(rss_before / 1024, 1),
+        "crawl_peak_rss_mb": round(rss_after_crawl / 1024, 1),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def spawn_case(spec: dict) -> dict:
+    cmd = [sys.executable, os.path.abspath(__file__), "--case", json.dumps(spec)]
+    env = {**os.environ, "PYTHONPATH": PROJECT_ROOT}
+    out = subprocess.run(cmd, capture_output=True, text=True, check=True, cwd=spec["data_dir"], env=env)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000], help="URLs per domain")
+    ap.add_argument("--urls-per-child", type=int, default=DEFAULT_URLS_PER_CHILD)
+    ap.add_argument("--gzip", action="store_true", help="Serve children as .xml.gz")
+    ap.add_argument("--status-urls", type=int, default=200, help="URLs to status-check per run (0 = skip)")
+    ap.add_argument("--latency-ms", type=float, default=0, help="Injected latency per request")
+    ap.add_argument("--latency-jitter-ms", type=float, default=0)
+    ap.add_argument("--forbidden-rate", type=float, default=0.0, help="Share of page requests answered 403")
+    ap.add_argument("--rate-limited-rate", type=float, default=0.0, help="Share of page requests answered 429")
+    ap.add_argument("--redirect-rate", type=float, default=0.0, help="Share of page requests redirected")
+    ap.add_argument("--sitemap-faults", action="store_true", help="Apply 403/429/redirect rates to sitemaps too")
+    ap.add_argument("--diff-mode", default="auto", choices=["auto", "memory", "external"])
+    ap.add_argument("--budget-mb", type=float, default=256)
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--json", default="bench_e2e.json", help="Results file")
+    ap.add_argument("--case", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.case:
+        print(json.dumps(run_case(json.loads(args.case))))
+        return
+
+    latency = {"latency_ms": args.latency_ms, "latency_jitter_ms": args.latency_jitter_ms}
+    faults = {
+        **latency,
+        "forbidden_rate": args.forbidden_rate,
+        "rate_limited_rate": args.rate_limited_rate,
+        "redirect_rate": args.redirect_rate,
+    }
+    params = {k: v for k, v in vars(args).items() if k not in ("case", "json")}
+
+    print("=" * 96)
+    print(f"END-TO-END BENCHMARK (gzip={args.gzip}, latency={args.latency_ms}ms, faults={faults})")
+    print("=" * 96)
+    print(
+        f"{'urls':>10} {'run':>7} {'secs':>8} {'urls/s':>9} {'MB wire':>8} {'fetch':>7} "
+        f"{'parse':>7} {'diff':>7} {'status':>7} {'chk/s':>7} {'peak MB':>8}"
+    )
+
+    results = []
+    for n_urls in args.sizes:
+        server = SitemapServer(
+            {DOMAIN: n_urls},
+            urls_per_child=args.urls_per_child,
+            gzip_children=args.gzip,
+            local_locs=True,
+            sitemap_faults=faults if args.sitemap_faults else latency,
+            page_faults=faults,
+            seed=args.seed,
+        )
+        with tempfile.TemporaryDirectory() as data_dir, server:
+            for run in (1, 2):
+                server.generation = run
+                server.reset_stats()
+                spec = {
+                    "data_dir": data_dir,
+                    "sitemap_url": server.sitemap_url(DOMAIN),
+                    "status_urls": args.status_urls,
+                    "diff": {"mode": args.diff_mode, "memory_budget_mb": args.budget_mb},
+                }
+                r = {"size": n_urls, "run": "seed" if run == 1 else "steady", **spawn_case(spec)}
+                r["server"] = server.stats()
+                results.append(r)
+                s = r["stages"]
+                print(
+                    f"{n_urls:>10,} {r['run']:>7} {r['crawl_seconds']:>8} {r['urls_per_sec'] or 0:>9,} "
+                    f"{r['server']['bytes_sent'] / 1e6:>8.1f} {s.get('fetch', 0):>7} "
+                    f"{s.get('parse', 0):>7} {s.get('diff', 0):>7} {s.get('status', 0):>7} "
+                    f"{r['status_checks_per_sec'] or 0:>7} {r['peak_rss_mb']:>8}"
+                )
+
+    report = {
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "params": params,
+        "results": results,
+    }
+    with open(args.json, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\nWrote {args.json}")
+
+
+if __name__ == "__main__":
+    main()
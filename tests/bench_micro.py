@@ -0,0 +1,381 @@
+"""
+Micro-Benchmarks
+Times the parser, diff and storage hot paths on deterministic synthetic data
+and compares each against a stored baseline.
+
+Cases (name[param]):
+  parse_sitemap[1k|50k]          SitemapParser.parse_sitemap on a urlset string
+  extract_urlset[1k|50k]         SitemapParser._extract_urls_from_urlset on a parsed tree
+  process_sitemap_urls[100k|1m]  DataProcessor.process_sitemap_urls, steady-state
+                                 run (5% modified, 1% removed, 1% discovered)
+  update_all_time_live[100k|1m]  DataProcessor._update_all_time_live
+  save_change_log[10k]           DataProcessor._save_change_log append
+  normalize_lastmod[1m]          w3c_datetime.to_epoch_seconds on mixed-format
+                                 lastmods (cold cache each round)
+  fetch_parse[50k]               SitemapFetcher.fetch_sitemap_bytes + streamed parse of a
+                                 local image urlset (UTF-8, no charset header)
+  fetch_parse_text[50k]          Same via response.text + str parse (the old path, for
+                                 comparison: charset detection and a decode/encode trip)
+  check_url_content[page]        url_status_checker.check_url_content against a
+                                 local page (needs bs4; skipped otherwise)
+
+Each case runs `rounds` times after a warmup; per-round setup (fresh copy
+of the seeded data directory, etc.) is not timed. The median is compared
+with tests/bench_baseline.json; a case slower than baseline by more than
+--tolerance is reported as a regression (exit code 1 with --check).
+Baselines are machine specific - re-record them on the machine you compare on.
+
+Run: py tests/bench_micro.py
+     py tests/bench_micro.py --only parse extract --check
+     py tests/bench_micro.py --quick --save-baseline
+"""
+
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+# Add project root to path
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+BASELINE_PATH = os.path.join(PROJECT_ROOT, "tests", "bench_baseline.json")
+DOMAIN = "bench.example.com"
+SIZES = {"1k": 1_000, "10k": 10_000, "50k": 50_000, "100k": 100_000, "1m": 1_000_000}
+
+# name -> (factory, params, rounds); params marked quick=False are skipped by --quick
+BENCHMARKS: Dict[str, Dict[str, Any]] = {}
+
+
+def benchmark(name: str, params: List[str], rounds: int = 5, slow: Optional[List[str]] = None):
+    """Registers a case factory: factory(param, workdir) -> dict(run, prepare?, items)."""
+    def register(factory: Callable):
+        BENCHMARKS[name] = {"factory": factory, "params": params, "rounds": rounds, "slow": slow or []}
+        return factory
+    return register
+
+
+# =============================================================================
+# SYNTHETIC DATA (deterministic)
+# =============================================================================
+
+def synthetic_urls(n: int, run: int = 1) -> List[Dict[str, Any]]:
+    """Parser-style URL dicts; run 2 modifies 5%, removes 1% and discovers 1%."""
+    urls = []
+    for i in range(n):
+        if run > 1 and i % 100 == 1:
+            continue  # removed
+        day = 2 if run > 1 and i % 20 == 0 else 1
+        urls.append({
+            "loc": f"https://{DOMAIN}/section-{i % 13}/topic-{i % 211}/page-{i}",
+            "lastmod": f"2025-01-{day:02d}",
+            "changefreq": None,
+            "priority": None,
+            "sitemap_source_url": f"https://{DOMAIN}/sitemap-{i // 50_000}.xml",
+        })
+    if run > 1:
+        urls.extend({
+            "loc": f"https://{DOMAIN}/new/page-{i}",
+            "lastmod": "2025-01-02",
+            "changefreq": None,
+            "priority": None,
+            "sitemap_source_url": f"https://{DOMAIN}/sitemap-new.xml",
+        } for i in range(n // 100))
+    return urls
+
+
+def synthetic_urlset(n: int) -> str:
+    rows = "".join(
+        f"<url><loc>https://{DOMAIN}/section-{i % 13}/page-{i}</loc>"
+        f"<lastmod>2025-01-{i % 28 + 1:02d}</lastmod><changefreq>daily</changefreq>"
+        f"<priority>0.{i % 9 + 1}</priority></url>"
+        for i in range(n)
+    )
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        f'<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{rows}</urlset>'
+    )
+
+
+def seeded_data_dir(n: int, workdir: str) -> str:
+    """Data directory after one seed crawl of n URLs (built once per size)."""
+    from src.data_processor import DataProcessor
+
+    seed_dir = os.path.join(workdir, f"seed-{n}")
+    if not os.path.isdir(seed_dir):
+        DataProcessor(data_dir=seed_dir).process_sitemap_urls(DOMAIN, synthetic_urls(n))
+    return seed_dir
+
+
+# =============================================================================
+# CASES
+# =============================================================================
+
+@benchmark("parse_sitemap", ["1k", "50k"])
+def bench_parse_sitemap(param: str, workdir: str) -> Dict[str, Any]:
+    from src.sitemap_parser import SitemapParser
+
+    parser, xml = SitemapParser(), synthetic_urlset(SIZES[param])
+    return {"run": lambda: parser.parse_sitemap(xml, f"https://{DOMAIN}/sitemap.xml"), "items": SIZES[param]}
+
+
+@benchmark("extract_urlset", ["1k", "50k"])
+def bench_extract_urlset(param: str, workdir: str) -> Dict[str, Any]:
+    from lxml import etree
+    from src.sitemap_parser import SitemapParser
+
+    parser = SitemapParser()
+    root = etree.fromstring(synthetic_urlset(SIZES[param]).encode("utf-8"))
+    return {"run": lambda: parser._extract_urls_from_urlset(root), "items": SIZES[param]}
+
+
+@benchmark("process_sitemap_urls", ["100k", "1m"], rounds=3, slow=["1m"])
+def bench_process_sitemap_urls(param: str, workdir: str) -> Dict[str, Any]:
+    from src.data_processor import DataProcessor
+
+    n = SIZES[param]
+    seed_dir = seeded_data_dir(n, workdir)
+    urls = synthetic_urls(n, run=2)
+    state = {"round": 0}
+
+    def prepare():
+        state["round"] += 1
+        state["dir"] = os.path.join(workdir, f"process-{param}-{state['round']}")
+        shutil.copytree(seed_dir, state["dir"])
+        state["dp"] = DataProcessor(data_dir=state["dir"])
+
+    return {"prepare": prepare, "run": lambda: state["dp"].process_sitemap_urls(DOMAIN, urls), "items": n}
+
+
+@benchmark("update_all_time_live", ["100k", "1m"], rounds=3, slow=["1m"])
+def bench_update_all_time_live(param: str, workdir: str) -> Dict[str, Any]:
+    import pandas as pd
+    from src.data_processor import DataProcessor
+
+    n = SIZES[param]
+    seed_dir = seeded_data_dir(n, workdir)
+    dp = DataProcessor(data_dir=seed_dir)
+    all_time_path = dp._get_file_paths(DOMAIN)["all_time_csv"]
+    snapshot = dp._normalize_batch(DOMAIN, pd.DataFrame(synthetic_urls(n, run=2)))
+    pristine = all_time_path + ".bench"
+    if not os.path.exists(pristine):
+        shutil.copyfile(all_time_path, pristine)
+
+    return {
+        "prepare": lambda: shutil.copyfile(pristine, all_time_path),
+        "run": lambda: dp._update_all_time_live(DOMAIN, snapshot),
+        "items": n,
+    }
+
+
+@benchmark("save_change_log", ["10k"], rounds=10)
+def bench_save_change_log(param: str, workdir: str) -> Dict[str, Any]:
+    import pandas as pd
+    from src.data_processor import CHANGE_LOG_COLUMNS, DataProcessor
+
+    n = SIZES[param]
+    dp = DataProcessor(data_dir=os.path.join(workdir, "change-log"))
+    changes = pd.DataFrame({
+        "detected_at": "2025-01-02T00:00:00+00:00",
+        "domain": DOMAIN,
+        "loc": [f"https://{DOMAIN}/section-{i % 13}/page-{i}" for i in range(n)],
+        "change_type": ["modified", "discovered", "removed"] * (n // 3) + ["modified"] * (n % 3),
+        "lastmod": "2025-01-02",
+        "lastmod_prev": "2025-01-01",
+        "sitemap_source_url": f"https://{DOMAIN}/sitemap-0.xml",
+        "section": [f"section-{i % 13}" for i in range(n)],
+        "path_depth": 2,
+    }).reindex(columns=CHANGE_LOG_COLUMNS)
+    path = dp._get_monthly_change_log_path(DOMAIN, datetime(2025, 1, 2, tzinfo=timezone.utc))
+    return {"run": lambda: dp._save_change_log(changes, path), "items": n}
+
+
+@benchmark("normalize_lastmod", ["1m"], rounds=5)
+def bench_normalize_lastmod(param: str, workdir: str) -> Dict[str, Any]:
+    import pandas as pd
+    from src import w3c_datetime
+
+    n = SIZES[param]
+    formats = ["2025-{m:02d}-{d:02d}", "2025-{m:02d}-{d:02d}T10:{d:02d}:00+02:00",
+               "2025-{m:02d}-{d:02d}T08:00Z", "2025-{m:02d}-{d:02d} 12:00:00"]
+    lastmods = pd.Series([
+        formats[i % 4].format(m=i % 12 + 1, d=i % 28 + 1) if i % 50 else None for i in range(n)
+    ])
+    return {
+        "prepare": w3c_datetime.clear_cache,
+        "run": lambda: w3c_datetime.to_epoch_seconds(lastmods),
+        "items": n,
+    }
+
+
+def _fetch_parse_case(param: str, as_text: bool) -> Dict[str, Any]:
+    from src.sitemap_fetcher import SitemapFetcher
+    from src.sitemap_parser import SitemapParser
+    from tests.sitemap_server import SitemapServer
+
+    n = SIZES[param]
+    server = SitemapServer({DOMAIN: n}, urls_per_child=n, image_titles=True).start()
+    url = f"{server.base_url}/{DOMAIN}/sitemap-0.xml"
+    fetcher = SitemapFetcher({"download_delay": 0, "stealth_fallback": False, "max_retries": 0})
+    parser = SitemapParser()
+
+    def run():
+        if as_text:
+            content = fetcher.session.get(url).text
+        else:
+            content = fetcher.fetch_sitemap_bytes(url)
+        for _ in parser.iter_sitemap(content, url)["batches"]:
+            pass
+
+    return {"run": run, "items": n, "cleanup": server.stop}
+
+
+@benchmark("fetch_parse", ["50k"], rounds=5)
+def bench_fetch_parse(param: str, workdir: str) -> Dict[str, Any]:
+    return _fetch_parse_case(param, as_text=False)
+
+
+@benchmark("fetch_parse_text", ["50k"], rounds=5)
+def bench_fetch_parse_text(param: str, workdir: str) -> Dict[str, Any]:
+    return _fetch_parse_case(param, as_text=True)
+
+
+@benchmark("check_url_content", ["page"], rounds=5)
+def bench_check_url_content(param: str, workdir: str) -> Optional[Dict[str, Any]]:
+    try:
+        import bs4  # noqa: F401 - check_url_content needs it
+    except ImportError:
+        return None
+    from src.url_status_checker import check_url_content
+    from tests.sitemap_server import SitemapServer
+
+    server = SitemapServer({DOMAIN: 1}, local_locs=True).start()
+    urls = [f"{server.page_base(DOMAIN)}/section-{i % 13}/page-{i}" for i in range(50)]
+
+    def run():
+        for url in urls:
+            check_url_content(url, user_agent="BenchMicro/1.0")
+
+    return {"run": run, "items": len(urls), "cleanup": server.stop}
+
+
+# =============================================================================
+# RUNNER
+# =============================================================================
+
+def measure(case: Dict[str, Any], rounds: int, warmup: int = 1) -> Dict[str, Any]:
+    times = []
+    for i in range(warmup + rounds):
+        if case.get("prepare"):
+            case["prepare"]()
+        start = time.perf_counter()
+        case["run"]()
+        elapsed = time.perf_counter() - start
+        if i >= warmup:
+            times.append(elapsed)
+    median = statistics.median(times)
+    return {
+        "rounds": rounds,
+        "median_s": round(median, 6),
+        "min_s": round(min(times), 6),
+        "max_s": round(max(times), 6),
+        "items": case["items"],
+        "items_per_sec": round(case["items"] / median) if median else None,
+    }
+
+
+def compare(result: Dict[str, Any], baseline: Optional[Dict[str, Any]], tolerance: float) -> str:
+    if not baseline:
+        return "new"
+    ratio = result["median_s"] / baseline["median_s"] if baseline.get("median_s") else 1.0
+    result["vs_baseline"] = round(ratio, 3)
+    if ratio > 1 + tolerance:
+        return "REGRESSION"
+    if ratio < 1 - tolerance:
+        return "faster"
+    return "ok"
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--only", nargs="+", help="Run cases whose name starts with any of these")
+    ap.add_argument("--quick", action="store_true", help="Skip the slowest sizes (1m)")
+    ap.add_argument("--rounds", type=int, help="Override rounds per case")
+    ap.add_argument("--tolerance", type=float, default=0.25, help="Allowed slowdown vs baseline (0.25 = 25%%)")
+    ap.add_argument("--baseline", default=BASELINE_PATH)
+    ap.add_argument("--save-baseline", action="store_true", help="Store these results as the new baseline")
+    ap.add_argument("--check", action="store_true", help="Exit 1 on any regression")
+    ap.add_argument("--json", help="Write results to this JSON file")
+    args = ap.parse_args()
+
+    import logging
+    logging.disable(logging.INFO)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f).get("results", {})
+
+    print("=" * 86)
+    print("MICRO-BENCHMARKS")
+    print("=" * 86)
+    print(f"{'case':<34} {'median s':>10} {'min s':>10} {'items/s':>12} {'vs base':>8}  status")
+
+    results, regressions = {}, []
+    with tempfile.TemporaryDirectory() as workdir:
+        for name, spec in BENCHMARKS.items():
+            if args.only and not any(name.startswith(prefix) for prefix in args.only):
+                continue
+            for param in spec["params"]:
+                if args.quick and param in spec["slow"]:
+                    continue
+                key = f"{name}[{param}]"
+                case = spec["factory"](param, workdir)
+                if case is None:
+                    print(f"{key:<34} {'':>10} {'':>10} {'':>12} {'':>8}  skipped (missing dependency)")
+                    continue
+                try:
+                    result = measure(case, args.rounds or spec["rounds"])
+                finally:
+                    if case.get("cleanup"):
+                        case["cleanup"]()
+                status = compare(result, baseline.get(key), args.tolerance)
+                results[key] = result
+                if status == "REGRESSION":
+                    regressions.append(key)
+                ratio = f"{result['vs_baseline']:.2f}x" if "vs_baseline" in result else "-"
+                print(
+                    f"{key:<34} {result['median_s']:>10.4f} {result['min_s']:>10.4f} "
+                    f"{result['items_per_sec'] or 0:>12,} {ratio:>8}  {status}"
+                )
+
+    report = {
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "results": results,
+    }
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nWrote {args.json}")
+    if args.save_baseline:
+        merged = {**baseline, **results}
+        with open(args.baseline, "w") as f:
+            json.dump({**report, "results": dict(sorted(merged.items()))}, f, indent=2)
+        print(f"\nSaved baseline: {args.baseline}")
+    if regressions:
+        print(f"\nRegressions (> {args.tolerance:.0%} slower than baseline): {', '.join(regressions)}")
+        if args.check:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,159 @@
+"""
+Streaming Pipeline Memory Benchmark
+Measures peak RSS of the fetch -> parse -> diff pipeline per domain.
+
+Each (domain size, batch size) case runs in its own subprocess so peak
+RSS (ru_maxrss) is not polluted by earlier cases. Sitemaps are generated
+on the fly by an in-process stub fetcher (no network): a sitemap index
+pointing at children of CHILD_URLS URLs each.
+
+Every case runs twice in fresh processes:
+  seed   - first crawl, no snapshot on disk yet
+  steady - second crawl (~5% URLs changed), the normal daily run
+
+With a fixed memory budget the steady-state peak should track the batch
+size and budget, not the number of URLs in the domain.
+
+Run: py tests/bench_streaming.py
+     py tests/bench_streaming.py --sizes 100000 1000000 --batches 1000 10000 --budget-mb 32
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+# Add project root to path
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+CHILD_URLS = 50_000
+DOMAIN = "bench.example.com"
+
+
+class StubFetcher:
+    """Serves a synthetic sitemap index and its urlset children."""
+
+    def __init__(self, n_urls: int, run: int):
+        self.n_urls = n_urls
+        self.run = run
+        self.n_children = max(1, -(-n_urls // CHILD_URLS))
+
+    def fetch_sitemap_bytes(self, url: str) -> bytes:
+        base = f"https://{DOMAIN}"
+        if url.endswith("/sitemap.xml"):
+            children = "".join(
+                f"<sitemap><loc>{base}/sitemap-{i}.xml</loc></sitemap>"
+                for i in range(self.n_children)
+            )
+            return (
+                '<?xml version="1.0" encoding="UTF-8"?>'
+                '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+                f"{children}</sitemapindex>"
+            ).encode()
+
+        child = int(url.rsplit("-", 1)[1].split(".")[0])
+        start = child * CHILD_URLS
+        stop = min(self.n_urls, start + CHILD_URLS)
+        parts = [
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+        ]
+        for i in range(start, stop):
+            # Second run: every 20th URL gets a new lastmod
+            day = 2 if (self.run > 1 and i % 20 == 0) else 1
+            parts.append(
+                f"<url><loc>{base}/page/{i}</loc><lastmod>2025-01-{day:02d}</lastmod></url>"
+            )
+        parts.append("</urlset>")
+        return "".join(parts).encode()
+
+
+def run_case(n_urls: int, batch_size: int, budget_mb: float, data_dir: str, run: int) -> dict:
+    """Runs one crawl + diff in this process and reports timing and peak RSS."""
+    import logging
+    logging.disable(logging.INFO)
+
+    from src.data_processor import DataProcessor
+    from src.main import iter_sitemap_url_batches
+    from src.sitemap_parser import SitemapParser
+
+    rss_before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    dp = DataProcessor(
+        data_dir=data_dir,
+        diff_config={"mode": "auto", "memory_budget_mb": budget_mb, "chunk_rows": batch_size},
+    )
+    start = time.perf_counter()
+    batches = iter_sitemap_url_batches(
+        sitemap_url=f"https://{DOMAIN}/sitemap.xml",
+        fetcher=StubFetcher(n_urls, run),
+        parser=SitemapParser(),
+        processed_sitemap_urls=set(),
+        domain=DOMAIN,
+        batch_size=batch_size,
+    )
+    dp.process_url_batches(DOMAIN, batches)
+    elapsed = time.perf_counter() - start
+
+    return {
+        "urls": n_urls,
+        "batch_size": batch_size,
+        "run": "seed" if run == 1 else "steady",
+        "seconds": round(elapsed, 2),
+        "urls_per_sec": round(n_urls / elapsed) if elapsed else None,
+        "baseline_rss_mb": round(rss_before / 1024, 1),
+        "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+    }
+
+
+def spawn_case(n_urls: int, batch_size: int, budget_mb: float, data_dir: str, run: int) -> dict:
+    cmd = [
+        sys.executable, os.path.abspath(__file__), "--case",
+        str(n_urls), str(batch_size), str(budget_mb), data_dir, str(run),
+    ]
+    out = subprocess.run(cmd, capture_output=True, text=True, check=True)
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", type=int, nargs="+", default=[50_000, 200_000, 500_000])
+    ap.add_argument("--batches", type=int, nargs="+", default=[1_000, 10_000, 50_000])
+    ap.add_argument("--budget-mb", type=float, default=32)
+    ap.add_argument("--json", help="Write results to this JSON file")
+    ap.add_argument("--case", nargs=5, help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.case:
+        n_urls, batch_size, budget_mb, data_dir, run = args.case
+        print(json.dumps(run_case(int(n_urls), int(batch_size), float(budget_mb), data_dir, int(run))))
+        return
+
+    print("=" * 78)
+    print(f"STREAMING PIPELINE MEMORY BENCHMARK (budget {args.budget_mb} MB)")
+    print("=" * 78)
+    print(f"{'urls':>10} {'batch':>8} {'run':>7} {'secs':>8} {'urls/s':>10} {'base MB':>9} {'peak MB':>9}")
+
+    results = []
+    for n_urls in args.sizes:
+        for batch_size in args.batches:
+            with tempfile.TemporaryDirectory() as data_dir:
+                for run in (1, 2):
+                    r = spawn_case(n_urls, batch_size, args.budget_mb, data_dir, run)
+                    results.append(r)
+                    print(
+                        f"{r['urls']:>10,} {r['batch_size']:>8,} {r['run']:>7} {r['seconds']:>8} "
+                        f"{r['urls_per_sec']:>10,} {r['baseline_rss_mb']:>9} {r['peak_rss_mb']:>9}"
+                    )
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"budget_mb": args.budget_mb, "results": results}, f, indent=2)
+        print(f"\nWrote {args.json}")
+
+
+if __name__ == "__main__":
+    main()
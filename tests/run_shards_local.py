@@ -0,0 +1,122 @@
+"""
+Local Sharded Run
+Runs N shard processes plus the coordinator merge against a local
+synthetic sitemap server (no network).
+
+Each shard is a separate `python -m src.main --shard i/N` process with
+its own output directory (as on separate runner nodes); the coordinator
+then merges them with `--merge-shards`. Checks that every domain was
+processed exactly once and reports wall-clock time per phase.
+
+Run: py tests/run_shards_local.py
+     py tests/run_shards_local.py --shards 4 --domains 12 --urls 20000
+"""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+# Add project root to path
+PROJECT_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, PROJECT_ROOT)
+
+from tests.sitemap_server import SitemapServer
+
+RUN_ID = "local-run"
+
+
+def write_config(path: str, server: SitemapServer, data_dir: str) -> None:
+    targets = [
+        {
+            "domain": domain,
+            "sitemap_url": server.sitemap_url(domain),
+            "user_agent": "ShardLocalRun/1.0",
+            "download_delay": 0,
+        }
+        for domain in server.domains
+    ]
+    with open(path, "w") as f:
+        json.dump({
+            "targets": targets,
+            "data_directory": data_dir,
+            "stealth_fallback": False,
+            "max_concurrent_domains": 2,
+        }, f, indent=2)
+
+
+def run_main(*args: str) -> float:
+    start = time.perf_counter()
+    subprocess.run([sys.executable, "-m", "src.main", *args], cwd=PROJECT_ROOT,
+                   check=True, capture_output=True)
+    return time.perf_counter() - start
+
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--shards", type=int, default=3)
+    ap.add_argument("--domains", type=int, default=8)
+    ap.add_argument("--urls", type=int, default=5_000, help="URLs per domain")
+    args = ap.parse_args()
+
+    domains = {f"shard{i}.test": args.urls for i in range(args.domains)}
+
+    with tempfile.TemporaryDirectory() as tmp, SitemapServer(domains, urls_per_child=2_000) as server:
+        # 1. One output directory and config per shard node
+        node_dirs, configs = [], []
+        for i in range(args.shards):
+            node_dir = os.path.join(tmp, f"node{i}")
+            config_path = os.path.join(tmp, f"config{i}.json")
+            write_config(config_path, server, node_dir)
+            node_dirs.append(node_dir)
+            configs.append(config_path)
+
+        # 2. Shards run concurrently, as separate processes
+        start = time.perf_counter()
+        procs = [
+            subprocess.Popen(
+                [sys.executable, "-m", "src.main", "--config", configs[i],
+                 "--shard", f"{i}/{args.shards}", "--run-id", RUN_ID],
+                cwd=PROJECT_ROOT, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+            )
+            for i in range(args.shards)
+        ]
+        codes = [p.wait() for p in procs]
+        shard_seconds = time.perf_counter() - start
+        if any(codes):
+            sys.exit(f"Shard exit codes: {codes}")
+
+        # 3. Coordinator merges into node 0's directory
+        merge_seconds = run_main("--config", configs[0], "--merge-shards", RUN_ID,
+                                 "--shard-dirs", *node_dirs)
+        with open(os.path.join(node_dirs[0], "_runs", RUN_ID, "summary.json")) as f:
+            summary = json.load(f)
+
+    ok = (
+        sorted(summary["domains"]) == sorted(domains)
+        and not summary["missing_shards"]
+        and not summary["conflicts"]
+        and not summary["unassigned_domains"]
+        and summary["totals"]["urls"] == args.urls * args.domains
+    )
+    shard_sizes = {}
+    for result in summary["domains"].values():
+        shard_sizes[result["shard"]] = shard_sizes.get(result["shard"], 0) + 1
+
+    print("=" * 60)
+    print(f"LOCAL SHARDED RUN ({args.shards} shards, {args.domains} domains x {args.urls:,} URLs)")
+    print("=" * 60)
+    print(f"Domains per shard: {dict(sorted(shard_sizes.items()))}")
+    print(f"Shards (parallel): {shard_seconds:.1f}s")
+    print(f"Merge:             {merge_seconds:.1f}s")
+    print(f"Server requests:   {server.requests} ({server.bytes_sent / 1e6:.1f} MB)")
+    print(f"Totals:            {summary['totals']}")
+    print("OK" if ok else "MISMATCH")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,360 @@
+"""
+Local Synthetic Sitemap Server
+HTTP stand-in for real sites, for local multi-process runs and benchmarks.
+
+Serves, for each configured domain:
+    /<domain>/sitemap.xml              sitemap index
+    /<domain>/sitemap-<k>.xml[.gz]     urlset children (urls_per_child URLs each)
+    /<domain>/robots.txt               allow-all robots.txt
+    /<domain>/<anything else>          HTML page (HEAD and GET)
+
+Options:
+- gzip_children: index points at .xml.gz children served as gzip files
+- local_locs: page locs point back at this server (so status checks can
+  HEAD them) instead of https://<domain>/...
+- sitemap_faults / page_faults: injected per request from a seeded RNG
+    {"latency_ms": 20, "latency_jitter_ms": 10,
+     "forbidden_rate": 0.01, "rate_limited_rate": 0.01, "redirect_rate": 0.05}
+  Redirects point at /<domain>/_moved/<path>, which is served without faults.
+  "truncate_rate" (sitemaps): a full response stops halfway and the
+  connection drops (Range requests are never cut)
+- ranges: honour "Range: bytes=N-" (with If-Range against the ETag) on
+  sitemaps with 206 Partial Content; off, Range is ignored (full 200)
+- image_titles: each URL carries an <image:image> with a non-ASCII title
+  (UTF-8 body without a charset header, like many real sitemaps)
+- generation: bump between runs; every 20th URL gets a new lastmod
+  (only in the first `hot_children` children of each domain, if set)
+
+Usage:
+    with SitemapServer({"a.test": 5000, "b.test": 120000}) as server:
+        server.sitemap_url("a.test")   # http://127.0.0.1:<port>/a.test/sitemap.xml
+
+Run standalone: py tests/sitemap_server.py --domains a.test=5000 b.test=20000 --gzip
+"""
+
+import argparse
+import gzip
+import hashlib
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, Optional, Tuple
+
+DEFAULT_URLS_PER_CHILD = 50_000
+MOVED = "_moved"
+SECTIONS = ["mortgages", "credit-cards", "loans", "banking", "investing", "insurance", "taxes"]
+
+PAGE_TEMPLATE = """<!DOCTYPE html>
+<html><head>
+<title>{title}</title>
+<meta name="description" content="Synthetic page {n} for local benchmarks.">
+<meta name="robots" content="index, follow">
+<link rel="canonical" href="{canonical}">
+<meta property="og:title" content="{title}">
+<script type="application/ld+json">{{"@type": "Article", "headline": "{title}"}}</script>
+</head><body>
+<h1>{title}</h1>
+{body}
+</body></html>
+"""
+
+
+class SitemapServer:
+    """Threaded local HTTP server generating sitemaps and pages on request."""
+
+    def __init__(
+        self,
+        domains: Dict[str, int],
+        urls_per_child: int = DEFAULT_URLS_PER_CHILD,
+        host: str = "127.0.0.1",
+        port: int = 0,
+        gzip_children: bool = False,
+        local_locs: bool = False,
+        sitemap_faults: Optional[Dict[str, float]] = None,
+        page_faults: Optional[Dict[str, float]] = None,
+        seed: int = 0,
+        hot_children: Optional[int] = None,
+        image_titles: bool = False,
+        ranges: bool = True,
+    ):
+        self.domains = dict(domains)
+        self.urls_per_child = urls_per_child
+        self.gzip_children = gzip_children
+        self.local_locs = local_locs
+        self.sitemap_faults = sitemap_faults or {}
+        self.page_faults = page_faults or {}
+        self.generation = 1
+        self.hot_children = hot_children
+        self.image_titles = image_titles
+        self.ranges = ranges
+        self._rng = random.Random(seed)
+        self._lock = threading.Lock()
+        self._gz_cache: Dict[Tuple[str, int, int], bytes] = {}
+        self.reset_stats()
+        self._httpd = ThreadingHTTPServer((host, port), self._handler_class())
+        self._httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    # -- lifecycle ---------------------------------------------------------
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def sitemap_url(self, domain: str) -> str:
+        return f"{self.base_url}/{domain}/sitemap.xml"
+
+    def start(self) -> "SitemapServer":
+        # Short poll interval: stop() returns within 50 ms, not 0.5 s
+        self._thread = threading.Thread(target=self._httpd.serve_forever, args=(0.05,), daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._httpd.shutdown()
+        self._httpd.server_close()
+
+    def __enter__(self) -> "SitemapServer":
+        return self.start()
+
+    def __exit__(self, *exc) -> None:
+        self.stop()
+
+    # -- stats -------------------------------------------------------------
+
+    def reset_stats(self) -> None:
+        with self._lock:
+            self.requests = 0
+            self.bytes_sent = 0
+            self.status_counts: Dict[int, int] = {}
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {
+                "requests": self.requests,
+                "bytes_sent": self.bytes_sent,
+                "status_counts": {str(k): v for k, v in sorted(self.status_counts.items())},
+            }
+
+    def _count(self, status: int, n_bytes: int) -> None:
+        with self._lock:
+            self.requests += 1
+            self.bytes_sent += n_bytes
+            self.status_counts[status] = self.status_counts.get(status, 0) + 1
+
+    # -- content -----------------------------------------------------------
+
+    def n_children(self, domain: str) -> int:
+        return max(1, -(-self.domains[domain] // self.urls_per_child))
+
+    def page_base(self, domain: str) -> str:
+        return f"{self.base_url}/{domain}" if self.local_locs else f"https://{domain}"
+
+    def render_index(self, domain: str) -> bytes:
+        ext = ".xml.gz" if self.gzip_children else ".xml"
+        children = "".join(
+            f"<sitemap><loc>{self.base_url}/{domain}/sitemap-{k}{ext}</loc></sitemap>"
+            for k in range(self.n_children(domain))
+        )
+        return (
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+            f"{children}</sitemapindex>"
+        ).encode()
+
+    def render_urlset(self, domain: str, child: int) -> bytes:
+        generation = self.generation if self.hot_children is None or child < self.hot_children else 1
+        start = child * self.urls_per_child
+        stop = min(self.domains[domain], start + self.urls_per_child)
+        base = self.page_base(domain)
+        image_ns = ' xmlns:image="http://www.google.com/schemas/sitemap-image/1.1"' if self.image_titles else ""
+        parts = [
+            '<?xml version="1.0" encoding="UTF-8"?>'
+            f'<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9"{image_ns}>'
+        ]
+        for i in range(start, stop):
+            # Later generations: every 20th URL gets a new lastmod
+            day = generation if i % 20 == 0 else 1
+            image = (
+                f"<image:image><image:loc>{base}/img/{i}.jpg</image:loc>"
+                f"<image:title>Página {i} – guía rápida de préstamos</image:title></image:image>"
+                if self.image_titles else ""
+            )
+            parts.append(
+                f"<url><loc>{base}/{SECTIONS[i % len(SECTIONS)]}/topic-{i % 97}/page-{i}</loc>"
+                f"<lastmod>2025-01-{(day - 1) % 28 + 1:02d}</lastmod>{image}</url>"
+            )
+        parts.append("</urlset>")
+        return "".join(parts).encode()
+
+    def render_gz_urlset(self, domain: str, child: int) -> bytes:
+        key = (domain, child, self.generation if self.hot_children is None or child < self.hot_children else 1)
+        body = self._gz_cache.get(key)
+        if body is None:
+            body = gzip.compress(self.render_urlset(domain, child), compresslevel=5)
+            self._gz_cache[key] = body
+        return body
+
+    def render_page(self, domain: str, path: str) -> bytes:
+        n = int(hashlib.md5(path.encode()).hexdigest()[:8], 16)
+        title = path.strip("/").replace("/", " - ").replace("-", " ").title() or domain
+        paragraph = "<p>" + " ".join(f"word{(n + j) % 997}" for j in range(60)) + "</p>"
+        return PAGE_TEMPLATE.format(
+            title=title, n=n, canonical=f"{self.page_base(domain)}{path}", body=paragraph * 8
+        ).encode()
+
+    def route(self, path: str) -> Tuple[Optional[bytes], str, bool]:
+        """
+        Body, content type and whether the path is a sitemap, for a GET path.
+        Body None means 404.
+        """
+        parts = path.split("?", 1)[0].lstrip("/").split("/", 1)
+        domain = parts[0]
+        rest = "/" + (parts[1] if len(parts) > 1 else "")
+        if domain not in self.domains:
+            return None, "text/plain", False
+        if rest.startswith(f"/{MOVED}/"):
+            rest = rest[len(MOVED) + 1:]
+
+        if rest == "/robots.txt":
+            body = f"User-agent: *\nAllow: /\nSitemap: {self.sitemap_url(domain)}\n".encode()
+            return body, "text/plain", False
+        if rest == "/sitemap.xml":
+            return self.render_index(domain), "application/xml", True
+        if rest.startswith("/sitemap-") and rest.endswith((".xml", ".xml.gz")):
+            try:
+                child = int(rest[len("/sitemap-"):].split(".", 1)[0])
+            except ValueError:
+                return None, "text/plain", True
+            if child >= self.n_children(domain):
+                return None, "text/plain", True
+            if rest.endswith(".gz"):
+                return self.render_gz_urlset(domain, child), "application/x-gzip", True
+            return self.render_urlset(domain, child), "application/xml", True
+        return self.render_page(domain, rest), "text/html; charset=utf-8", False
+
+    def draw_fault(self, path: str, is_sitemap: bool) -> Tuple[float, Optional[int]]:
+        """
+        Injected latency (seconds) and status override (403/429/302) for one request.
+        """
+        if f"/{MOVED}/" in path or path.endswith("/robots.txt"):
+            return 0.0, None
+        faults = self.sitemap_faults if is_sitemap else self.page_faults
+        if not faults:
+            return 0.0, None
+        with self._lock:
+            jitter = self._rng.uniform(-1, 1) * faults.get("latency_jitter_ms", 0)
+            roll = self._rng.random()
+        latency = max(0.0, (faults.get("latency_ms", 0) + jitter) / 1000)
+        for status, key in ((403, "forbidden_rate"), (429, "rate_limited_rate"), (302, "redirect_rate")):
+            rate = faults.get(key, 0)
+            if roll < rate:
+                return latency, status
+            roll -= rate
+        return latency, None
+
+    def draw_truncate(self, is_sitemap: bool) -> bool:
+        rate = self.sitemap_faults.get("truncate_rate", 0) if is_sitemap else 0
+        if not rate:
+            return False
+        with self._lock:
+            return self._rng.random() < rate
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            # Headers and body go out as separate writes: without this, each
+            # keep-alive response waits on the client's delayed ACK (~40 ms)
+            disable_nagle_algorithm = True
+
+            def _respond(self, send_body: bool):
+                body, content_type, is_sitemap = server.route(self.path)
+                latency, fault = server.draw_fault(self.path, is_sitemap)
+                if latency:
+                    time.sleep(latency)
+
+                if body is None:
+                    status, headers, body = 404, {"Content-Type": "text/plain"}, b"not found"
+                elif fault == 302:
+                    domain, _, rest = self.path.lstrip("/").partition("/")
+                    status, body = 302, b""
+                    headers = {"Location": f"{server.base_url}/{domain}/{MOVED}/{rest}"}
+                elif fault in (403, 429):
+                    status, headers, body = fault, {"Content-Type": "text/plain"}, b"blocked"
+                    if fault == 429:
+                        headers["Retry-After"] = "0"
+                else:
+                    status = 200
+                    etag = f'"{hashlib.md5(body).hexdigest()[:16]}"'
+                    headers = {
+                        "Content-Type": content_type,
+                        "ETag": etag,
+                        "Last-Modified": "Wed, 01 Jan 2025 00:00:00 GMT",
+                        "Cache-Control": "max-age=300",
+                    }
+                    if is_sitemap and server.ranges:
+                        headers["Accept-Ranges"] = "bytes"
+                        requested = self.headers.get("Range", "")
+                        if_range = self.headers.get("If-Range")
+                        if requested.startswith("bytes=") and if_range in (None, etag):
+                            start = int(requested[len("bytes="):].split("-", 1)[0])
+                            if start < len(body):
+                                headers["Content-Range"] = f"bytes {start}-{len(body) - 1}/{len(body)}"
+                                status, body = 206, body[start:]
+
+                truncate = status == 200 and send_body and is_sitemap and server.draw_truncate(is_sitemap)
+                self.send_response(status)
+                for name, value in headers.items():
+                    self.send_header(name, value)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                if truncate:
+                    # Half the promised bytes, then drop the connection
+                    body = body[:len(body) // 2]
+                    self.close_connection = True
+                if send_body:
+                    self.wfile.write(body)
+                server._count(status, len(body) if send_body else 0)
+
+            def do_GET(self):
+                self._respond(send_body=True)
+
+            def do_HEAD(self):
+                self._respond(send_body=False)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+def main():
+    ap = argparse.ArgumentParser(description="Serve synthetic sitemaps locally")
+    ap.add_argument("--domains", nargs="+", default=["a.test=1000"], metavar="DOMAIN=URLS")
+    ap.add_argument("--port", type=int, default=8765)
+    ap.add_argument("--urls-per-child", type=int, default=DEFAULT_URLS_PER_CHILD)
+    ap.add_argument("--gzip", action="store_true", help="Serve children as .xml.gz")
+    ap.add_argument("--local-locs", action="store_true", help="Page locs point at this server")
+    args = ap.parse_args()
+
+    domains = {d.split("=")[0]: int(d.split("=")[1]) for d in args.domains}
+    server = SitemapServer(
+        domains, urls_per_child=args.urls_per_child, port=args.port,
+        gzip_children=args.gzip, local_locs=args.local_locs,
+    )
+    print(f"Serving {len(domains)} domains at {server.base_url}")
+    for domain in domains:
+        print(f"  {server.sitemap_url(domain)}")
+    server.start()
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.stop()
+
+
+if __name__ == "__main__":
+    main()
@@ -2,9 +2,10 @@
 SMOKE TESTS - Fast, Deterministic, No Network
 
 Run: py tests/test_smoke.py
-Time: < 2 seconds
+Time: ~15 seconds (crawl tests run against a local SitemapServer)
 
-These tests verify code structure and logic without any network calls.
+These tests verify code structure and logic without any network calls
+beyond localhost.
 Should pass 100% of the time if code is correct.
 """
 
@@ -327,6 +328,1376 @@ def test_schema_consistency():
         log(f"{domain} schema", all_correct, 
             f"{len(change_files)} files, all {expected_cols} cols" if all_correct else "Schema mismatch")
 
+# =============================================================================
+# 10. EXTERNAL DIFF (2 tests)
+# =============================================================================
+
+def test_external_diff():
+    print("\n[10] EXTERNAL DIFF")
+    
+    try:
+        from src.data_processor import DataProcessor
+    except Exception as e:
+        log("External diff import", False, str(e))
+        return
+    
+    run1 = [{"loc": f"https://example.com/a/{i}", "lastmod": f"2025-01-{i % 28 + 1:02d}",
+             "sitemap_source_url": "https://example.com/s.xml"} for i in range(500)]
+    run2 = [dict(u) for u in run1[50:]]
+    for u in run2[:25]:
+        u["lastmod"] = "2025-06-01"
+    run2 += [{"loc": f"https://example.com/b/{i}", "lastmod": None,
+              "sitemap_source_url": "https://example.com/s.xml"} for i in range(40)]
+    
+    results = {}
+    for mode in ["memory", "external"]:
+        with tempfile.TemporaryDirectory() as tmp:
+            dp = DataProcessor(data_dir=tmp, diff_config={"mode": mode, "partitions": 4, "chunk_rows": 100})
+            dp.process_sitemap_urls("example.com", run1)
+            dp.process_sitemap_urls("example.com", run2)
+            domain_dir = Path(tmp) / "example.com"
+            changes = pd.concat(pd.read_csv(f) for f in domain_dir.glob("*_changes_*.csv"))
+            snapshot = pd.read_csv(domain_dir / "example.com_urls.csv")
+            results[mode] = (
+                list(zip(changes["loc"], changes["change_type"])),
+                list(zip(snapshot["loc"], snapshot["change_type"])),
+            )
+    
+    # 10.1 Same discovered/modified/removed rows, same order
+    log("External changes match", results["memory"][0] == results["external"][0],
+        f"{len(results['external'][0])} change rows")
+    
+    # 10.2 Same snapshot (present/modified/discovered)
+    log("External snapshot match", results["memory"][1] == results["external"][1],
+        f"{len(results['external'][1])} URLs")
+
+# =============================================================================
+# 11. STREAMING PIPELINE (3 tests)
+# =============================================================================
+
+def test_streaming():
+    print("\n[11] STREAMING PIPELINE")
+    
+    try:
+        from src.sitemap_parser import SitemapParser
+        from src.data_processor import DataProcessor
+    except Exception as e:
+        log("Streaming import", False, str(e))
+        return
+    
+    parser = SitemapParser()
+    urlset_xml = (
+        '<?xml version="1.0" encoding="UTF-8"?>'
+        '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+        + "".join(f"<url><loc>https://example.com/p/{i}</loc><lastmod>2025-01-01</lastmod></url>"
+                  for i in range(25))
+        + "<url><lastmod>2025-01-01</lastmod></url></urlset>"
+    )
+    
+    # 11.1 Batches carry the same rows as the tree parser
+    streamed = parser.iter_sitemap(urlset_xml, "https://example.com/s.xml", batch_size=10)
+    batches = list(streamed["batches"] or [])
+    tree = parser.parse_sitemap(urlset_xml, "https://example.com/s.xml")["urls"]
+    rows = pd.concat(batches).to_dict("records") if batches else []
+    log("Streamed urlset", [len(b) for b in batches] == [10, 10, 5] and rows == tree,
+        f"{len(batches)} batches")
+    
+    # 11.2 Sitemap index yields child links, no batches
+    index_xml = (
+        '<sitemapindex xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+        "<sitemap><loc>https://example.com/a.xml</loc></sitemap>"
+        "<sitemap><loc>https://example.com/b.xml</loc></sitemap></sitemapindex>"
+    )
+    streamed = parser.iter_sitemap(index_xml, "https://example.com/index.xml")
+    log("Streamed index", streamed["type"] == "sitemapindex" and len(streamed["urls"]) == 2)
+    
+    # 11.3 Batch entry point writes the same snapshot as the list entry point
+    urls = [{"loc": f"https://example.com/p/{i}", "lastmod": "2025-01-01",
+             "sitemap_source_url": "https://example.com/s.xml"} for i in range(300)]
+    snapshots = []
+    for use_batches in (False, True):
+        with tempfile.TemporaryDirectory() as tmp:
+            dp = DataProcessor(data_dir=tmp)
+            if use_batches:
+                frame = pd.DataFrame(urls)
+                dp.process_url_batches("example.com", (frame.iloc[i:i + 64] for i in range(0, 300, 64)))
+            else:
+                dp.process_sitemap_urls("example.com", urls)
+            snapshot = pd.read_csv(Path(tmp) / "example.com" / "example.com_urls.csv")
+            snapshots.append(list(zip(snapshot["loc"], snapshot["change_type"])))
+    log("Batch pipeline", snapshots[0] == snapshots[1] and len(snapshots[0]) == 300,
+        f"{len(snapshots[1])} URLs")
+
+# =============================================================================
+# 12. URL CLASSIFIER (3 tests)
+# =============================================================================
+
+def test_url_classifier():
+    print("\n[12] URL CLASSIFIER")
+    
+    try:
+        from src.url_classifier import UrlClassifier, classify_urls
+    except Exception as e:
+        log("Classifier import", False, str(e))
+        return
+    
+    locs = pd.Series([
+        "https://www.bankrate.com/",
+        "https://www.bankrate.com/mortgages/rates/ny/?utm=x",
+        "https://www.bankrate.com//loans/",
+    ])
+    
+    # 12.1 Default path-based classification
+    result = classify_urls(locs)
+    expected = [("home", 0), ("mortgages", 3), ("loans", 1)]
+    got = list(zip(result["section"], result["path_depth"]))
+    log("Path sections", got == expected and result["subsection"].iloc[1] == "rates", str(got))
+    
+    # 12.2 Rule table: longest prefix wins
+    classifier = UrlClassifier({"bankrate.com": [
+        {"prefix": "/mortgages/", "section": "mortgage"},
+        {"prefix": "/mortgages/rates/", "section": "mortgage", "subsection": "rate-tables"},
+    ]})
+    result = classifier.classify("bankrate.com", locs)
+    log("Section rules", list(result["subsection"])[1] == "rate-tables" and result["section"].iloc[1] == "mortgage")
+    
+    # 12.3 Cached results match fresh ones, in any order
+    again = classifier.classify("bankrate.com", locs.iloc[::-1])
+    log("Classifier cache", again.loc[locs.index].equals(result) and classifier.cache_size("bankrate.com") == 3,
+        f"{classifier.cache_size()} cached")
+
+# =============================================================================
+# 13. CHANGE LOG SEGMENTS (3 tests)
+# =============================================================================
+
+def test_change_log_segments():
+    print("\n[13] CHANGE LOG SEGMENTS")
+    
+    try:
+        from src.change_log import (
+            CHANGE_LOG_SCHEMAS, CURRENT_SCHEMA_VERSION, append_changes, iter_change_log, load_manifest,
+        )
+    except Exception as e:
+        log("Change log import", False, str(e))
+        return
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        path = str(Path(tmp) / "example.com_changes_2025-01.csv")
+        v1 = pd.DataFrame({"detected_at": ["2025-01-01"], "domain": ["example.com"],
+                           "loc": ["https://example.com/old"], "change_type": ["discovered"]})
+        v1.reindex(columns=CHANGE_LOG_SCHEMAS[1]).to_csv(path, index=False)
+        legacy_bytes = Path(path).read_bytes()
+        
+        new_rows = pd.DataFrame({"detected_at": ["2025-01-02"], "domain": ["example.com"],
+                                 "loc": ["https://example.com/new"], "change_type": ["discovered"],
+                                 "first_seen_at": ["2025-01-02"]})
+        append_changes(new_rows, path, CHANGE_LOG_SCHEMAS[2])
+        append_changes(new_rows, path, CHANGE_LOG_SCHEMAS[2])
+        
+        # 13.1 Old segment untouched, new schema in its own segment
+        segments = load_manifest(path)["segments"]
+        log("Segment per schema", Path(path).read_bytes() == legacy_bytes
+            and [s["schema_version"] for s in segments] == [1, 2] and segments[1]["rows"] == 2,
+            f"{[s['file'] for s in segments]}")
+        
+        # 13.2 Manifest persisted as sidecar
+        log("Sidecar manifest", (Path(tmp) / "example.com_changes_2025-01.manifest.json").exists())
+        
+        # 13.3 Readers union segments under the current schema
+        combined = pd.concat(iter_change_log([path]))
+        log("Segment union", len(combined) == 3 and list(combined.columns) == CHANGE_LOG_SCHEMAS[CURRENT_SCHEMA_VERSION]
+            and combined["first_seen_at"].isna().sum() == 1, f"{len(combined)} rows")
+
+# =============================================================================
+# 14. PROCESS EXECUTOR (2 tests)
+# =============================================================================
+
+def test_process_executor():
+    print("\n[14] PROCESS EXECUTOR")
+    
+    import multiprocessing
+    import os
+    import threading
+    from functools import partial
+    from http.server import ThreadingHTTPServer, SimpleHTTPRequestHandler
+    
+    if "fork" not in multiprocessing.get_all_start_methods():
+        log("Process executor", True, "skipped (no fork on this platform)")
+        return
+    
+    try:
+        import src.main as main_module
+    except Exception as e:
+        log("Process executor import", False, str(e))
+        return
+    
+    class QuietHandler(SimpleHTTPRequestHandler):
+        def log_message(self, *args):
+            pass
+    
+    with tempfile.TemporaryDirectory() as tmp:
+        site = Path(tmp) / "site"
+        site.mkdir()
+        for name in ("a", "b"):
+            urls = "".join(f"<url><loc>https://{name}.test/p/{i}</loc></url>" for i in range(20))
+            (site / f"{name}.xml").write_text(
+                f'<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">{urls}</urlset>')
+        
+        server = ThreadingHTTPServer(("127.0.0.1", 0), partial(QuietHandler, directory=str(site)))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        base = f"http://127.0.0.1:{server.server_address[1]}"
+        
+        targets = [
+            {"domain": f"{name}.test", "sitemap_url": f"{base}/{name}.xml",
+             "user_agent": "SmokeTest/1.0", "download_delay": 0}
+            for name in ("a", "b", "crash")
+        ]
+        config = {"targets": targets, "process_start_method": "fork", "stealth_fallback": False}
+        
+        # Forked workers inherit this patch: one domain kills its process
+        original = main_module.process_domain
+        def crashing(target, *args, **kwargs):
+            if target["domain"] == "crash.test":
+                os._exit(3)
+            return original(target, *args, **kwargs)
+        main_module.process_domain = crashing
+        try:
+            results = main_module.run_domains_in_processes(targets, config, str(Path(tmp) / "out"), {}, 2)
+        finally:
+            main_module.process_domain = original
+            server.shutdown()
+        
+        # 14.1 Healthy domains finish in their own processes
+        ok = all(results.get(d, {}).get("status") == "success" and results[d].get("urls") == 20
+                 for d in ("a.test", "b.test"))
+        log("Process executor", ok and results["a.test"]["pid"] != os.getpid(),
+            str({d: r.get("status") for d, r in results.items()}))
+        
+        # 14.2 A crashed worker is reported, not fatal
+        log("Crash isolation", "crash" in results.get("crash.test", {}).get("message", ""),
+            results.get("crash.test", {}).get("message", ""))
+
+# =============================================================================
+# 15. SHARDING (3 tests)
+# =============================================================================
+
+def test_sharding():
+    print("\n[15] SHARDING")
+
+    import json
+    from datetime import timezone
+
+    try:
+        from src.sharding import (
+            merge_shards, parse_shard_spec, select_shard_targets, shard_of, write_shard_summary,
+        )
+    except Exception as e:
+        log("Sharding import", False, str(e))
+        return
+
+    domains = [f"site{i}.test" for i in range(200)]
+    targets = [{"domain": d} for d in domains]
+
+    # 15.1 Every domain in exactly one shard, same answer every time
+    owned = [[t["domain"] for t in select_shard_targets(targets, i, 4)] for i in range(4)]
+    flat = [d for shard in owned for d in shard]
+    log("Shard assignment", sorted(flat) == sorted(domains) and parse_shard_spec("3/4") == (3, 4)
+        and all(shard_of(d, 4) == shard_of(d, 4) for d in domains),
+        f"sizes {[len(s) for s in owned]}")
+
+    # 15.2 Growing 4 -> 5 shards only moves domains onto the new shard
+    moved = [d for d in domains if shard_of(d, 5) != shard_of(d, 4)]
+    log("Minimal movement", all(shard_of(d, 5) == 4 for d in moved) and 0 < len(moved) < 80,
+        f"{len(moved)}/200 moved")
+
+    # 15.3 Coordinator merges summaries and outputs from two nodes
+    with tempfile.TemporaryDirectory() as tmp:
+        started = datetime.now(timezone.utc)
+        dirs = [Path(tmp) / "node0", Path(tmp) / "node1"]
+        for i, node in enumerate(dirs):
+            mine = [d for d in domains[:6] if shard_of(d, 2) == i]
+            for d in mine:
+                (node / d).mkdir(parents=True)
+                (node / d / f"{d}_current.csv").write_text("loc\n")
+            (node / f"robots_cache.shard-{i}-of-2.json").write_text(json.dumps(
+                {"domains": {f"www.node{i}.test": {"fetched_at": started.isoformat()}}}))
+            write_shard_summary(str(node), "r1", i, 2, mine,
+                                {d: {"status": "success", "urls": 1} for d in mine}, started)
+
+        merged = merge_shards(str(dirs[0]), "r1", shard_dirs=[str(d) for d in dirs],
+                              expected_domains=domains[:6])
+        copied = all((dirs[0] / d / f"{d}_current.csv").exists() for d in domains[:6])
+        log("Shard merge", merged["totals"]["domains"] == 6 and not merged["missing_shards"]
+            and not merged["conflicts"] and copied and merged["totals"]["robots_cache_domains"] == 2,
+            f"{merged['totals']}")
+
+# =============================================================================
+# 16. GZIP SITEMAPS (1 test)
+# =============================================================================
+
+def test_gzip_sitemaps():
+    print("\n[16] GZIP SITEMAPS")
+
+    try:
+        from src.main import iter_sitemap_url_batches
+        from src.sitemap_fetcher import SitemapFetcher
+        from src.sitemap_parser import SitemapParser
+        from tests.sitemap_server import SitemapServer
+    except Exception as e:
+        log("Gzip import", False, str(e))
+        return
+
+    # 16.1 Index -> .xml.gz children, fetched and parsed like plain XML
+    with SitemapServer({"gz.test": 250}, urls_per_child=100, gzip_children=True) as server:
+        fetcher = SitemapFetcher({"download_delay": 0, "stealth_fallback": False})
+        batches = list(iter_sitemap_url_batches(
+            server.sitemap_url("gz.test"), fetcher, SitemapParser(), set(), "gz.test"))
+    n_urls = sum(len(b) for b in batches)
+    log("Gzip children", n_urls == 250, f"{n_urls} URLs from 3 .xml.gz children")
+
+# =============================================================================
+# 17. METRICS (3 tests)
+# =============================================================================
+
+def test_metrics():
+    print("\n[17] METRICS")
+
+    import time
+
+    try:
+        from src.metrics import RunMetrics, domain_context, prometheus_text, run_metrics
+        from src.main import iter_sitemap_url_batches
+        from src.sitemap_fetcher import SitemapFetcher
+        from src.sitemap_parser import SitemapParser
+        from tests.sitemap_server import SitemapServer
+    except Exception as e:
+        log("Metrics import", False, str(e))
+        return
+
+    # 17.1 Nested stages are exclusive: outer time excludes inner time
+    m = RunMetrics()
+    with domain_context("a.test"):
+        with m.stage("diff"):
+            time.sleep(0.02)
+            with m.stage("fetch"):
+                time.sleep(0.05)
+    stages = m.snapshot("a.test")["stages"]
+    log("Exclusive stages", 0.015 < stages["diff"]["seconds"] < 0.045 and stages["fetch"]["seconds"] >= 0.05,
+        f"diff {stages['diff']['seconds']:.3f}s, fetch {stages['fetch']['seconds']:.3f}s")
+
+    # 17.2 Fetcher and parser report bytes, sitemaps and stage times for the domain
+    run_metrics.reset()
+    with SitemapServer({"m.test": 300}, urls_per_child=100, gzip_children=True) as server:
+        fetcher = SitemapFetcher({"download_delay": 0, "stealth_fallback": False})
+        with domain_context("m.test"):
+            n_urls = sum(len(b) for b in iter_sitemap_url_batches(
+                server.sitemap_url("m.test"), fetcher, SitemapParser(), set(), "m.test"))
+        wire_bytes = server.stats()["bytes_sent"]
+    report = run_metrics.report({"m.test": {"status": "success", "urls": n_urls}})
+    domain = report["domains"]["m.test"]
+    log("Pipeline metrics", domain["counters"].get("bytes_downloaded") == wire_bytes
+        and len(domain["sitemaps"]) == 4 and {"fetch", "parse"} <= set(domain["stages"]),
+        f"{domain['counters']}, {len(domain['sitemaps'])} sitemaps")
+
+    # 17.3 Worker snapshot merges into the parent; Prometheus text renders
+    parent = RunMetrics()
+    parent.merge("m.test", run_metrics.snapshot("m.test"))
+    text = prometheus_text(parent.report({"m.test": {"status": "success", "urls": n_urls}}))
+    log("Report export", 'sitemap_monitor_bytes_downloaded{job="sitemap_monitor",domain="m.test"}' in text
+        and 'stage="parse"' in text, f"{len(text.splitlines())} lines")
+
+# =============================================================================
+# 18. PROFILING (3 tests)
+# =============================================================================
+
+def test_profiling():
+    print("\n[18] PROFILING")
+
+    import os
+    import pstats
+    import tempfile
+    import threading
+    import tracemalloc
+
+    try:
+        from src.profiling import domain_profile, profiling_settings
+    except Exception as e:
+        log("Profiling import", False, str(e))
+        return
+
+    def work(n):
+        return sorted(str(i) for i in range(n))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # 18.1 Off: no settings, no files, no tracing
+        settings = profiling_settings(False, False, tmp)
+        with domain_profile("off.test", settings):
+            work(1000)
+        log("Profiling off", settings is None and not os.listdir(tmp) and not tracemalloc.is_tracing())
+
+        # 18.2 Thread pool: one CPU profile per domain, shared tracemalloc flagged
+        settings = profiling_settings(True, True, tmp, top=5)
+        barrier = threading.Barrier(2)
+
+        def run(domain):
+            with domain_profile(domain, settings):
+                barrier.wait()
+                work(20000)
+
+        threads = [threading.Thread(target=run, args=(d,)) for d in ("a.test", "b.test")]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        stats = pstats.Stats(os.path.join(tmp, "a.test.pstats"))
+        profiled = any(func[2] == "work" for func in stats.stats)
+        log("Per-thread CPU profiles", profiled and os.path.exists(os.path.join(tmp, "b.test.cpu.txt")),
+            f"{len(stats.stats)} functions")
+
+        # 18.3 Memory report written, tracemalloc stopped after the last domain
+        with open(os.path.join(tmp, "b.test.memory.txt")) as f:
+            report = f.read()
+        log("Memory report", "Peak traced memory" in report and "NOTE: other domains" in report
+            and not tracemalloc.is_tracing(), report.splitlines()[2])
+
+# =============================================================================
+# 19. SCHEDULER (5 tests)
+# =============================================================================
+
+def test_scheduler():
+    print("\n[19] SCHEDULER")
+
+    import glob
+    import os
+    import tempfile
+
+    try:
+        from src.data_processor import DataProcessor
+        from src.main import process_domain
+        from src.scheduler import SitemapSchedule
+        from src.sitemap_fetcher import SitemapFetcher
+        from tests.sitemap_server import SitemapServer
+    except Exception as e:
+        log("Scheduler import", False, str(e))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # 19.1 Changed content halves the interval, unchanged grows it, both clamped
+        settings = {"min_interval_minutes": 60, "max_interval_minutes": 240, "initial_interval_minutes": 120,
+                    "speedup": 0.5, "backoff": 1.5}
+        sched = SitemapSchedule("x.test", os.path.join(tmp, "x.json"), settings)
+        sched.record_fetch("u", "h1", now=0)
+        sched.record_fetch("u", "h2", now=10)
+        sched.record_fetch("u", "h3", now=20)
+        hot = sched.interval("u")
+        for t in range(30, 100, 10):
+            sched.record_fetch("u", "h3", now=t)
+        log("Adaptive interval", hot == 3600 and sched.interval("u") == 240 * 60,
+            f"hot {hot / 3600:.1f}h, static {sched.interval('u') / 3600:.1f}h")
+
+        # 19.2 Only the changed child is parsed; the rest are carried forward
+        with SitemapServer({"s.test": 500}, urls_per_child=100, hot_children=1) as server:
+            target = {"domain": "s.test", "sitemap_url": server.sitemap_url("s.test")}
+            dp = DataProcessor(data_dir=tmp)
+            fetcher = SitemapFetcher({"download_delay": 0, "stealth_fallback": False})
+            always_due = {**settings, "initial_interval_minutes": 0, "min_interval_minutes": 0}
+            sched = SitemapSchedule("s.test", dp.schedule_path("s.test"), always_due)
+            process_domain(target, {}, dp, {}, fetcher=fetcher, schedule=sched)
+            server.generation = 2
+            _, result = process_domain(target, {}, dp, {}, fetcher=fetcher, schedule=sched)
+            changes = pd.concat(pd.read_csv(f) for f in glob.glob(os.path.join(tmp, "s.test", "*_changes_*.csv")))
+            counts = changes["change_type"].value_counts().to_dict()
+            log("Carry forward", result.get("urls") == 500 and counts == {"discovered": 500, "modified": 5},
+                f"{result.get('urls')} URLs, {counts}")
+
+            # 19.3 Nothing due: no requests, snapshot unchanged
+            for state in sched.sitemaps.values():
+                state["interval_seconds"] = 3600
+            server.reset_stats()
+            _, result = process_domain(target, {}, dp, {}, fetcher=fetcher, schedule=sched)
+            snapshot = pd.read_csv(os.path.join(tmp, "s.test", "s.test_urls.csv"))
+            log("Not due", server.stats()["requests"] == 0 and len(snapshot) == 500 and result.get("urls") == 500,
+                f"{server.stats()['requests']} requests, {len(snapshot)} URLs")
+
+    # 19.4 Daemon: a domain whose crawl fails is backed off, not re-crawled every tick
+    import json
+    import threading
+    import time
+    from src.main import parse_args, run_daemon
+
+    with tempfile.TemporaryDirectory() as tmp, SitemapServer({"a.test": 100}) as server:
+        target = {"domain": "a.test", "sitemap_url": f"{server.base_url}/a.test/sitemap-999.xml",
+                  "user_agent": "SmokeTest/1.0", "download_delay": 0}
+        config_path = os.path.join(tmp, "config.json")
+        with open(config_path, "w") as f:
+            json.dump({"data_directory": tmp, "targets": [target], "stealth_fallback": False,
+                       "scheduler": {"tick_seconds": 0.1}}, f)
+        stop = threading.Event()
+        daemon = threading.Thread(target=run_daemon, args=(parse_args(["--daemon", "--config", config_path]), stop))
+        daemon.start()
+        time.sleep(1.5)
+        stop.set()
+        daemon.join(10)
+        log("Failed crawl backs off", server.stats()["requests"] == 1, str(server.stats()))
+
+    # 19.5 Daemon: a warm fetcher whose bot robots.txt now blocks is rebuilt with another user agent
+    from datetime import datetime, timezone
+    from src.main import _daemon_fetcher, get_robots_checker
+    from src.robots_checker import robot_names_for_ua
+
+    with tempfile.TemporaryDirectory() as tmp:
+        host = "127.0.0.1:9"
+        config = {"robots_cache_path": os.path.join(tmp, "robots_cache.json"),
+                  "targets": [{"domain": "rb.test", "sitemap_url": f"http://{host}/sitemap.xml"}]}
+        checker = get_robots_checker(config["robots_cache_path"])
+
+        def serve_robots(content):
+            checker.cache["domains"][host] = {"content": content, "status_code": 200,
+                                              "fetched_at": datetime.now(timezone.utc).isoformat()}
+
+        serve_robots("User-agent: *\nAllow: /\n")
+        fetchers = {}
+        first = _daemon_fetcher(fetchers, config["targets"][0], config)
+        kept = _daemon_fetcher(fetchers, config["targets"][0], config) is first
+        serve_robots("".join(f"User-agent: {name}\nDisallow: /\n" for name in robot_names_for_ua(first.user_agent)))
+        second = _daemon_fetcher(fetchers, config["targets"][0], config)
+        log("Robots re-checked", kept and second is not first and second.user_agent != first.user_agent
+            and fetchers["rb.test"] is second, second.user_agent[:40])
+
+# =============================================================================
+# 20. CHANGE MODEL (3 tests)
+# =============================================================================
+
+def test_change_model():
+    print("\n[20] CHANGE MODEL")
+
+    import os
+    import tempfile
+
+    try:
+        from src.data_processor import DataProcessor
+        from src.main import process_domain
+        from src.scheduler import SitemapSchedule
+        from src.sitemap_fetcher import SitemapFetcher
+        from tests.sitemap_server import SitemapServer
+    except Exception as e:
+        log("Change model import", False, str(e))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # 20.1 A file that changed on most fetches outranks a static one
+        day = 86400
+        sched = SitemapSchedule("x.test", os.path.join(tmp, "x.json"), use_intervals=False)
+        for t in range(5):
+            sched.record_fetch("hot", f"h{t}", now=t * day)
+            sched.record_fetch("cold", "same", now=t * day)
+        p_hot = sched.change_probability("hot", now=5 * day)
+        p_cold = sched.change_probability("cold", now=5 * day)
+        p_lastmod = sched.change_probability("cold", now=5 * day, declared_lastmod="2100-01-01")
+        log("Change estimator", p_hot > 0.8 and p_cold < 0.3 and p_lastmod == 1.0,
+            f"hot {p_hot:.2f}, cold {p_cold:.2f}, newer lastmod {p_lastmod:.2f}")
+
+        # 20.2 Under a fetch budget only the most likely changed child is fetched
+        with SitemapServer({"b.test": 500}, urls_per_child=100, hot_children=1) as server:
+            target = {"domain": "b.test", "sitemap_url": server.sitemap_url("b.test")}
+            dp = DataProcessor(data_dir=tmp)
+            fetcher = SitemapFetcher({"download_delay": 0, "stealth_fallback": False})
+            for generation in (1, 2, 3):
+                server.generation = generation
+                process_domain(target, {}, dp, {}, fetcher=fetcher)
+            server.generation = 4
+            server.reset_stats()
+            budget = {"scheduler": {"fetch_budget": 2}}
+            _, result = process_domain(target, budget, dp, {}, fetcher=fetcher)
+            snapshot = pd.read_csv(os.path.join(tmp, "b.test", "b.test_urls.csv"))
+            history = pd.read_csv(os.path.join(tmp, "b.test", "b.test_sitemap_history.csv"))
+            last = history[history["fetched_at"] == history["fetched_at"].max()]
+            log("Fetch budget", server.stats()["requests"] == 2 and len(snapshot) == 500
+                and result.get("urls") == 500,
+                f"{server.stats()['requests']} requests, {len(snapshot)} URLs")
+            log("Sitemap history", len(history) == 3 * 6 + 2 and "sitemap-0.xml" in " ".join(history["sitemap_url"].tail(2)),
+                f"{len(history)} fetch rows")
+
+# =============================================================================
+# 21. W3C DATETIME (3 tests)
+# =============================================================================
+
+def test_w3c_datetime():
+    print("\n[21] W3C DATETIME")
+
+    try:
+        from src.w3c_datetime import cache_info, parse_w3c_datetime, to_epoch_seconds
+    except Exception as e:
+        log("W3C datetime import", False, str(e))
+        return
+
+    # 21.1 Every W3C precision and offset agrees with pandas
+    values = ["2025", "2025-01", "2025-01-02", "2025-01-02T10:00Z", "2025-01-02T10:00:30+01:00",
+              "2025-01-02T10:00:30.5-05:30", "2025-01-02 10:00:30", "Thu, 02 Jan 2025 10:00:00 GMT"]
+    expected = [int(pd.Timestamp(v).tz_localize("UTC").timestamp()) if pd.Timestamp(v).tzinfo is None
+                else int(pd.Timestamp(v).timestamp()) for v in values]
+    parsed = [parse_w3c_datetime(v) for v in values]
+    invalid = [parse_w3c_datetime(v) for v in ("2025-13-01", "soon", "", None)]
+    log("W3C formats", parsed == expected and invalid == [None] * 4,
+        f"{sum(p == e for p, e in zip(parsed, expected))}/{len(values)} match")
+
+    # 21.2 A column is parsed once per distinct value
+    before = cache_info()["misses"]
+    column = pd.Series(["2030-06-01", "2030-06-02", None] * 1000)
+    epochs = to_epoch_seconds(column)
+    log("Cached column", str(epochs.dtype) == "Int64" and epochs.isna().sum() == 1000
+        and cache_info()["misses"] - before == 2, f"{cache_info()['misses'] - before} parses for 3000 values")
+
+    # 21.3 Counters stay exact when parsed from several threads
+    from concurrent.futures import ThreadPoolExecutor
+    start = cache_info()
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(lambda _: [parse_w3c_datetime(v) for v in values], range(400)))
+    end = cache_info()
+    counted = (end["hits"] - start["hits"]) + (end["misses"] - start["misses"])
+    log("Thread-safe counts", counted == 400 * len(values), f"{counted}/{400 * len(values)} lookups counted")
+
+# =============================================================================
+# 22. ROBOTS PREFETCH (3 tests)
+# =============================================================================
+
+def test_robots_prefetch():
+    print("\n[22] ROBOTS PREFETCH")
+
+    import os
+    import threading
+    import time
+
+    try:
+        from src import robots_checker as rc
+        from src.main import robots_host
+    except Exception as e:
+        log("Robots import", False, str(e))
+        return
+
+    # 22.1 robots.txt comes from the sitemap's host
+    config = {"targets": [
+        {"domain": "a.test", "sitemap_url": "https://news.a.test/sitemap.xml"},
+        {"domain": "b.test", "sitemap_urls": []},
+        {"domain": "c.test", "sitemap_url": "https://c.test/s.xml", "user_agent": "Fixed/1.0"},
+    ]}
+    hosts = [robots_host(config, d) for d in ("a.test", "b.test", "c.test")]
+    log("Robots host", hosts == ["news.a.test", "www.b.test", None], str(hosts))
+
+    # 22.2 Cold cache: hosts fetched concurrently, then served from memory
+    calls = []
+    lock = threading.Lock()
+
+    class FakeResponse:
+        def __init__(self, status_code, text=""):
+            self.status_code, self.text = status_code, text
+
+    def fake_get(url, timeout=None, headers=None):
+        with lock:
+            calls.append(url)
+        time.sleep(0.2)
+        if "down" in url:
+            raise TimeoutError("timed out")
+        if "missing" in url:
+            return FakeResponse(404)
+        return FakeResponse(200, "User-agent: GPTBot\nDisallow: /\n")
+
+    real_get = rc.requests.get
+    rc.requests.get = fake_get
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            checker = rc.RobotsChecker(cache_path=os.path.join(tmp, "robots_cache.json"))
+            hosts = [f"h{i}.test" for i in range(20)] + ["missing.test", "down.test"]
+            start = time.perf_counter()
+            fetched = checker.prefetch(hosts, timeout=1)
+            seconds = time.perf_counter() - start
+            log("Concurrent prefetch", fetched == 22 and seconds < 2 and os.path.exists(checker.cache_path),
+                f"{fetched} hosts in {seconds:.2f}s")
+
+            # 22.3 Workers never hit the network after prefetch (incl. 404 and failed hosts)
+            before = len(calls)
+            uas = ["Mozilla/5.0 (compatible; GPTBot/1.0)", "Mozilla/5.0 (compatible; bingbot/2.0)"]
+            allowed = [len(checker.filter_allowed_bots(h, uas)) for h in ("h3.test", "missing.test", "down.test")]
+            log("No worker I/O", len(calls) == before and allowed == [1, 2, 2], f"allowed {allowed}")
+    finally:
+        rc.requests.get = real_get
+
+# =============================================================================
+# 23. ROBOTS MATCHER (2 tests)
+# =============================================================================
+
+def test_robots_matcher():
+    print("\n[23] ROBOTS MATCHER")
+
+    import os
+
+    try:
+        from src.robots_checker import RobotsChecker, robot_names_for_ua
+    except Exception as e:
+        log("Robots matcher import", False, str(e))
+        return
+
+    gpt = "Mozilla/5.0 (compatible; GPTBot/1.2)"
+    claude = "Mozilla/5.0 (compatible; ClaudeBot/1.0)"
+    bing = "Mozilla/5.0 (compatible; bingbot/2.0)"
+    with tempfile.TemporaryDirectory() as tmp:
+        checker = RobotsChecker(cache_path=os.path.join(tmp, "robots_cache.json"))
+        entry = {"fetched_at": "2100-01-01T00:00:00+00:00", "status_code": 200}
+        checker.cache["domains"]["x.test"] = {
+            **entry, "content": "User-agent: GPTBot\nUser-agent: anthropic-ai\nDisallow: / # all\n\n"
+                                "User-agent: *\nDisallow: /private\n",
+        }
+
+        # 23.1 Grouped User-agent lines share the Disallow; alias names match
+        allowed = checker.filter_allowed_bots("x.test", [gpt, claude, bing])
+        log("Grouped agents", allowed == [bing] and "anthropic-ai" in robot_names_for_ua(claude),
+            f"{len(allowed)}/3 allowed")
+
+        # 23.2 Memoized per robots hash; new content is re-parsed
+        memo_hit = checker.filter_allowed_bots("x.test", [gpt, claude, bing]) == [bing]
+        checker.cache["domains"]["x.test"] = {**entry, "content": "User-agent: CCBot\nDisallow: /\n"}
+        refreshed = checker.filter_allowed_bots("x.test", [gpt, claude, bing])
+        log("Memo per robots hash", memo_hit and refreshed == [gpt, claude, bing] and len(checker._allowed) == 1,
+            f"{len(checker._allowed)} memo entries")
+
+# =============================================================================
+# 24. ROBOTS HISTORY (2 tests)
+# =============================================================================
+
+def test_robots_history():
+    print("\n[24] ROBOTS HISTORY")
+
+    import glob
+    import os
+
+    try:
+        from src import robots_checker as rc
+    except Exception as e:
+        log("Robots history import", False, str(e))
+        return
+
+    bodies = [
+        "User-agent: *\nDisallow: /tmp\nCrawl-delay: 5\n",
+        "User-agent: *\nDisallow: /tmp\nCrawl-delay: 5\n",
+        "User-agent: *\nDisallow: /tmp\nCrawl-delay: 10\n\nUser-agent: GPTBot\nDisallow: /\nSitemap: https://h.test/s.xml\n",
+    ]
+
+    class FakeResponse:
+        status_code = 200
+
+        def __init__(self, text):
+            self.text = text
+
+    real_get = rc.requests.get
+    rc.requests.get = lambda url, timeout=None, headers=None: FakeResponse(bodies.pop(0))
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            checker = rc.RobotsChecker(cache_path=os.path.join(tmp, "robots_cache.json"))
+            for _ in range(3):
+                checker.cache["domains"].pop("h.test", None)  # expire: force a refetch
+                checker.fetch_robots_txt("h.test")
+
+            # 24.1 Same body twice: one blob, one timeline row
+            timeline = checker.history.timeline("h.test")
+            blobs = glob.glob(os.path.join(tmp, "_robots", "blobs", "*.txt"))
+            log("Content addressed", len(timeline) == 2 and len(blobs) == 2,
+                f"{len(timeline)} timeline rows, {len(blobs)} blobs")
+
+            # 24.2 Diff from parsed rules
+            changes = {(c["agent"], c["directive"], c["change"]) for c in checker.history.diff("h.test")}
+            expected = {("*", "crawl-delay", "changed"), ("GPTBot", "disallow", "added"), ("", "sitemap", "added")}
+            log("Structural diff", changes == expected, str(sorted(changes)))
+    finally:
+        rc.requests.get = real_get
+
+# =============================================================================
+# 25. SITEMAP DISCOVERY (3 tests)
+# =============================================================================
+
+def test_sitemap_discovery():
+    print("\n[25] SITEMAP DISCOVERY")
+
+    import os
+
+    try:
+        from src import robots_checker as rc
+        from src import sitemap_discovery as sd
+        from src.sitemap_fetcher import SitemapFetcher
+        from tests.sitemap_server import SitemapServer
+    except Exception as e:
+        log("Sitemap discovery import", False, str(e))
+        return
+
+    fetcher = SitemapFetcher({"max_retries": 0, "download_delay": 0, "stealth_fallback": False, "timeout": 5})
+    with SitemapServer({"d.test": 250}, urls_per_child=100) as server:
+        index = server.sitemap_url("d.test")
+        child = f"{server.base_url}/d.test/sitemap-1.xml"
+        missing = f"{server.base_url}/d.test/nope/sitemap.xml"
+
+        # 25.1 A child also listed on its own is covered by the index: one root
+        probed = sd.probe_sitemaps([child, index, missing], fetcher, max_workers=4)
+        roots = sd.covering_roots(probed)
+        log("Covering roots", sorted(probed) == sorted([child, index]) and roots == [index],
+            f"probed={len(probed)}, roots={roots}")
+
+        # 25.2 Domain-only target: roots from robots.txt Sitemap lines, saved and reused
+        class FakeResponse:
+            def __init__(self, status_code, text=""):
+                self.status_code, self.text = status_code, text
+
+        robots = {"https://www.d.test/robots.txt": FakeResponse(200, f"User-agent: *\nSitemap: {index}\n")}
+        real_get, real_paths = rc.requests.get, sd.COMMON_SITEMAP_PATHS
+        rc.requests.get = lambda url, timeout=None, headers=None: robots.get(url, FakeResponse(404))
+        sd.COMMON_SITEMAP_PATHS = []  # no network probes
+        try:
+            with tempfile.TemporaryDirectory() as tmp:
+                checker = rc.RobotsChecker(cache_path=os.path.join(tmp, "robots_cache.json"), history=False)
+                config = {"data_directory": tmp}
+                sd._memo.clear()
+                resolved = sd.resolve_target_sitemaps({"domain": "d.test"}, config, checker, fetcher)
+                saved = os.path.exists(sd.discovery_path(tmp, "d.test"))
+                sd._memo.clear()
+                server.reset_stats()
+                again = sd.resolve_target_sitemaps({"domain": "d.test"}, config, checker, fetcher)
+                log("Discovered target", resolved.get("sitemap_urls") == [index] and saved
+                    and again == resolved and server.stats()["requests"] == 0,
+                    f"sitemap_urls={resolved.get('sitemap_urls')}, saved={saved}")
+
+            # 25.3 A domain-only config passes validation and is resolved by the run
+            with tempfile.TemporaryDirectory() as tmp:
+                from src.config import load_config
+                from src.main import resolve_discovered_targets
+                config_path = os.path.join(tmp, "config.json")
+                with open(config_path, "w") as f:
+                    json.dump({"data_directory": tmp, "robots_cache_path": os.path.join(tmp, "robots_cache.json"),
+                               "targets": [{"domain": "d.test"}]}, f)
+                config = load_config(config_path)
+                sd._memo.clear()
+                targets = resolve_discovered_targets(config, config["targets"]) if config else []
+                log("Domain-only config", config is not None and [t.get("sitemap_urls") for t in targets] == [[index]],
+                    f"loaded={config is not None}, targets={targets}")
+        finally:
+            rc.requests.get, sd.COMMON_SITEMAP_PATHS = real_get, real_paths
+            sd._memo.clear()
+
+# =============================================================================
+# 26. BYTES FETCH (2 tests)
+# =============================================================================
+
+def test_bytes_fetch():
+    print("\n[26] BYTES FETCH")
+
+    try:
+        from src.sitemap_fetcher import SitemapFetcher, decode_xml
+        from src.sitemap_parser import SitemapParser
+        from tests.sitemap_server import SitemapServer
+    except Exception as e:
+        log("Bytes fetch import", False, str(e))
+        return
+
+    # 26.1 Raw body reaches the parser unchanged (UTF-8, no charset header)
+    with SitemapServer({"b.test": 100}, urls_per_child=100, image_titles=True) as server:
+        fetcher = SitemapFetcher({"download_delay": 0, "stealth_fallback": False})
+        content = fetcher.fetch_sitemap_bytes(f"{server.base_url}/b.test/sitemap-0.xml")
+        expected = server.render_urlset("b.test", 0)
+    n_urls = sum(len(b) for b in SitemapParser().iter_sitemap(content, "b.test")["batches"] or [])
+    log("Raw bytes", isinstance(content, bytes) and content == expected and n_urls == 100,
+        f"{type(content).__name__}, {n_urls} URLs")
+
+    # 26.2 The XML declaration decides the encoding
+    latin1 = (
+        '<?xml version="1.0" encoding="ISO-8859-1"?>'
+        '<urlset xmlns="http://www.sitemaps.org/schemas/sitemap/0.9">'
+        '<url><loc>https://b.test/caf\u00e9</loc></url></urlset>'
+    ).encode("latin-1")
+    batches = SitemapParser().iter_sitemap(latin1, "b.test")["batches"]
+    loc = next(batches)["loc"].iloc[0]
+    log("Declared encoding", loc == "https://b.test/caf\u00e9" and "caf\u00e9" in decode_xml(latin1), loc)
+
+# =============================================================================
+# 27. SPOOLED DOWNLOAD (4 tests)
+# =============================================================================
+
+def test_spooled_download():
+    print("\n[27] SPOOLED DOWNLOAD")
+
+    import gzip
+    import hashlib
+    import os
+
+    try:
+        from src.data_processor import DataProcessor
+        from src.main import process_domain
+        from src.metrics import domain_context, run_metrics
+        from src.sitemap_fetcher import SitemapFetcher
+        from src.sitemap_parser import SitemapParser
+        from tests.sitemap_server import SitemapServer
+    except Exception as e:
+        log("Spooled download import", False, str(e))
+        return
+
+    with SitemapServer({"sp.test": 250}, urls_per_child=100, gzip_children=True) as server:
+        child = f"{server.base_url}/sp.test/sitemap-0.xml.gz"
+        expected = server.render_urlset("sp.test", 0)
+
+        # 27.1 Over the spool threshold: on disk, hashed while streamed, parsed from the file
+        fetcher = SitemapFetcher({"download_delay": 0, "stealth_fallback": False,
+                                  "limits": {"spool_threshold_mb": 0.001}})
+        with fetcher.fetch_sitemap_body(child) as body:
+            n_urls = sum(len(b) for b in SitemapParser().iter_sitemap(body.file, child)["batches"])
+            on_disk, digest = body.on_disk, body.sha256
+        log("Spooled to disk", on_disk and digest == hashlib.sha256(expected).hexdigest() and n_urls == 100,
+            f"on_disk={on_disk}, {n_urls} URLs")
+
+        # 27.2 Over max_sitemap_mb (uncompressed): dropped, recorded
+        run_metrics.reset()
+        small = SitemapFetcher({"download_delay": 0, "stealth_fallback": False,
+                                "limits": {"max_sitemap_mb": len(expected) / 2 / 1024 / 1024}})
+        with domain_context("sp.test"):
+            body = small.fetch_sitemap_body(child)
+        record = run_metrics.snapshot("sp.test")["sitemaps"].get(child, {})
+        log("Size guard", body is None and record.get("error") == "too_large"
+            and len(gzip.compress(expected)) < len(expected) / 2, str(record))
+
+        # 27.3 Domain URL cap: aborted with an error, nothing written
+        with tempfile.TemporaryDirectory() as tmp:
+            target = {"domain": "sp.test", "sitemap_url": server.sitemap_url("sp.test"),
+                      "limits": {"max_domain_urls": 150}}
+            dp = DataProcessor(data_dir=tmp)
+            _, result = process_domain(target, {}, dp, {}, fetcher=fetcher)
+            written = os.path.exists(os.path.join(tmp, "sp.test", "sp.test_urls.csv"))
+            log("Domain limit", result["status"] == "error" and "max_domain_urls" in result["message"]
+                and not written, result.get("message", ""))
+
+        # 27.4 Stealth (in-memory) bodies get the same cap; a gzip bomb is not inflated past it
+        bomb = gzip.compress(b" " * (50 * len(expected)))
+        with domain_context("sp.test"):
+            dropped = small._body_from_bytes(child, bomb)
+            kept = fetcher._body_from_bytes(child, gzip.compress(expected))
+        log("Stealth size guard", dropped is None and kept is not None and kept.sha256 == hashlib.sha256(expected).hexdigest(),
+            f"bomb {len(bomb):,} bytes compressed")
+        kept.close()
+
+# =============================================================================
+# 28. RANGE RESUME (2 tests)
+# =============================================================================
+
+def test_range_resume():
+    print("\n[28] RANGE RESUME")
+
+    try:
+        from src.metrics import domain_context, run_metrics
+        from src.sitemap_fetcher import SitemapFetcher
+        from tests.sitemap_server import SitemapServer
+    except Exception as e:
+        log("Range resume import", False, str(e))
+        return
+
+    def fetch(ranges: bool, seed: int):
+        run_metrics.reset()
+        faults = {"truncate_rate": 0.5}
+        with SitemapServer({"r.test": 3000}, urls_per_child=3000, sitemap_faults=faults, seed=seed,
+                           ranges=ranges) as server:
+            fetcher = SitemapFetcher({"download_delay": 0, "stealth_fallback": False})
+            with domain_context("r.test"):
+                content = fetcher.fetch_sitemap_bytes(f"{server.base_url}/r.test/sitemap-0.xml")
+            expected = server.render_urlset("r.test", 0)
+        return content == expected, len(expected), run_metrics.snapshot("r.test")["counters"]
+
+    # 28.1 Cut off halfway: the rest comes from a Range request, no byte twice
+    intact, size, counters = fetch(ranges=True, seed=0)
+    log("Resumed", intact and counters.get("resumes") == 1 and counters.get("bytes_downloaded") == size,
+        f"{counters.get('bytes_downloaded', 0):,} of {size:,} bytes downloaded, {counters}")
+
+    # 28.2 Server without range support: full refetch
+    intact, size, counters = fetch(ranges=False, seed=2)
+    log("Full refetch fallback", intact and counters.get("restarts") == 1 and not counters.get("resumes")
+        and counters.get("bytes_downloaded", 0) > size, str(counters))
+
+# =============================================================================
+# 29. RETRY QUEUE (3 tests)
+# =============================================================================
+
+def test_retry_queue():
+    print("\n[29] RETRY QUEUE")
+
+    import random
+    import threading
+
+    try:
+        from src.data_processor import DataProcessor
+        from src.main import WorkerSlots, process_domain
+        from src.metrics import run_metrics
+        from src.retry import RetryableFetchError, RetryQueue, backoff_delay, parse_retry_after
+        from tests.sitemap_server import SitemapServer
+    except Exception as e:
+        log("Retry queue import", False, str(e))
+        return
+
+    # 29.1 Full jitter under the cap, Retry-After as a floor, budgets respected
+    rng = random.Random(0)
+    delays = [backoff_delay(3, 1, 60, rng=rng) for _ in range(200)]
+    capped = max(backoff_delay(20, 1, 60, rng=rng) for _ in range(200))
+    queue = RetryQueue(max_attempts=2, base_seconds=0, domain_budget=None)
+    error = RetryableFetchError("https://x.test/a.xml", "HTTP 503")
+    scheduled = [queue.schedule(error, now=0) for _ in range(3)]
+    log("Backoff", 0 <= min(delays) and max(delays) <= 8 and capped <= 60
+        and backoff_delay(0, 1, 60, retry_after=parse_retry_after("5")) == 5
+        and scheduled == [0, 0, None] and queue.pop_due(now=0) == [error.url] * 2,
+        f"attempt 3 in [{min(delays):.2f}, {max(delays):.2f}], cap {capped:.1f}")
+
+    # 29.2 429s are queued and walked again later; the crawl still sees every URL
+    run_metrics.reset()
+    config = {"max_retries": 6, "retry": {"base_seconds": 0.01, "max_seconds": 0.05}}
+    with SitemapServer({"rq.test": 1000}, urls_per_child=100, seed=1,
+                       sitemap_faults={"rate_limited_rate": 0.3}) as server:
+        with tempfile.TemporaryDirectory() as tmp:
+            # A user agent override skips robots.txt (no lookups outside the test server)
+            target = {"domain": "rq.test", "sitemap_url": server.sitemap_url("rq.test"), "user_agent": "SmokeTest/1.0",
+                      "download_delay": 0}
+            _, result = process_domain(target, {**config, "targets": [target]}, DataProcessor(data_dir=tmp), {})
+    counters = run_metrics.snapshot("rq.test")["counters"]
+    log("Retried via queue", result.get("urls") == 1000 and counters.get("retries", 0) > 0,
+        f"{result.get('urls')} URLs, {counters.get('retries', 0)} retries")
+
+    # 29.3 A domain waiting on retries gives its slot to another
+    slots = WorkerSlots(1)
+    waiting, other_ran = threading.Event(), threading.Event()
+
+    def waiter():
+        with slots, slots.released():
+            waiting.set()
+            other_ran.wait(5)
+
+    def other():
+        waiting.wait(5)
+        with slots:
+            other_ran.set()
+
+    threads = [threading.Thread(target=waiter), threading.Thread(target=other)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join(10)
+    log("Slot released while waiting", other_ran.is_set(), "")
+
+# =============================================================================
+# 30. DELAYED STARTS (2 tests)
+# =============================================================================
+
+def test_delayed_starts():
+    print("\n[30] DELAYED STARTS")
+
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+
+    try:
+        from src.main import StartQueue
+    except Exception as e:
+        log("Delayed starts import", False, str(e))
+        return
+
+    # 30.1 Ordered by start time; nothing is handed out early
+    starts = StartQueue([(30, {"domain": "late"}), (0, {"domain": "now"}), (10, {"domain": "soon"})], started=0)
+    first, middle = starts.pop_ready(now=5), starts.pop_ready(now=20)
+    log("Start order", [t["domain"] for t in first] == ["now"] and [t["domain"] for t in middle] == ["soon"]
+        and len(starts) == 1 and starts.seconds_until_next(now=20) == 10, "")
+
+    # 30.2 Two workers, two jittered + two ready domains: ready ones run first,
+    # the run takes max(jitter) + work instead of jitter + work + work
+    delays = [(1.0, {"domain": "j1"}), (1.0, {"domain": "j2"}), (0, {"domain": "r1"}), (0, {"domain": "r2"})]
+    finished = []
+
+    def work(target):
+        time.sleep(0.3)
+        finished.append(target["domain"])
+
+    started = time.monotonic()
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        for target in StartQueue(delays):
+            executor.submit(work, target)
+    elapsed = time.monotonic() - started
+    log("Workers never sleep on jitter", sorted(finished[:2]) == ["r1", "r2"] and elapsed < 1.5,
+        f"{elapsed:.2f}s (sleeping in workers: ~1.6s), order {finished}")
+
+# =============================================================================
+# 31. RUN PLANNER (4 tests)
+# =============================================================================
+
+def test_run_planner():
+    print("\n[31] RUN PLANNER")
+
+    import contextlib
+    import io
+    import json
+    import os
+
+    try:
+        from src.main import StartQueue, main, parse_args, start_offsets
+        from src.planner import estimate_domains, load_history, plan_domains, record_runs
+    except Exception as e:
+        log("Run planner import", False, str(e))
+        return
+
+    def run(tmp, seconds_by_domain, status="success"):
+        report = {"domains": {d: {"seconds": s, "urls": 100, "counters": {"http_requests": 3}, "sitemaps": [{}]}
+                              for d, s in seconds_by_domain.items()}}
+        record_runs(tmp, report, {d: {"status": status} for d in seconds_by_domain}, history_runs=4)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # 31.1 Median of recent successful runs; unknown domains count as the longest
+        for seconds in (10, 12, 50, 11):
+            run(tmp, {"a.test": seconds})
+        run(tmp, {"a.test": 999}, status="error")
+        run(tmp, {"b.test": 4})
+        estimates = {e["domain"]: e for e in estimate_domains(tmp, [{"domain": d} for d in ("a.test", "b.test", "new.test")])}
+        log("History estimate", len(load_history(tmp, "a.test")) == 4 and estimates["a.test"]["seconds"] == 12
+            and estimates["a.test"]["requests"] == 3 and estimates["new.test"]["seconds"] == 12
+            and estimates["new.test"]["runs"] == 0, str({d: e["seconds"] for d, e in estimates.items()}))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # 31.2 The big domain goes first: makespan 6 instead of 8 on two workers
+        run(tmp, {"s1.test": 1, "s2.test": 1, "s3.test": 1, "s4.test": 1, "big.test": 6})
+        targets = [{"domain": d} for d in ("s1.test", "s2.test", "s3.test", "s4.test", "big.test")]
+        plan = plan_domains(tmp, targets, workers=2)
+        log("Longest first", plan["estimates"][0]["domain"] == "big.test" and plan["makespan"] == 6
+            and plan["config_order_makespan"] == 8, f"{plan['makespan']}s vs {plan['config_order_makespan']}s")
+
+        # 31.3 --plan prints the table and fetches nothing
+        config_path = os.path.join(tmp, "config.json")
+        with open(config_path, "w") as f:
+            json.dump({"data_directory": tmp, "max_concurrent_domains": 2,
+                       "targets": [{**t, "sitemap_url": "http://127.0.0.1:9/sitemap.xml"} for t in targets]}, f)
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            result = main(parse_args(["--plan", "--config", config_path]))
+        log("Plan dry run", isinstance(result, dict) and result["makespan"] == 6 and "big.test" in out.getvalue()
+            and not os.path.exists(os.path.join(tmp, "big.test", "big.test_urls.csv")),
+            out.getvalue().splitlines()[-1] if out.getvalue() else "no output")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # 31.4 Startup jitter keeps longest-first order and shows up in the plan
+        run(tmp, {"s1.test": 1, "s2.test": 1, "big.test": 6})
+        targets = [{"domain": d} for d in ("s1.test", "s2.test", "big.test")]
+        stealth = {"enabled": True, "max_startup_jitter_seconds": 120}
+        plan = plan_domains(tmp, targets, workers=2, offsets=lambda ts: start_offsets(ts, stealth))
+        ordered = [e["target"] for e in plan["estimates"]]
+        offsets = start_offsets(ordered, stealth)
+        dispatched = [t["domain"] for t in StartQueue(list(zip(offsets, ordered)), started=0).pop_ready(now=1e9)]
+        log("Jitter keeps order", dispatched == [e["domain"] for e in plan["estimates"]]
+            and offsets == sorted(offsets) and plan["estimates"][0]["start"] == offsets[0]
+            and plan["makespan"] >= offsets[0] + 6, f"offsets {offsets}, makespan {plan['makespan']}")
+
+# =============================================================================
+# 32. SITEMAP POOL (4 tests)
+# =============================================================================
+
+def test_sitemap_pool():
+    print("\n[32] SITEMAP POOL")
+
+    import threading
+    import time
+
+    try:
+        from src.data_processor import DataProcessor
+        from src.main import WorkerSlots, build_fetcher, process_domain
+        from src.work_pool import SitemapWorkPool
+        from tests.sitemap_server import SitemapServer
+    except Exception as e:
+        log("Sitemap pool import", False, str(e))
+        return
+
+    # 32.1 Per-host cap: a capped host queues its work without holding threads
+    active, peak, lock = {}, {}, threading.Lock()
+
+    def task(host):
+        with lock:
+            active[host] = active.get(host, 0) + 1
+            peak[host] = max(peak.get(host, 0), active[host])
+        time.sleep(0.2)
+        with lock:
+            active[host] -= 1
+        return host
+
+    started = time.monotonic()
+    with SitemapWorkPool(workers=4, per_host=1) as pool:
+        futures = [pool.submit(host, task, host) for host in ("a", "a", "a", "b", "b", "b")]
+        done = [f.result() for f in futures]
+    elapsed = time.monotonic() - started
+    log("Per-host cap", peak == {"a": 1, "b": 1} and len(done) == 6 and elapsed < 1.0,
+        f"peak {peak}, {elapsed:.2f}s (hosts serialized but side by side)")
+
+    # 32.2 A many-child domain fetches its children on the pool: same crawl, shorter wall time
+    def crawl(pool):
+        with SitemapServer({"pool.test": 480}, urls_per_child=20, seed=0,
+                           sitemap_faults={"latency_ms": 40}) as server:
+            target = {"domain": "pool.test", "sitemap_url": server.sitemap_url("pool.test"), "download_delay": 0,
+                      "user_agent": "SmokeTest/1.0"}
+            config = {"stealth_fallback": False, "targets": [target]}
+            with tempfile.TemporaryDirectory() as tmp:
+                begin = time.monotonic()
+                _, result = process_domain(target, config, DataProcessor(data_dir=tmp), {},
+                                           fetcher=build_fetcher(target, config), pool=pool)
+                return result, time.monotonic() - begin
+
+    serial, serial_seconds = crawl(None)
+    with SitemapWorkPool(workers=8, per_host=4, prefetch=8) as pool:
+        pooled, pooled_seconds = crawl(pool)
+    log("Children on the pool", serial.get("urls") == pooled.get("urls") == 480
+        and pooled_seconds < serial_seconds * 0.7,
+        f"{serial_seconds:.2f}s on the domain thread vs {pooled_seconds:.2f}s pooled")
+
+    # 32.3 Politeness holds across pool threads: request starts stay download_delay apart
+    target = {"domain": "x.test", "download_delay": 0.1, "user_agent": "SmokeTest/1.0"}
+    fetcher = build_fetcher(target, {"targets": [target]})
+    starts = []
+
+    def polite(_):
+        fetcher._apply_politeness_delay()
+        starts.append(time.monotonic())
+
+    with SitemapWorkPool(workers=4, per_host=4) as pool:
+        for f in [pool.submit("x.test", polite, i) for i in range(5)]:
+            f.result()
+    gaps = [b - a for a, b in zip(sorted(starts), sorted(starts)[1:])]
+    log("Politeness across threads", min(gaps) >= 0.09, f"min gap {min(gaps):.3f}s")
+
+    # 32.4 Time spent queueing for a worker slot is not the domain's elapsed time
+    slots = WorkerSlots(1)
+    with SitemapServer({"q.test": 200}, urls_per_child=100) as server:
+        target = {"domain": "q.test", "sitemap_url": server.sitemap_url("q.test"), "download_delay": 0,
+                  "user_agent": "SmokeTest/1.0"}
+        config = {"stealth_fallback": False, "targets": [target]}
+        with tempfile.TemporaryDirectory() as tmp:
+            holder = threading.Timer(0.5, slots.__exit__)
+            slots.__enter__()
+            holder.start()
+            begin = time.monotonic()
+            _, result = process_domain(target, config, DataProcessor(data_dir=tmp), {}, slots=slots)
+            waited = time.monotonic() - begin
+    log("Slot wait not timed", result.get("status") == "success" and waited >= 0.5
+        and result.get("elapsed_seconds", 1) < waited - 0.3,
+        f"elapsed {result.get('elapsed_seconds')}s of {waited:.2f}s")
+
+# =============================================================================
+# 33. WRITE BEHIND (6 tests)
+# =============================================================================
+
+def test_write_behind():
+    print("\n[33] WRITE BEHIND")
+
+    import os
+    import time
+    from glob import glob
+
+    try:
+        from src.data_processor import DataProcessor
+        from src.writer import WriteBehind, atomic_write_csv
+    except Exception as e:
+        log("Write behind import", False, str(e))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        # 33.1 A write that dies halfway leaves the previous file whole
+        path = os.path.join(tmp, "x_urls.csv")
+        atomic_write_csv(pd.DataFrame({"loc": ["https://x.test/a", "https://x.test/b"]}), path)
+
+        class Crashing(pd.DataFrame):
+            def to_csv(self, f, **kwargs):
+                f.write("loc\nhttps://x.te")
+                raise OSError("disk full")
+
+        try:
+            atomic_write_csv(Crashing({"loc": ["https://x.test/c"]}), path)
+        except OSError:
+            pass
+        log("Atomic commit", list(pd.read_csv(path)["loc"]) == ["https://x.test/a", "https://x.test/b"], "")
+
+        # 33.2 Writes return at once; failures are reported per domain on close
+        writer = WriteBehind(queue_size=2)
+        started = time.monotonic()
+        writer.submit("slow.test", time.sleep, 0.3)
+        writer.submit("bad.test", atomic_write_csv, None, os.path.join(tmp, "bad.csv"))
+        queued = time.monotonic() - started
+        errors = writer.close()
+        log("Write-behind queue", queued < 0.2 and list(errors) == ["bad.test"],
+            f"queued in {queued * 1000:.0f} ms, errors {errors}")
+
+    # 33.3 Same output as synchronous writes; a re-run reads the first run's snapshot
+    urls = [{"loc": f"https://example.com/p/{i}", "lastmod": "2025-01-01",
+             "sitemap_source_url": "https://example.com/s.xml"} for i in range(200)]
+    outputs = []
+    for use_writer in (False, True):
+        with tempfile.TemporaryDirectory() as tmp:
+            writer = WriteBehind() if use_writer else None
+            dp = DataProcessor(data_dir=tmp, writer=writer)
+            dp.process_url_batches("example.com", [pd.DataFrame(urls)])
+            dp.process_url_batches("example.com", [pd.DataFrame(urls[:150])])
+            if writer is not None:
+                writer.close()
+            snapshot = pd.read_csv(os.path.join(tmp, "example.com", "example.com_urls.csv"))
+            changes = pd.concat(pd.read_csv(p) for p in glob(os.path.join(tmp, "example.com", "*_changes_*.csv")))
+            outputs.append((len(snapshot), changes["change_type"].value_counts().to_dict()))
+    log("Same output", outputs[0] == outputs[1] and outputs[1][0] == 150, str(outputs[1]))
+
+    # 33.4 Poll state is saved behind the domain's writes, and not at all if one failed
+    class Schedule:
+        def __init__(self):
+            self.calls = []
+
+        def save(self):
+            self.calls.append("save")
+
+        def load(self):
+            self.calls.append("load")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        writer = WriteBehind()
+        dp = DataProcessor(data_dir=tmp, writer=writer)
+        good, bad = Schedule(), Schedule()
+        writer.submit("good.test", time.sleep, 0.1)
+        dp.save_schedule("good.test", good)
+        queued = list(good.calls)
+        writer.submit("bad.test", atomic_write_csv, None, os.path.join(tmp, "bad.csv"))
+        dp.save_schedule("bad.test", bad)
+        writer.close()
+        log("Schedule after writes", queued == [] and good.calls == ["save"] and bad.calls == ["load"],
+            f"good {good.calls}, bad {bad.calls}")
+
+    # 33.5 External diff: snapshot and all-time are committed on the writer, spool removed after
+    outputs = []
+    for use_writer in (False, True):
+        with tempfile.TemporaryDirectory() as tmp:
+            spool_dir = os.path.join(tmp, "spool")
+            os.makedirs(spool_dir)
+            writer = WriteBehind() if use_writer else None
+            dp = DataProcessor(data_dir=tmp, writer=writer,
+                               diff_config={"mode": "external", "partitions": 4, "spool_dir": spool_dir})
+            dp.process_url_batches("example.com", [pd.DataFrame(urls)])
+            dp.process_url_batches("example.com", [pd.DataFrame(urls[:150])])
+            if writer is not None:
+                writer.close()
+            snapshot = pd.read_csv(os.path.join(tmp, "example.com", "example.com_urls.csv"))
+            all_time = pd.read_csv(os.path.join(tmp, "example.com", "example.com_urls_all_time.csv"))
+            leftovers = os.listdir(spool_dir) + glob(os.path.join(tmp, "example.com", "*.tmp"))
+            outputs.append((len(snapshot), int(all_time["is_current_live"].sum()), len(all_time), leftovers))
+    log("External diff behind", outputs[0] == outputs[1] == (150, 150, 200, []), str(outputs))
+
+    # 33.6 Each write is timed once, where it runs (not again at the enqueue)
+    from src.metrics import domain_context, run_metrics
+
+    write_calls = []
+    for use_writer in (False, True):
+        run_metrics.reset()
+        with tempfile.TemporaryDirectory() as tmp, domain_context("example.com"):
+            writer = WriteBehind() if use_writer else None
+            dp = DataProcessor(data_dir=tmp, writer=writer)
+            dp.process_url_batches("example.com", [pd.DataFrame(urls)])
+            if writer is not None:
+                writer.close()
+        write_calls.append(run_metrics.snapshot("example.com")["stages"].get("write", {}).get("calls"))
+    log("Write timed once", write_calls[0] == write_calls[1] and write_calls[0], str(write_calls))
+
 # =============================================================================
 # RUNNER
 # =============================================================================
@@ -346,7 +1717,31 @@ def run_all():
     test_concurrency()
     test_workflows()
     test_schema_consistency()
-    
+    test_external_diff()
+    test_streaming()
+    test_url_classifier()
+    test_change_log_segments()
+    test_process_executor()
+    test_sharding()
+    test_gzip_sitemaps()
+    test_metrics()
+    test_profiling()
+    test_scheduler()
+    test_change_model()
+    test_w3c_datetime()
+    test_robots_prefetch()
+    test_robots_matcher()
+    test_robots_history()
+    test_sitemap_discovery()
+    test_bytes_fetch()
+    test_spooled_download()
+    test_range_resume()
+    test_retry_queue()
+    test_delayed_starts()
+    test_run_planner()
+    test_sitemap_pool()
+    test_write_behind()
+
     passed = sum(1 for r in RESULTS if r["passed"])
     total = len(RESULTS)
     duration = (datetime.now() - start).total_seconds()